@@ -16,15 +16,24 @@ class EmotionType(str, Enum):
 class ChatMessage(BaseModel):
     """Chat message model"""
     text: str
+    role: str = "user"  # "user" or "assistant"
     emotion: Optional[EmotionType] = None
     confidence: Optional[float] = None
     timestamp: Optional[str] = None
 
+class EmotionWindow(BaseModel):
+    """Emotion of one analysis window within an utterance"""
+    start: float  # seconds
+    end: float
+    emotion: EmotionType
+    confidence: float
+
 class EmotionResponse(BaseModel):
     """Emotion recognition response model"""
     emotion: EmotionType
     confidence: float
     features: Optional[dict] = None
+    timeline: Optional[List[EmotionWindow]] = None
 
 class ChatResponse(BaseModel):
     """Chat response model"""
@@ -0,0 +1,486 @@
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import subprocess
+import shutil
+import time
+from collections import deque
+from functools import lru_cache
+from math import gcd
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import soundfile as sf
+from scipy.signal import butter, resample_poly, sosfilt
+
+from app.services.result_cache import ResultCache, audio_fingerprint
+from app.services.vad import Segment, VadConfig, cut_segments, detect_speech, speech_report
+from app.utils.executor import get_execution_layer
+
+try:
+    import av
+    PYAV_AVAILABLE = True
+except ImportError:
+    av = None
+    PYAV_AVAILABLE = False
+
+# Filter chain applied to every utterance before analysis
+AUDIO_FILTER_CHAIN = "highpass=f=200,lowpass=f=3000,volume=1.5"
+HIGHPASS_HZ = 200
+LOWPASS_HZ = 3000
+VOLUME_GAIN = 1.5
+
+AudioPayload = Union[bytes, memoryview]
+
+# Views produced at decode time: Whisper (16 kHz) and emotion analysis (22.05 kHz)
+DEFAULT_VIEW_RATES = (16000, 22050)
+
+@lru_cache(maxsize=8)
+def _filter_sos(sample_rate: int) -> np.ndarray:
+    """Second-order sections matching FFmpeg's default 2-pole highpass/lowpass"""
+    highpass = butter(2, HIGHPASS_HZ, btype="highpass", fs=sample_rate, output="sos")
+    lowpass = butter(2, LOWPASS_HZ, btype="lowpass", fs=sample_rate, output="sos")
+    return np.vstack([highpass, lowpass])
+
+def apply_filter_chain(pcm: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Apply the AUDIO_FILTER_CHAIN equivalent in-process"""
+    filtered = sosfilt(_filter_sos(sample_rate), pcm) * VOLUME_GAIN
+    # Clip like the 16-bit PCM output of the FFmpeg path would
+    return np.clip(filtered, -1.0, 1.0).astype(np.float32)
+
+class StreamingFilter:
+    """apply_filter_chain over consecutive chunks, carrying the filter state across them.
+
+    The filter is causal, so filtering chunk by chunk gives the same samples
+    as filtering the concatenated signal at once.
+    """
+
+    def __init__(self, sample_rate: int):
+        self.sos = _filter_sos(sample_rate)
+        self.state = np.zeros((self.sos.shape[0], 2))
+
+    def process(self, pcm: np.ndarray) -> np.ndarray:
+        filtered, self.state = sosfilt(self.sos, pcm, zi=self.state)
+        return np.clip(filtered * VOLUME_GAIN, -1.0, 1.0).astype(np.float32)
+
+def resample(pcm: np.ndarray, orig_sr: int, target_sr: int) -> np.ndarray:
+    """Polyphase resampling between integer sample rates"""
+    if orig_sr == target_sr:
+        return pcm
+    divisor = gcd(target_sr, orig_sr)
+    return resample_poly(pcm, target_sr // divisor, orig_sr // divisor).astype(np.float32)
+
+class DecodedAudio:
+    """Mono PCM buffer for one utterance, shared by emotion analysis and speech-to-text"""
+
+    def __init__(self, raw: AudioPayload, pcm: Optional[np.ndarray] = None, sample_rate: int = 0,
+                 views: Optional[Dict[int, np.ndarray]] = None, fingerprint: Optional[str] = None):
+        self.raw = raw
+        self.pcm = pcm
+        self.sample_rate = sample_rate
+        self._views: Dict[int, np.ndarray] = dict(views or {})
+        if pcm is not None:
+            self._views[sample_rate] = pcm
+        self._fingerprint = fingerprint
+        # Set when decoding was skipped because the payload's results were cached
+        self.decode_skipped = False
+
+    @property
+    def fingerprint(self) -> str:
+        """Content hash of the raw payload (computed once)"""
+        if self._fingerprint is None:
+            self._fingerprint = audio_fingerprint(self.raw)
+        return self._fingerprint
+
+    @property
+    def ok(self) -> bool:
+        """Whether decoding produced PCM samples"""
+        return self.pcm is not None and len(self.pcm) > 0
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds"""
+        return len(self.pcm) / self.sample_rate if self.ok else 0.0
+
+    def at_rate(self, sample_rate: int) -> np.ndarray:
+        """Get the PCM at the given sample rate, resampling once and caching the view"""
+        if not self.ok:
+            return np.zeros(0, dtype=np.float32)
+
+        view = self._views.get(sample_rate)
+        if view is None:
+            view = resample(self.pcm, self.sample_rate, sample_rate)
+            self._views[sample_rate] = view
+        return view
+
+    def select(self, segments: List[Segment]) -> "DecodedAudio":
+        """The same utterance restricted to the given time segments (in every view)"""
+        views = {rate: cut_segments(view, rate, segments) for rate, view in self._views.items()}
+        return DecodedAudio(self.raw, views[self.sample_rate], self.sample_rate, views, fingerprint=self._fingerprint)
+
+    def to_wav(self, sample_rate: int) -> bytes:
+        """Encode the PCM at the given sample rate as 16-bit WAV"""
+        with io.BytesIO() as buffer:
+            sf.write(buffer, self.at_rate(sample_rate), sample_rate, format="WAV", subtype="PCM_16")
+            return buffer.getvalue()
+
+class PyAVDecoder:
+    """In-memory decoder using the FFmpeg libraries in-process (no temp files, no process spawn)"""
+
+    name = "pyav"
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+
+    def iter_pcm(self, source) -> Iterator[np.ndarray]:
+        """Demux and decode a file-like source, yielding unfiltered mono float32 PCM as it decodes"""
+        with av.open(source, mode="r") as container:
+            stream = container.streams.audio[0]
+            resampler = av.AudioResampler(format="flt", layout="mono", rate=self.sample_rate)
+            for frame in container.decode(stream):
+                for resampled in resampler.resample(frame):
+                    yield resampled.to_ndarray()[0]
+            # Flush samples buffered in the resampler
+            for resampled in resampler.resample(None):
+                yield resampled.to_ndarray()[0]
+
+    def decode(self, audio_data: AudioPayload) -> Optional[Tuple[np.ndarray, int]]:
+        """Decode a payload to filtered mono float32 PCM"""
+        try:
+            chunks = list(self.iter_pcm(io.BytesIO(audio_data)))
+
+            if not chunks:
+                return None
+
+            pcm = apply_filter_chain(np.concatenate(chunks), self.sample_rate)
+            return pcm, self.sample_rate
+
+        except Exception as e:
+            print(f"PyAV decoding failed: {e}")
+            return None
+
+class FFmpegFileDecoder:
+    """Fallback decoder spawning the FFmpeg CLI with temporary files"""
+
+    name = "ffmpeg"
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+
+        # Find FFmpeg path
+        self.ffmpeg_path = shutil.which('ffmpeg') or '/opt/homebrew/bin/ffmpeg'
+        print(f"FFmpegFileDecoder using FFmpeg at: {self.ffmpeg_path}")
+
+    def decode(self, audio_data: AudioPayload) -> Optional[Tuple[np.ndarray, int]]:
+        """Decode a payload to filtered mono float32 PCM"""
+        input_path = output_path = None
+        try:
+            # Create temporary files
+            with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as input_file:
+                input_file.write(audio_data)
+                input_path = input_file.name
+
+            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as output_file:
+                output_path = output_file.name
+
+            cmd = [
+                self.ffmpeg_path, "-y",  # Overwrite output file
+                "-i", input_path,  # Input file
+                "-acodec", "pcm_s16le",  # PCM 16-bit
+                "-ar", str(self.sample_rate),  # Sample rate
+                "-ac", "1",  # Mono
+                "-af", AUDIO_FILTER_CHAIN,  # Audio filters for better quality
+                output_path  # Output file
+            ]
+
+            print(f"Decoding audio with FFmpeg: {' '.join(cmd)}")
+            result = subprocess.run(cmd, capture_output=True, text=True)
+
+            if result.returncode != 0:
+                print(f"FFmpeg decoding failed: {result.stderr}")
+                return None
+
+            pcm, sr = sf.read(output_path, dtype="float32")
+            return pcm, sr
+
+        except Exception as e:
+            print(f"FFmpeg decoding failed: {e}")
+            return None
+        finally:
+            # Clean up temporary files
+            for path in (input_path, output_path):
+                if path and os.path.exists(path):
+                    os.unlink(path)
+
+def decode_payload(decoder, audio_data: AudioPayload,
+                   view_rates: Sequence[int]) -> Optional[Tuple[np.ndarray, int, Dict[int, np.ndarray]]]:
+    """Decode a payload and derive its resampled views (runs in the CPU pool)"""
+    decoded = decoder.decode(audio_data)
+
+    if decoded is None:
+        # Fall back to reading the payload directly (e.g. clients sending WAV)
+        try:
+            decoded = sf.read(io.BytesIO(audio_data), dtype="float32")
+        except Exception as e:
+            print(f"Failed to read audio with soundfile: {e}")
+            return None
+
+    pcm, sr = decoded
+
+    # Ensure audio is mono
+    if pcm.ndim > 1:
+        pcm = pcm.mean(axis=1)
+
+    return pcm, sr, derive_views(pcm, sr, view_rates)
+
+def derive_views(pcm: np.ndarray, sample_rate: int, view_rates: Sequence[int]) -> Dict[int, np.ndarray]:
+    """Resampled views of decoded PCM (runs in the CPU pool)"""
+    return {rate: resample(pcm, sample_rate, rate) for rate in view_rates if rate != sample_rate}
+
+class _ChunkReader:
+    """Blocking file-like object over chunks fed from the event loop, read by a decoder thread"""
+
+    def __init__(self):
+        self._chunks: Deque[bytes] = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def feed(self, chunk: bytes):
+        with self._cond:
+            self._chunks.append(chunk)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def read(self, size: int = -1) -> bytes:
+        with self._cond:
+            while not self._chunks and not self._closed:
+                self._cond.wait()
+            if not self._chunks:
+                return b""  # end of stream
+            if size < 0:
+                data = b"".join(self._chunks)
+                self._chunks.clear()
+                return data
+            chunk = self._chunks.popleft()
+            if len(chunk) > size:
+                self._chunks.appendleft(chunk[size:])
+                chunk = chunk[:size]
+            return chunk
+
+class StreamingDecoder:
+    """Decodes an utterance while its chunks are still arriving.
+
+    With the PyAV backend a decoder thread demuxes, decodes and filters the
+    timesliced WebM/Opus stream as chunks are fed, so at end of utterance only
+    the decoder flush and the resampled views are left to compute. Other
+    backends (or a stream PyAV cannot follow) fall back to decoding the
+    concatenated payload once it is complete. The payload fingerprint is
+    hashed incrementally as well.
+    """
+
+    def __init__(self, audio_service: "AudioService"):
+        self.audio_service = audio_service
+        self.sample_rate = audio_service.sample_rate
+        self.chunks = 0
+        self.tail_ms = 0.0
+        self._buffer = bytearray()
+        self._hash = hashlib.blake2b(digest_size=16)
+        self._pcm: List[np.ndarray] = []
+        self._error: Optional[Exception] = None
+        self._reader: Optional[_ChunkReader] = None
+        self._thread: Optional[threading.Thread] = None
+        self._aborted = False
+
+        if isinstance(audio_service.decoder, PyAVDecoder):
+            self._reader = _ChunkReader()
+            self._thread = threading.Thread(target=self._decode, name="stream-decoder", daemon=True)
+            self._thread.start()
+
+    @property
+    def size(self) -> int:
+        return len(self._buffer)
+
+    def _decode(self):
+        filter_chain = StreamingFilter(self.sample_rate)
+        try:
+            for pcm in self.audio_service.decoder.iter_pcm(self._reader):
+                if self._aborted:
+                    return
+                self._pcm.append(filter_chain.process(pcm))
+        except Exception as e:
+            self._error = e
+
+    def feed(self, chunk: AudioPayload):
+        """Append the next chunk of the utterance (does not block)"""
+        chunk = bytes(chunk)
+        if not chunk:
+            return
+        self.chunks += 1
+        self._buffer += chunk
+        self._hash.update(chunk)
+        if self._reader is not None and self._error is None:
+            self._reader.feed(chunk)
+
+    async def finish(self) -> DecodedAudio:
+        """End of utterance: finish decoding the tail and derive the views"""
+        started = time.perf_counter()
+        raw = bytes(self._buffer)
+        fingerprint = self._hash.hexdigest()
+
+        if self._thread is not None:
+            self._reader.close()
+            await asyncio.to_thread(self._thread.join)
+
+        if self._thread is None or self._error is not None or not self._pcm:
+            if self._error is not None:
+                print(f"Streaming decode failed ({self._error}), decoding the whole utterance")
+            audio = await self.audio_service.decode(raw)
+            audio._fingerprint = fingerprint
+        else:
+            pcm = np.concatenate(self._pcm)
+            views = await self.audio_service.executor.run_cpu(
+                derive_views, pcm, self.sample_rate, self.audio_service.view_rates
+            )
+            audio = DecodedAudio(raw, pcm, self.sample_rate, views, fingerprint=fingerprint)
+
+        self.tail_ms = round((time.perf_counter() - started) * 1000, 1)
+        print(f"Streamed utterance: {len(raw)} bytes in {self.chunks} chunks, "
+              f"{audio.duration:.2f}s of audio, {self.tail_ms} ms after the last chunk")
+        return audio
+
+    def abort(self):
+        """Drop an unfinished utterance (e.g. the connection closed mid-stream)"""
+        self._aborted = True
+        if self._reader is not None:
+            self._reader.close()
+
+    async def wait_closed(self):
+        """Wait for the decoder thread to exit (after finish() or abort())"""
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join)
+
+class AudioService:
+    """Shared decoding stage turning an incoming WebM/Opus blob into mono PCM"""
+
+    def __init__(self, backend: Optional[str] = None, view_rates: Sequence[int] = DEFAULT_VIEW_RATES):
+        # Decode at the Opus native rate; 16 kHz and 22.05 kHz views are derived in-process
+        self.sample_rate = 48000
+        self.view_rates = tuple(view_rates)
+        self.executor = get_execution_layer()
+
+        # Decoder backend: "pyav" (in-memory), "ffmpeg" (subprocess and temp files) or "auto"
+        backend = (backend or os.getenv("AUDIO_DECODER", "auto")).lower()
+        if backend == "auto":
+            backend = "pyav" if PYAV_AVAILABLE else "ffmpeg"
+        if backend == "pyav" and not PYAV_AVAILABLE:
+            print("PyAV not installed, falling back to FFmpeg subprocess decoder")
+            backend = "ffmpeg"
+
+        if backend == "pyav":
+            self.decoder = PyAVDecoder(self.sample_rate)
+        elif backend == "ffmpeg":
+            self.decoder = FFmpegFileDecoder(self.sample_rate)
+        else:
+            raise ValueError(f"Unknown audio decoder backend: {backend}")
+
+        print(f"AudioService using {self.decoder.name} decoder")
+
+        # Emotion / transcript results of recently seen payloads (client retries resend them)
+        self.results = ResultCache()
+
+        # Voice activity detection on the 16 kHz view before analysis and upload
+        self.vad_enabled = os.getenv("VAD_ENABLED", "1").lower() in ("1", "true")
+        self.vad_config = VadConfig()
+        self.vad_rate = 16000
+        self.vad_stats = {"clips": 0, "silent_clips": 0, "input_s": 0.0, "removed_s": 0.0}
+
+    @staticmethod
+    def fingerprint(audio_data: Union[AudioPayload, DecodedAudio]) -> str:
+        """Result cache key of a raw payload or decoded utterance"""
+        if isinstance(audio_data, DecodedAudio):
+            return audio_data.fingerprint
+        return audio_fingerprint(audio_data)
+
+    async def decode(self, audio_data: AudioPayload, unless_cached: Sequence[str] = ()) -> DecodedAudio:
+        """Decode an utterance once into a shared mono PCM buffer.
+
+        If results of every kind in unless_cached are already cached for the
+        payload, decoding is skipped and the returned utterance has no PCM.
+        """
+        fingerprint = None
+        if unless_cached:
+            fingerprint = audio_fingerprint(audio_data)
+            if self.results.covers(fingerprint, unless_cached):
+                self.results.counters["skipped_decodes"] += 1
+                print("Analysis results cached for this audio, skipping decode")
+                audio = DecodedAudio(audio_data, fingerprint=fingerprint)
+                audio.decode_skipped = True
+                return audio
+
+        payload = audio_data
+        if isinstance(payload, memoryview) and self.executor.uses_processes:
+            # memoryview cannot cross the process boundary
+            payload = payload.tobytes()
+
+        decoded = await self.executor.run_cpu(decode_payload, self.decoder, payload, self.view_rates)
+        if decoded is None:
+            return DecodedAudio(audio_data, fingerprint=fingerprint)
+
+        pcm, sr, views = decoded
+        print(f"Decoded audio: {len(pcm)} samples at {sr} Hz")
+        return DecodedAudio(audio_data, pcm, sr, views, fingerprint=fingerprint)
+
+    def open_stream(self) -> StreamingDecoder:
+        """Start decoding an utterance that arrives in chunks"""
+        return StreamingDecoder(self)
+
+    async def ensure_decoded(self, audio_data: Union[AudioPayload, DecodedAudio]) -> DecodedAudio:
+        """Decode a raw payload, or one whose decode was skipped (its cached results expired meanwhile)"""
+        if isinstance(audio_data, DecodedAudio):
+            if not audio_data.decode_skipped:
+                return audio_data
+            return await self.decode(audio_data.raw)
+        return await self.decode(audio_data)
+
+    async def trim_silence(self, audio: DecodedAudio) -> Tuple[DecodedAudio, Optional[dict]]:
+        """Cut leading/trailing silence and long pauses.
+
+        Returns the trimmed utterance and a report of what was removed
+        (report["speech"] is False for a silence-only clip); the report is
+        None when VAD did not run.
+        """
+        if not self.vad_enabled or not audio.ok:
+            return audio, None
+
+        segments = await self.executor.run_cpu(detect_speech, audio.at_rate(self.vad_rate), self.vad_rate, self.vad_config)
+        report = speech_report(audio.duration, segments)
+        report["speech"] = bool(segments)
+
+        self.vad_stats["clips"] += 1
+        self.vad_stats["silent_clips"] += 0 if segments else 1
+        self.vad_stats["input_s"] += report["input_s"]
+        self.vad_stats["removed_s"] += report["removed_s"]
+        print(f"VAD kept {report['speech_s']}s of {report['input_s']}s in {report['segments']} segments")
+
+        if not segments or report["removed_s"] <= 0:
+            return audio, report
+        return audio.select(segments), report
+
+    def get_stats(self) -> dict:
+        """Decoder backend and how much audio VAD has removed"""
+        input_s = self.vad_stats["input_s"]
+        return {
+            "decoder": self.decoder.name,
+            "vad": {
+                "enabled": self.vad_enabled,
+                **{key: round(value, 3) for key, value in self.vad_stats.items()},
+                "removed_ratio": round(self.vad_stats["removed_s"] / input_s, 3) if input_s else 0.0
+            }
+        }
@@ -1,18 +1,45 @@
-import openai
 import os
-from typing import List, Optional
+from typing import AsyncIterator, List
 import json
 from datetime import datetime
 
 from app.models.chat_models import ChatResponse, EmotionType, ChatMessage
+from app.services.openai_client import get_openai_client
+from app.services.session_store import SessionStore
+
+# Session used by callers that do not identify a conversation
+DEFAULT_SESSION = "default"
+
+CONFIDENCE_LEVELS = ("very", "quite", "slightly")
+
+BASE_SYSTEM_PROMPT = """You are an emotionally intelligent AI assistant, specifically designed to provide emotional support and meaningful conversations.
+
+The system note right before the latest user message describes the emotion detected in the user's voice; earlier user messages carry their detected emotion in parentheses.
+
+Please follow these principles:
+1. Adjust your response style and tone based on the user's emotional state
+2. Provide sincere and empathetic responses
+3. Avoid overly formal or mechanical language
+4. Offer emotional support and encouragement when appropriate
+5. Maintain naturalness and coherence in conversation
+6. Respond in English, unless the user uses another language
+
+Remember: Your goal is to be an understanding and supportive friend, not just an information provider."""
 
 class ChatService:
     """Chat service, integrating OpenAI API"""
     
     def __init__(self):
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.conversation_history: List[ChatMessage] = []
-        self.max_history = 10  # Maximum history count
+        self.client = get_openai_client()
+        
+        # Completion settings shared by the blocking and streaming calls
+        self.completion_params = {
+            "model": "gpt-4",
+            "max_tokens": 200,
+            "temperature": 0.7,
+            "presence_penalty": 0.1,
+            "frequency_penalty": 0.1
+        }
         
         # Emotion-adaptive prompt templates
         self.emotion_prompts = {
@@ -25,12 +52,27 @@ class ChatService:
             EmotionType.NEUTRAL: "The user is emotionally calm now. Please respond with a natural and friendly tone, maintaining the flow of conversation.",
             EmotionType.EXCITED: "The user is very excited now. Please respond with an equally excited and enthusiastic tone, sharing this positive emotion."
         }
+        
+        # Prompt layout: [base system prompt][history turns][emotion note][user message].
+        # The base prompt never changes and history is append-only, so consecutive
+        # requests of a session share a long identical prefix (provider prompt caching).
+        self.base_system_message = {"role": "system", "content": BASE_SYSTEM_PROMPT}
+        self.emotion_messages = {
+            (emotion, level): {"role": "system", "content": self._get_emotion_context(emotion, level)}
+            for emotion in EmotionType
+            for level in CONFIDENCE_LEVELS
+        }
+        
+        # Conversation history per connection / session id, rendered once per message
+        self.sessions = SessionStore(render=self._render_message)
     
-    def _get_emotion_context(self, emotion: EmotionType, confidence: float) -> str:
+    @staticmethod
+    def _confidence_level(confidence: float) -> str:
+        return "very" if confidence > 0.8 else "quite" if confidence > 0.6 else "slightly"
+    
+    def _get_emotion_context(self, emotion: EmotionType, confidence_level: str) -> str:
         """Generate context prompt based on emotion"""
         base_prompt = self.emotion_prompts.get(emotion, "")
-        confidence_level = "very" if confidence > 0.8 else "quite" if confidence > 0.6 else "slightly"
-        
         return f"Detected that the user is {confidence_level} {self._get_emotion_description(emotion)}. {base_prompt}"
     
     def _get_emotion_description(self, emotion: EmotionType) -> str:
@@ -47,81 +89,61 @@ class ChatService:
         }
         return descriptions.get(emotion, "calm")
     
-    def _build_system_prompt(self, emotion: EmotionType, confidence: float) -> str:
-        """Build system prompt"""
-        emotion_context = self._get_emotion_context(emotion, confidence)
-        
-        return f"""You are an emotionally intelligent AI assistant, specifically designed to provide emotional support and meaningful conversations.
-
-{emotion_context}
-
-Please follow these principles:
-1. Adjust your response style and tone based on the user's emotional state
-2. Provide sincere and empathetic responses
-3. Avoid overly formal or mechanical language
-4. Offer emotional support and encouragement when appropriate
-5. Maintain naturalness and coherence in conversation
-6. Respond in English, unless the user uses another language
-
-Remember: Your goal is to be an understanding and supportive friend, not just an information provider."""
+    def _emotion_message(self, emotion: EmotionType, confidence: float) -> dict:
+        """Precomputed emotion note for an (emotion, confidence level) pair"""
+        level = self._confidence_level(confidence)
+        message = self.emotion_messages.get((emotion, level))
+        if message is None:
+            # Not an EmotionType (e.g. free-form value from /api/chat)
+            message = {"role": "system", "content": self._get_emotion_context(emotion, level)}
+        return message
     
-    def _build_conversation_context(self) -> str:
-        """Build conversation history context"""
-        if not self.conversation_history:
-            return ""
-        
-        context = "Recent conversation history:\n"
-        for i, msg in enumerate(self.conversation_history[-5:], 1):  # Only take the last 5
-            context += f"{i}. User: {msg.text}\n"
-            if msg.emotion:
-                context += f"   Emotion: {self._get_emotion_description(msg.emotion)} (confidence: {msg.confidence:.2f})\n"
-        
-        return context
+    def _render_message(self, message: ChatMessage) -> dict:
+        """Prompt form of a stored message (rendered once, when it is added)"""
+        content = message.text
+        if message.role == "user" and message.emotion:
+            content += f"\n(Emotion: {self._get_emotion_description(message.emotion)}, confidence: {message.confidence or 0:.2f})"
+        return {"role": message.role, "content": content}
+    
+    def _build_messages(self, session_id: str, user_text: str, emotion: EmotionType, confidence: float) -> List[dict]:
+        """Assemble the request messages from the cached parts"""
+        return [
+            self.base_system_message,
+            *self.sessions.rendered(session_id),
+            self._emotion_message(emotion, confidence),
+            {"role": "user", "content": user_text}
+        ]
     
-    def _add_to_history(self, text: str, emotion: Optional[EmotionType] = None, confidence: Optional[float] = None):
-        """Add message to history"""
-        message = ChatMessage(
-            text=text,
-            emotion=emotion,
-            confidence=confidence,
-            timestamp=datetime.now().isoformat()
+    def _add_to_history(self, session_id: str, user_text: str, emotion: EmotionType, confidence: float,
+                        assistant_text: str):
+        """Record a completed turn in the session history (the store keeps it within limits).
+
+        The user message is stored together with the reply, so a failed call
+        leaves no unanswered question behind in the history.
+        """
+        timestamp = datetime.now().isoformat()
+        self.sessions.append(
+            session_id,
+            ChatMessage(text=user_text, role="user", emotion=emotion, confidence=confidence, timestamp=timestamp),
+            ChatMessage(text=assistant_text, role="assistant", timestamp=timestamp)
         )
-        
-        self.conversation_history.append(message)
-        
-        # Keep history within limits
-        if len(self.conversation_history) > self.max_history:
-            self.conversation_history = self.conversation_history[-self.max_history:]
     
-    async def generate_response(self, user_text: str, emotion: EmotionType, confidence: float) -> ChatResponse:
+    async def generate_response(self, user_text: str, emotion: EmotionType, confidence: float,
+                                session_id: str = DEFAULT_SESSION) -> ChatResponse:
         """Generate chat response"""
         try:
-            # Add user message to history
-            self._add_to_history(user_text, emotion, confidence)
-            
-            # Build complete prompt
-            system_prompt = self._build_system_prompt(emotion, confidence)
-            conversation_context = self._build_conversation_context()
-            
-            full_prompt = f"{system_prompt}\n\n{conversation_context}\n\nUser: {user_text}\n\nAssistant:"
+            messages = self._build_messages(session_id, user_text, emotion, confidence)
             
             # Call OpenAI API
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"{conversation_context}\n\nUser: {user_text}"}
-                ],
-                max_tokens=200,
-                temperature=0.7,
-                presence_penalty=0.1,
-                frequency_penalty=0.1
+            response = await self.client.chat.completions.create(
+                messages=messages,
+                **self.completion_params
             )
             
             assistant_message = response.choices[0].message.content.strip()
             
-            # Add assistant response to history
-            self._add_to_history(assistant_message)
+            # Add the turn to history
+            self._add_to_history(session_id, user_text, emotion, confidence, assistant_message)
             
             return ChatResponse(
                 message=assistant_message,
@@ -140,6 +162,41 @@ Remember: Your goal is to be an understanding and supportive friend, not just an
                 confidence=0.5
             )
     
+    async def generate_response_stream(self, user_text: str, emotion: EmotionType, confidence: float,
+                                       session_id: str = DEFAULT_SESSION) -> AsyncIterator[str]:
+        """Generate chat response, yielding text deltas as the model produces them"""
+        messages = self._build_messages(session_id, user_text, emotion, confidence)
+        
+        parts = []
+        stream = None
+        try:
+            # Call OpenAI API with token streaming
+            stream = await self.client.chat.completions.create(
+                messages=messages,
+                stream=True,
+                **self.completion_params
+            )
+            async for event in stream:
+                if not event.choices:
+                    continue
+                delta = event.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            print(f"Failed to stream response: {e}")
+        finally:
+            if stream is not None:
+                # Release the connection even if the consumer stopped early
+                await stream.response.aclose()
+        
+        if parts:
+            # Add the turn to history
+            self._add_to_history(session_id, user_text, emotion, confidence, "".join(parts).strip())
+        else:
+            # Nothing was generated; answer with a fallback response
+            yield self._generate_fallback_response(user_text, emotion)
+    
     def _generate_fallback_response(self, user_text: str, emotion: EmotionType) -> str:
         """Generate fallback response"""
         fallback_responses = {
@@ -189,21 +246,30 @@ Remember: Your goal is to be an understanding and supportive friend, not just an
         responses = fallback_responses.get(emotion, ["I understand your feelings."])
         return random.choice(responses)
     
-    def clear_history(self):
+    def clear_history(self, session_id: str = DEFAULT_SESSION):
         """Clear conversation history"""
-        self.conversation_history.clear()
+        self.sessions.close(session_id)
+    
+    def end_session(self, session_id: str):
+        """Forget a conversation whose connection has ended"""
+        self.sessions.close(session_id)
+    
+    def get_stats(self) -> dict:
+        """Session store statistics"""
+        return {"sessions": self.sessions.get_stats()}
     
-    def get_conversation_summary(self) -> dict:
+    def get_conversation_summary(self, session_id: str = DEFAULT_SESSION) -> dict:
         """Get conversation summary"""
-        if not self.conversation_history:
+        if session_id not in self.sessions or not self.sessions.get(session_id).messages:
             return {"message": "No conversation history"}
         
-        emotions = [msg.emotion for msg in self.conversation_history if msg.emotion]
-        avg_confidence = sum(msg.confidence or 0 for msg in self.conversation_history) / len(self.conversation_history)
+        history = self.sessions.get(session_id).messages
+        emotions = [msg.emotion for msg in history if msg.emotion]
+        avg_confidence = sum(msg.confidence or 0 for msg in history) / len(history)
         
         return {
-            "total_messages": len(self.conversation_history),
+            "total_messages": len(history),
             "dominant_emotion": max(set(emotions), key=emotions.count) if emotions else None,
             "average_confidence": avg_confidence,
-            "last_message_time": self.conversation_history[-1].timestamp if self.conversation_history else None
-        } 
\ No newline at end of file
+            "last_message_time": history[-1].timestamp if history else None
+        }
\ No newline at end of file
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from app.services.openai_client import HTTP2_AVAILABLE
+
+class ElevenLabsClient:
+    """Pooled async HTTP client for the ElevenLabs API.
+
+    Connections are kept alive across requests, every request has a hard
+    deadline (including time spent waiting for a concurrency slot), and the
+    number of in-flight requests is bounded.
+    """
+
+    def __init__(self, api_key: str, base_url: str = "https://api.elevenlabs.io/v1"):
+        self.base_url = base_url
+        self.request_deadline = float(os.getenv("ELEVENLABS_REQUEST_DEADLINE", "30"))
+        self.max_concurrency = int(os.getenv("ELEVENLABS_MAX_CONCURRENCY", "8"))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        limits = httpx.Limits(
+            max_connections=self.max_concurrency * 2,
+            max_keepalive_connections=self.max_concurrency,
+            keepalive_expiry=float(os.getenv("ELEVENLABS_KEEPALIVE_EXPIRY", "60"))
+        )
+        timeout = httpx.Timeout(
+            connect=float(os.getenv("ELEVENLABS_CONNECT_TIMEOUT", "5")),
+            read=float(os.getenv("ELEVENLABS_READ_TIMEOUT", "20")),
+            write=10.0,
+            pool=10.0
+        )
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"xi-api-key": api_key},
+            limits=limits,
+            timeout=timeout,
+            http2=HTTP2_AVAILABLE
+        )
+
+    async def _send(self, method: str, path: str, **kwargs) -> httpx.Response:
+        async with self._semaphore:
+            return await self._client.request(method, path, **kwargs)
+
+    async def request(self, method: str, path: str, deadline: Optional[float] = None, **kwargs) -> httpx.Response:
+        """Send a request, raising asyncio.TimeoutError once the deadline passes"""
+        return await asyncio.wait_for(
+            self._send(method, path, **kwargs),
+            timeout=deadline or self.request_deadline
+        )
+
+    async def text_to_speech(self, voice_id: str, payload: dict, deadline: Optional[float] = None) -> httpx.Response:
+        """Synthesize speech and return the complete MP3 response"""
+        return await self.request(
+            "POST", f"/text-to-speech/{voice_id}",
+            json=payload, headers={"Accept": "audio/mpeg"}, deadline=deadline
+        )
+
+    async def stream_text_to_speech(self, voice_id: str, payload: dict, chunk_size: int = 4096,
+                                    deadline: Optional[float] = None) -> AsyncIterator[bytes]:
+        """Synthesize speech with the streaming endpoint, yielding MP3 chunks as they arrive.
+
+        The deadline bounds the wait for a concurrency slot and the response
+        headers; once audio flows, each read is bounded by the read timeout.
+        """
+        deadline = deadline or self.request_deadline
+        started = time.monotonic()
+        await asyncio.wait_for(self._semaphore.acquire(), timeout=deadline)
+        try:
+            request = self._client.build_request(
+                "POST", f"/text-to-speech/{voice_id}/stream",
+                json=payload, headers={"Accept": "audio/mpeg"}
+            )
+            remaining = max(deadline - (time.monotonic() - started), 0.001)
+            response = await asyncio.wait_for(self._client.send(request, stream=True), timeout=remaining)
+            try:
+                if response.status_code != 200:
+                    await response.aread()
+                    response.raise_for_status()
+                async for chunk in response.aiter_bytes(chunk_size):
+                    yield chunk
+            finally:
+                await response.aclose()
+        finally:
+            self._semaphore.release()
+
+    async def list_voices(self, deadline: Optional[float] = None) -> httpx.Response:
+        """List the voices available to the account"""
+        return await self.request("GET", "/voices", deadline=deadline)
+
+    async def prewarm(self):
+        """Open a pooled TLS connection before the first synthesis"""
+        try:
+            await self.request("GET", "/models", deadline=5.0)
+            print("ElevenLabs client pre-warmed")
+        except Exception as e:
+            print(f"ElevenLabs client pre-warm failed: {e}")
+
+    async def close(self):
+        """Close the connection pool"""
+        await self._client.aclose()
+
+_client: Optional[ElevenLabsClient] = None
+
+def get_elevenlabs_client() -> Optional[ElevenLabsClient]:
+    """Get the process-wide ElevenLabs client, or None without an API key"""
+    global _client
+    api_key = os.getenv("ELEVENLABS_API_KEY")
+    if _client is None and api_key:
+        _client = ElevenLabsClient(api_key)
+    return _client
+
+async def close_elevenlabs_client():
+    """Close the shared client"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
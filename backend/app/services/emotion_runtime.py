@@ -0,0 +1,294 @@
+import copy
+import hashlib
+import os
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from app.services.mel_frontend import get_mel_frontend
+
+try:
+    import onnxruntime as ort
+    ONNX_AVAILABLE = True
+except ImportError:
+    ort = None
+    ONNX_AVAILABLE = False
+
+RUNTIMES = ("eager", "torchscript", "onnx", "quantized", "onnx_int8", "compiled")
+QUANTIZED_RUNTIMES = ("quantized", "onnx_int8")
+INPUT_SHAPE = (1, 128, 128)
+BATCH_BUCKETS = (1, 2, 4, 8, 16)
+
+def configure_threads(intra_op_threads: int):
+    """Limit torch's intra-op parallelism so several workers on one host do not oversubscribe cores"""
+    if intra_op_threads > 0:
+        torch.set_num_threads(intra_op_threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # Already set, or parallel work has started in this process
+
+class InferenceBackend:
+    """Runs EmotionCNN on a (N, 1, 128, 128) mel batch and returns softmax probabilities"""
+
+    name = "base"
+
+    def predict(self, mel_batch: torch.Tensor) -> np.ndarray:
+        raise NotImplementedError
+
+class EagerBackend(InferenceBackend):
+    """The nn.Module through its Python forward"""
+
+    name = "eager"
+
+    def __init__(self, model: nn.Module):
+        self.model = model.eval()
+
+    def predict(self, mel_batch: torch.Tensor) -> np.ndarray:
+        with torch.inference_mode():
+            return torch.softmax(self.model(mel_batch), dim=1).numpy()
+
+class QuantizedBackend(EagerBackend):
+    """Eager model with dynamic int8 quantization of the Linear layers (fc1 holds most weights)"""
+
+    name = "quantized"
+
+    def __init__(self, model: nn.Module):
+        super().__init__(quantize_linear_dynamic(model))
+
+class CompiledBackend(EagerBackend):
+    """torch.compile'd model specialized to fixed (bucket, 1, 128, 128) shapes.
+
+    Batches are zero-padded up to the next bucket size so only a handful of
+    static graphs are ever compiled; each is compiled on first use and
+    cached. Weights and inputs are converted to channels-last explicitly
+    rather than left to Inductor's layout pass, which does not always run
+    on CPU. The convolutions still run as extern cuDNN/oneDNN kernels; what
+    Inductor fuses is the pointwise and pooling work around them, e.g. each
+    ReLU with the following max-pool. Buckets that fail to compile (e.g. no
+    C++ toolchain) run in eager mode.
+    """
+
+    name = "compiled"
+
+    def __init__(self, model: nn.Module, buckets: Sequence[int] = BATCH_BUCKETS):
+        # A copy, so the caller's model keeps its layout for export and the other backends
+        super().__init__(copy.deepcopy(model).to(memory_format=torch.channels_last))
+        self.buckets = tuple(sorted(buckets))
+        self._compiled: Dict[int, Callable] = {}
+
+    def _bucket(self, size: int) -> int:
+        return next((bucket for bucket in self.buckets if bucket >= size), self.buckets[-1])
+
+    def _graph(self, bucket: int) -> Callable:
+        graph = self._compiled.get(bucket)
+        if graph is None:
+            graph = torch.compile(self.model, dynamic=False)
+            try:
+                with torch.inference_mode():
+                    graph(torch.zeros(bucket, *INPUT_SHAPE).contiguous(memory_format=torch.channels_last))
+            except Exception as e:
+                print(f"Compiling EmotionCNN for batch {bucket} failed, running eager: {e}")
+                graph = self.model
+            self._compiled[bucket] = graph
+        return graph
+
+    def predict(self, mel_batch: torch.Tensor) -> np.ndarray:
+        outputs = []
+        with torch.inference_mode():
+            for chunk in torch.split(mel_batch, self.buckets[-1]):
+                bucket = self._bucket(len(chunk))
+                padded = chunk
+                if len(chunk) < bucket:
+                    padded = torch.cat([chunk, chunk.new_zeros(bucket - len(chunk), *chunk.shape[1:])])
+                padded = padded.contiguous(memory_format=torch.channels_last)
+                outputs.append(self._graph(bucket)(padded)[:len(chunk)])
+            return torch.softmax(torch.cat(outputs), dim=1).numpy()
+
+class TorchScriptBackend(InferenceBackend):
+    """A traced TorchScript artifact, frozen for inference"""
+
+    name = "torchscript"
+
+    def __init__(self, path: str):
+        self.module = torch.jit.optimize_for_inference(torch.jit.load(path).eval())
+
+    def predict(self, mel_batch: torch.Tensor) -> np.ndarray:
+        with torch.inference_mode():
+            return torch.softmax(self.module(mel_batch), dim=1).numpy()
+
+class OnnxBackend(InferenceBackend):
+    """An ONNX artifact run by onnxruntime on the CPU"""
+
+    name = "onnx"
+
+    def __init__(self, path: str, intra_op_threads: int = 0, name: str = "onnx"):
+        self.name = name
+        if not ONNX_AVAILABLE:
+            raise RuntimeError("onnxruntime is not installed")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, mel_batch: torch.Tensor) -> np.ndarray:
+        logits = self.session.run(None, {self.input_name: mel_batch.numpy()})[0]
+        # Same float32 softmax as the torch backends
+        return torch.softmax(torch.from_numpy(logits), dim=1).numpy()
+
+def quantize_linear_dynamic(model: nn.Module) -> nn.Module:
+    """Copy of the model with int8 weights and dynamically quantized activations in nn.Linear"""
+    from torch.ao.quantization import quantize_dynamic
+    return quantize_dynamic(copy.deepcopy(model).eval(), {nn.Linear}, dtype=torch.qint8)
+
+def synthetic_utterance(rng: np.random.Generator, sample_rate: int) -> np.ndarray:
+    """Voiced-speech-like signal: harmonics of a gliding pitch, syllable envelope, breath noise"""
+    duration = rng.uniform(1.0, 4.0)
+    t = np.arange(int(sample_rate * duration)) / sample_rate
+    pitch = rng.uniform(90, 260) * (1 + 0.1 * np.sin(2 * np.pi * rng.uniform(0.5, 3) * t))
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * rng.uniform(2, 6) * t), 0, None)
+    signal = voiced * envelope + rng.standard_normal(len(t)) * rng.uniform(0.01, 0.1)
+    return (signal / np.abs(signal).max() * rng.uniform(0.1, 0.8)).astype(np.float32)
+
+def calibration_mels(count: int = 32, sample_rate: int = 22050, audio_dir: Optional[str] = None,
+                     seed: int = 0) -> torch.Tensor:
+    """Mel spectrograms for int8 calibration and drift reports.
+
+    Uses audio files from audio_dir (e.g. recorded utterances) when given,
+    otherwise synthetic speech-like clips.
+    """
+    clips = []
+    if audio_dir and os.path.isdir(audio_dir):
+        import librosa
+        for name in sorted(os.listdir(audio_dir))[:count]:
+            try:
+                clip, _ = librosa.load(os.path.join(audio_dir, name), sr=sample_rate, mono=True)
+                clips.append(clip.astype(np.float32))
+            except Exception as e:
+                print(f"Skipping calibration file {name}: {e}")
+    rng = np.random.default_rng(seed)
+    while len(clips) < count:
+        clips.append(synthetic_utterance(rng, sample_rate))
+    return get_mel_frontend(sample_rate)(clips)
+
+def quantize_onnx(onnx_path: str, output_path: str, calibration: Optional[torch.Tensor] = None):
+    """int8 ONNX model: dynamic quantization of Gemm/MatMul, plus static Conv quantization
+    calibrated on the given mel spectrograms"""
+    from onnxruntime.quantization import (
+        CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    class MelReader(CalibrationDataReader):
+        def __init__(self, mels: torch.Tensor):
+            self._batches = iter([{"mel": mel[None].numpy()} for mel in mels])
+
+        def get_next(self):
+            return next(self._batches, None)
+
+    prepared = output_path + ".pre.onnx"
+    staged = output_path + ".conv.onnx"
+    try:
+        quant_pre_process(onnx_path, prepared)
+        source = prepared
+        if calibration is not None:
+            quantize_static(
+                prepared, staged, MelReader(calibration),
+                quant_format=QuantFormat.QDQ, op_types_to_quantize=["Conv"], per_channel=True,
+                activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8
+            )
+            source = staged
+        quantize_dynamic(source, output_path, op_types_to_quantize=["Gemm", "MatMul"],
+                         weight_type=QuantType.QInt8)
+    finally:
+        for path in (prepared, staged):
+            if os.path.exists(path):
+                os.remove(path)
+
+def model_fingerprint(model: nn.Module) -> str:
+    """Short hash of the model weights, used to name exported artifacts"""
+    digest = hashlib.sha256()
+    for key, tensor in model.state_dict().items():
+        digest.update(key.encode())
+        digest.update(tensor.detach().cpu().numpy().tobytes())
+    return digest.hexdigest()[:12]
+
+def export_artifacts(model: nn.Module, artifact_dir: str, runtimes: Sequence[str] = ("torchscript", "onnx"),
+                     quantize_convs: bool = True, calibration_dir: Optional[str] = None) -> Dict[str, str]:
+    """Export TorchScript / ONNX / int8 ONNX artifacts of the model, reusing ones exported for the same weights"""
+    os.makedirs(artifact_dir, exist_ok=True)
+    model = model.eval()
+    example = torch.zeros(2, *INPUT_SHAPE)
+    base = os.path.join(artifact_dir, f"emotion_cnn-{model_fingerprint(model)}")
+    paths = {}
+
+    if "torchscript" in runtimes:
+        path = base + ".pt"
+        if not os.path.exists(path):
+            with torch.no_grad():
+                traced = torch.jit.trace(model, example)
+            traced.save(path)
+            print(f"Exported TorchScript artifact: {path}")
+        paths["torchscript"] = path
+
+    if "onnx" in runtimes or "onnx_int8" in runtimes:
+        path = base + ".onnx"
+        if not os.path.exists(path):
+            torch.onnx.export(
+                model, (example,), path,
+                input_names=["mel"], output_names=["logits"],
+                dynamic_axes={"mel": {0: "batch"}, "logits": {0: "batch"}},
+                opset_version=17, dynamo=False
+            )
+            print(f"Exported ONNX artifact: {path}")
+        paths["onnx"] = path
+
+    if "onnx_int8" in runtimes:
+        path = base + ("-int8-conv.onnx" if quantize_convs else "-int8.onnx")
+        if not os.path.exists(path):
+            calibration = calibration_mels(audio_dir=calibration_dir) if quantize_convs else None
+            quantize_onnx(paths["onnx"], path, calibration)
+            print(f"Exported int8 ONNX artifact: {path}")
+        paths["onnx_int8"] = path
+
+    return paths
+
+def load_backend(runtime: str, model: nn.Module, artifacts: Optional[Dict[str, str]] = None,
+                 intra_op_threads: int = 0) -> InferenceBackend:
+    """Build the inference backend for a runtime name"""
+    artifacts = artifacts or {}
+    if runtime == "eager":
+        return EagerBackend(model)
+    if runtime == "quantized":
+        return QuantizedBackend(model)
+    if runtime == "compiled":
+        return CompiledBackend(model)
+    if runtime not in artifacts:
+        raise ValueError(f"No exported artifact for runtime: {runtime}")
+    if runtime == "torchscript":
+        return TorchScriptBackend(artifacts[runtime])
+    if runtime in ("onnx", "onnx_int8"):
+        return OnnxBackend(artifacts[runtime], intra_op_threads=intra_op_threads, name=runtime)
+    raise ValueError(f"Unknown inference runtime: {runtime}")
+
+def reference_inputs(count: int = 8, seed: int = 0) -> torch.Tensor:
+    """Fixed set of standardized mel-like inputs for equivalence checks"""
+    generator = torch.Generator().manual_seed(seed)
+    return torch.randn(count, *INPUT_SHAPE, generator=generator)
+
+def verify_backend(backend: InferenceBackend, reference: InferenceBackend,
+                   inputs: Optional[torch.Tensor] = None, atol: float = 1e-4) -> float:
+    """Compare a backend with the eager reference; raises ValueError if they disagree"""
+    inputs = reference_inputs() if inputs is None else inputs
+    expected = reference.predict(inputs)
+    actual = backend.predict(inputs)
+    error = float(np.abs(expected - actual).max())
+    if error > atol:
+        raise ValueError(f"{backend.name} differs from {reference.name}: max abs error {error:.2e}")
+    return error
@@ -1,17 +1,22 @@
+import asyncio
 import librosa
+import os
+import time
 import numpy as np
 import torch
 import torch.nn as nn
-import io
-import soundfile as sf
-from typing import Optional
+from typing import List, Optional, Sequence, Tuple, Union
 import joblib
-import os
-import tempfile
-import subprocess
-import shutil
 
-from app.models.chat_models import EmotionResponse, EmotionType
+from app.models.chat_models import EmotionResponse, EmotionType, EmotionWindow
+from app.services.audio_service import AudioService, DecodedAudio
+from app.services.emotion_runtime import (
+    BATCH_BUCKETS, QUANTIZED_RUNTIMES, EagerBackend, InferenceBackend, configure_threads, export_artifacts, load_backend,
+    verify_backend
+)
+from app.services.mel_frontend import get_mel_frontend
+from app.utils.batching import MicroBatcher, batcher_config_from_env
+from app.utils.executor import get_execution_layer
 
 class EmotionCNN(nn.Module):
     """Simple emotion recognition CNN model"""
@@ -40,16 +45,149 @@ class EmotionCNN(nn.Module):
         x = self.pool(self.relu(self.conv2(x)))
         x = self.pool(self.relu(self.conv3(x)))
         x = self.adaptive_pool(x)  # Adaptive pooling
-        x = x.view(x.size(0), -1)
+        x = torch.flatten(x, 1)  # Copies if needed, so channels-last activations flatten too
         x = self.dropout(self.relu(self.fc1(x)))
         x = self.fc2(x)
         return x
 
+# Inference backend used by CPU pool workers
+_worker_backend: Optional[InferenceBackend] = None
+
+def init_emotion_worker(state_dict: dict, num_classes: int, runtime: str = "eager",
+                        artifacts: Optional[dict] = None, intra_op_threads: int = 0):
+    """Load a replica of the service model inside a CPU pool worker"""
+    global _worker_backend
+    configure_threads(intra_op_threads)
+    model = EmotionCNN(num_classes=num_classes)
+    model.load_state_dict(state_dict)
+    model.eval()
+    _worker_backend = load_backend(runtime, model, artifacts, intra_op_threads)
+
+def extract_features(audio_array: np.ndarray, sample_rate: int, duration: int) -> np.ndarray:
+    """Extract statistical features from decoded audio"""
+    try:
+        if len(audio_array) == 0:
+            raise ValueError("no decoded audio samples")
+        
+        # Ensure consistent audio length
+        target_length = sample_rate * duration
+        if len(audio_array) > target_length:
+            audio_array = audio_array[:target_length]
+        else:
+            # Zero padding
+            audio_array = np.pad(audio_array, (0, target_length - len(audio_array)))
+        
+        # Extract MFCC features
+        mfccs = librosa.feature.mfcc(y=audio_array, sr=sample_rate, n_mfcc=13)
+        
+        # Extract other features
+        spectral_centroids = librosa.feature.spectral_centroid(y=audio_array, sr=sample_rate)[0]
+        spectral_rolloff = librosa.feature.spectral_rolloff(y=audio_array, sr=sample_rate)[0]
+        zero_crossing_rate = librosa.feature.zero_crossing_rate(audio_array)[0]
+        
+        # Calculate statistical features
+        features = []
+        for feature in [mfccs, spectral_centroids, spectral_rolloff, zero_crossing_rate]:
+            features.extend([
+                np.mean(feature),
+                np.std(feature),
+                np.min(feature),
+                np.max(feature)
+            ])
+        
+        return np.array(features)
+        
+    except Exception as e:
+        print(f"Feature extraction failed: {e}")
+        return np.zeros(60)  # Return zero vector as fallback
+
+# "torch" (batched float32 front end) or "librosa" (reference implementation)
+MEL_FRONTEND = os.getenv("MEL_FRONTEND", "torch").lower()
+
+def extract_mel_spectrogram_librosa(audio_array: np.ndarray, sample_rate: int) -> torch.Tensor:
+    """Extract mel spectrogram features with librosa (reference for the torch front end)"""
+    if len(audio_array) == 0:
+        print("No decoded audio samples, using default tensor")
+        return torch.zeros(1, 1, 128, 128)
+    
+    # Ensure minimum length
+    min_length = sample_rate * 1  # At least 1 second
+    if len(audio_array) < min_length:
+        audio_array = np.pad(audio_array, (0, min_length - len(audio_array)))
+    
+    # Extract mel spectrogram
+    mel_spec = librosa.feature.melspectrogram(
+        y=audio_array, 
+        sr=sample_rate,
+        n_mels=128,
+        n_fft=2048,
+        hop_length=512
+    )
+    
+    # Convert to decibel units
+    mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
+    
+    # Normalize
+    if mel_spec_db.std() > 0:
+        mel_spec_db = (mel_spec_db - mel_spec_db.mean()) / mel_spec_db.std()
+    
+    # Ensure fixed size (128x128)
+    if mel_spec_db.shape[1] < 128:
+        mel_spec_db = np.pad(mel_spec_db, ((0, 0), (0, 128 - mel_spec_db.shape[1])))
+    elif mel_spec_db.shape[1] > 128:
+        mel_spec_db = mel_spec_db[:, :128]
+    
+    # Convert to tensor and add channel dimension
+    mel_tensor = torch.FloatTensor(mel_spec_db).unsqueeze(0).unsqueeze(0)
+    
+    return mel_tensor
+
+def extract_mel_spectrograms(audio_arrays: Sequence[np.ndarray], sample_rate: int) -> torch.Tensor:
+    """Extract a (N, 1, 128, 128) mel spectrogram batch.
+
+    Errors propagate, like in extract_mel_windows.
+    """
+    if MEL_FRONTEND == "librosa":
+        return torch.cat([extract_mel_spectrogram_librosa(a, sample_rate) for a in audio_arrays], dim=0)
+    return get_mel_frontend(sample_rate)(audio_arrays)
+
+def extract_mel_spectrogram(audio_array: np.ndarray, sample_rate: int) -> torch.Tensor:
+    """Extract the (1, 1, 128, 128) mel spectrogram of one utterance"""
+    return extract_mel_spectrograms([audio_array], sample_rate)
+
+def extract_mel_windows(audio_array: np.ndarray, sample_rate: int, hop_frames: int,
+                        max_windows: int) -> Tuple[torch.Tensor, np.ndarray]:
+    """Extract (W, 1, 128, 128) overlapping mel windows over the whole utterance and their start times.
+
+    Errors propagate, so the caller answers with its (uncached) fallback
+    instead of scoring an all-zero input.
+    """
+    if MEL_FRONTEND == "librosa":
+        # The reference front end only looks at the first 128 frames
+        return extract_mel_spectrogram_librosa(audio_array, sample_rate), np.zeros(1)
+    return get_mel_frontend(sample_rate).windows(audio_array, hop_frames, max_windows)
+
+def predict_emotion_batch(mel_batch: torch.Tensor) -> np.ndarray:
+    """Run the worker model on a (N, 1, 128, 128) batch and return (N, classes) probabilities"""
+    return _worker_backend.predict(mel_batch)
+
+def warm_up_emotion_worker(audio_array: np.ndarray, sample_rate: int, max_batch_size: int) -> float:
+    """Run the feature and inference paths once in this worker (numba JIT, kernel selection,
+    graph compilation for every batch bucket the batcher can produce)"""
+    start = time.perf_counter()
+    extract_features(audio_array, sample_rate, 3)
+    mel = extract_mel_spectrograms([audio_array], sample_rate)
+    for bucket in BATCH_BUCKETS:
+        if bucket <= max_batch_size:
+            _worker_backend.predict(mel.expand(bucket, -1, -1, -1).contiguous())
+    return (time.perf_counter() - start) * 1000
+
 class EmotionService:
     """Emotion recognition service"""
     
-    def __init__(self):
+    def __init__(self, audio_service: Optional[AudioService] = None):
         self.model = None
+        self.runtime = "eager"
         self.scaler = None
         self.emotion_labels = [
             EmotionType.HAPPY,
@@ -64,9 +202,25 @@ class EmotionService:
         self.sample_rate = 22050
         self.duration = 3  # Audio segment length (seconds)
         
-        # Find FFmpeg path
-        self.ffmpeg_path = shutil.which('ffmpeg') or '/opt/homebrew/bin/ffmpeg'
-        print(f"EmotionService using FFmpeg at: {self.ffmpeg_path}")
+        # "windowed" scores overlapping 128-frame windows over the whole utterance
+        # (EMOTION_WINDOW_HOP frames apart, at most EMOTION_MAX_WINDOWS); "single" only the first one
+        self.analysis_mode = os.getenv("EMOTION_ANALYSIS_MODE", "windowed").lower()
+        self.window_hop = int(os.getenv("EMOTION_WINDOW_HOP", "64"))
+        self.max_windows = int(os.getenv("EMOTION_MAX_WINDOWS", "16"))
+        
+        # Shared decoding stage
+        self.audio_service = audio_service or AudioService()
+        self.executor = get_execution_layer()
+        
+        # Concurrent requests share one forward pass (EMOTION_BATCH_MAX_SIZE / _MAX_WAIT_MS)
+        batch_config = {"max_concurrency": self.executor.cpu_workers}
+        batch_config.update(batcher_config_from_env("EMOTION_BATCH", default_size=16, default_wait_ms=5.0))
+        # Items carry one mel window each, or all windows of an utterance
+        self.batcher = MicroBatcher(self._predict_batch, name="emotion_cnn", rows_of=len, **batch_config)
+        
+        # Each CPU worker gets a share of the cores (EMOTION_INTRA_OP_THREADS overrides)
+        self.intra_op_threads = int(os.getenv("EMOTION_INTRA_OP_THREADS", "0")) or \
+            max(1, (os.cpu_count() or 1) // self.executor.cpu_workers)
         
         self._load_model()
     
@@ -76,8 +230,20 @@ class EmotionService:
             # Here we should load the actual pre-trained model
             # For demonstration, we create a simple model
             self.model = EmotionCNN(num_classes=len(self.emotion_labels))
+            model_path = os.getenv("EMOTION_MODEL_PATH")
+            if model_path and os.path.exists(model_path):
+                self.model.load_state_dict(torch.load(model_path, map_location="cpu"))
+                print(f"Loaded emotion model weights from {model_path}")
             self.model.eval()
             
+            self.runtime, artifacts = self._prepare_runtime(os.getenv("EMOTION_RUNTIME", "eager").lower())
+            
+            # CPU pool workers run inference on a replica with the same weights
+            self.executor.add_cpu_initializer(
+                init_emotion_worker, self.model.state_dict(), len(self.emotion_labels),
+                self.runtime, artifacts, self.intra_op_threads
+            )
+            
             # Load scaler
             # self.scaler = joblib.load('models/scaler.pkl')
             
@@ -87,166 +253,48 @@ class EmotionService:
             # Use simple rule-based method as fallback
             self.model = None
     
-    def _convert_audio_to_wav(self, audio_data: bytes) -> bytes:
-        """Convert audio data to WAV format using FFmpeg"""
+    def _prepare_runtime(self, runtime: str):
+        """Export the artifact for the requested runtime and check it against eager mode"""
+        if runtime == "eager":
+            return runtime, None
         try:
-            # Create temporary files
-            with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as input_file:
-                input_file.write(audio_data)
-                input_path = input_file.name
-            
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as output_file:
-                output_path = output_file.name
-            
-            # Use FFmpeg to convert with audio filters for better quality
-            cmd = [
-                self.ffmpeg_path, "-y",  # Overwrite output file
-                "-i", input_path,  # Input file
-                "-acodec", "pcm_s16le",  # PCM 16-bit
-                "-ar", str(self.sample_rate),  # Sample rate
-                "-ac", "1",  # Mono
-                "-af", "highpass=f=200,lowpass=f=3000,volume=1.5",  # Audio filters for better quality
-                output_path  # Output file
-            ]
-            
-            print(f"Converting audio with FFmpeg: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                # Read converted audio
-                with open(output_path, "rb") as f:
-                    converted_audio = f.read()
-                
-                print(f"Audio conversion successful: {len(converted_audio)} bytes")
-                
-                # Clean up temporary files
-                os.unlink(input_path)
-                os.unlink(output_path)
-                
-                return converted_audio
-            else:
-                print(f"FFmpeg conversion failed: {result.stderr}")
-                # Clean up and return original
-                os.unlink(input_path)
-                os.unlink(output_path)
-                return audio_data
-                
+            artifacts = None
+            if runtime != "quantized":  # the quantized runtime is built from the state dict in each worker
+                artifacts = export_artifacts(
+                    self.model, os.getenv("EMOTION_ARTIFACT_DIR", "models/emotion"), [runtime],
+                    quantize_convs=os.getenv("EMOTION_QUANTIZE_CONVS", "1") == "1",
+                    calibration_dir=os.getenv("EMOTION_CALIBRATION_DIR")
+                )
+            # int8 runtimes are allowed a small drift in probabilities
+            atol = 5e-2 if runtime in QUANTIZED_RUNTIMES else 1e-4
+            error = verify_backend(load_backend(runtime, self.model, artifacts), EagerBackend(self.model), atol=atol)
+            print(f"Emotion inference runtime: {runtime} (max abs error vs eager {error:.1e})")
+            return runtime, artifacts
         except Exception as e:
-            print(f"Audio conversion failed: {e}")
-            return audio_data
+            print(f"Emotion runtime {runtime} unavailable, using eager: {e}")
+            return "eager", None
     
-    def _extract_features(self, audio_data: bytes) -> np.ndarray:
-        """Extract features from audio data"""
-        try:
-            # Convert audio to WAV format first
-            wav_audio = self._convert_audio_to_wav(audio_data)
-            
-            # Convert byte data to audio array
-            audio_array, sr = sf.read(io.BytesIO(wav_audio))
-            
-            # Resample to standard sample rate
-            if sr != self.sample_rate:
-                audio_array = librosa.resample(audio_array, orig_sr=sr, target_sr=self.sample_rate)
-            
-            # Ensure consistent audio length
-            target_length = self.sample_rate * self.duration
-            if len(audio_array) > target_length:
-                audio_array = audio_array[:target_length]
-            else:
-                # Zero padding
-                audio_array = np.pad(audio_array, (0, target_length - len(audio_array)))
-            
-            # Extract MFCC features
-            mfccs = librosa.feature.mfcc(y=audio_array, sr=self.sample_rate, n_mfcc=13)
-            
-            # Extract other features
-            spectral_centroids = librosa.feature.spectral_centroid(y=audio_array, sr=self.sample_rate)[0]
-            spectral_rolloff = librosa.feature.spectral_rolloff(y=audio_array, sr=self.sample_rate)[0]
-            zero_crossing_rate = librosa.feature.zero_crossing_rate(audio_array)[0]
-            
-            # Calculate statistical features
-            features = []
-            for feature in [mfccs, spectral_centroids, spectral_rolloff, zero_crossing_rate]:
-                features.extend([
-                    np.mean(feature),
-                    np.std(feature),
-                    np.min(feature),
-                    np.max(feature)
-                ])
-            
-            return np.array(features)
-            
-        except Exception as e:
-            print(f"Feature extraction failed: {e}")
-            return np.zeros(60)  # Return zero vector as fallback
+    async def _predict_batch(self, mel_tensors: List[torch.Tensor]) -> List[np.ndarray]:
+        """Run one forward pass for a gathered batch of mel spectrograms; an item
+        with several windows gets back one row of probabilities per window"""
+        mel_batch = torch.cat(mel_tensors, dim=0)
+        probabilities = await self.executor.run_cpu(predict_emotion_batch, mel_batch)
+        offsets = np.cumsum([len(mel) for mel in mel_tensors])[:-1]
+        return np.split(probabilities, offsets)
     
-    def _extract_mel_spectrogram(self, audio_data: bytes) -> torch.Tensor:
-        """Extract mel spectrogram features with better error handling"""
-        try:
-            # Convert audio to WAV format first
-            wav_audio = self._convert_audio_to_wav(audio_data)
-            
-            # Try to read audio data with better error handling
-            try:
-                audio_array, sr = sf.read(io.BytesIO(wav_audio))
-            except Exception as e:
-                print(f"Failed to read audio with soundfile: {e}")
-                # Try alternative method - save to temp file
-                with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                    temp_file.write(wav_audio)
-                    temp_file_path = temp_file.name
-                
-                try:
-                    audio_array, sr = sf.read(temp_file_path)
-                    os.unlink(temp_file_path)  # Clean up
-                except Exception as e2:
-                    print(f"Failed to read audio from temp file: {e2}")
-                    # Return default tensor
-                    return torch.zeros(1, 1, 128, 128)
-            
-            # Ensure audio is mono
-            if len(audio_array.shape) > 1:
-                audio_array = np.mean(audio_array, axis=1)
-            
-            # Resample if needed
-            if sr != self.sample_rate:
-                audio_array = librosa.resample(audio_array, orig_sr=sr, target_sr=self.sample_rate)
-            
-            # Ensure minimum length
-            min_length = self.sample_rate * 1  # At least 1 second
-            if len(audio_array) < min_length:
-                audio_array = np.pad(audio_array, (0, min_length - len(audio_array)))
-            
-            # Extract mel spectrogram
-            mel_spec = librosa.feature.melspectrogram(
-                y=audio_array, 
-                sr=self.sample_rate,
-                n_mels=128,
-                n_fft=2048,
-                hop_length=512
-            )
-            
-            # Convert to decibel units
-            mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
-            
-            # Normalize
-            if mel_spec_db.std() > 0:
-                mel_spec_db = (mel_spec_db - mel_spec_db.mean()) / mel_spec_db.std()
-            
-            # Ensure fixed size (128x128)
-            if mel_spec_db.shape[1] < 128:
-                mel_spec_db = np.pad(mel_spec_db, ((0, 0), (0, 128 - mel_spec_db.shape[1])))
-            elif mel_spec_db.shape[1] > 128:
-                mel_spec_db = mel_spec_db[:, :128]
-            
-            # Convert to tensor and add channel dimension
-            mel_tensor = torch.FloatTensor(mel_spec_db).unsqueeze(0).unsqueeze(0)
-            
-            return mel_tensor
-            
-        except Exception as e:
-            print(f"Mel spectrogram extraction failed: {e}")
-            return torch.zeros(1, 1, 128, 128)
+    def _timeline(self, probabilities: np.ndarray, starts: np.ndarray, duration: float) -> List[EmotionWindow]:
+        """Per-window emotion of an utterance"""
+        window_s = 128 * 512 / self.sample_rate
+        timeline = []
+        for start, window in zip(starts, probabilities):
+            idx = int(np.argmax(window))
+            timeline.append(EmotionWindow(
+                start=round(float(start), 3),
+                end=round(min(float(start) + window_s, duration), 3),
+                emotion=self.emotion_labels[idx],
+                confidence=float(window[idx])
+            ))
+        return timeline
     
     def _rule_based_emotion_detection(self, features: np.ndarray) -> EmotionResponse:
         """Rule-based emotion detection (fallback method)"""
@@ -265,42 +313,93 @@ class EmotionService:
             features={"method": "rule_based"}
         )
     
-    async def analyze_emotion(self, audio_data: bytes) -> EmotionResponse:
-        """Analyze emotion in audio"""
+    async def analyze_emotion(self, audio_data: Union[bytes, DecodedAudio], timeline: bool = False) -> EmotionResponse:
+        """Analyze emotion in audio (raw bytes or an already decoded utterance).
+
+        With timeline=True the response also lists the emotion of every analysis window.
+        """
         try:
+            # A retry of the same payload reuses the earlier result
+            fingerprint = self.audio_service.fingerprint(audio_data)
+            cached = self.audio_service.results.get(fingerprint, "emotion")
+            if cached is not None:
+                return cached if timeline else cached.model_copy(update={"timeline": None})
+            
+            audio = await self.audio_service.ensure_decoded(audio_data)
+            if not audio.ok:
+                # Nothing to analyze; scoring silence would look like a real (and cacheable) result
+                return self._fallback_response("no decoded audio")
+            audio_array = audio.at_rate(self.sample_rate)
+
             if self.model is not None:
                 # Use deep learning model
-                mel_tensor = self._extract_mel_spectrogram(audio_data)
-                
-                # Check tensor shape
-                print(f"Mel tensor shape: {mel_tensor.shape}")
-                
-                with torch.no_grad():
-                    outputs = self.model(mel_tensor)
-                    probabilities = torch.softmax(outputs, dim=1)
-                    predicted_idx = torch.argmax(probabilities, dim=1).item()
-                    confidence = probabilities[0][predicted_idx].item()
+                if self.analysis_mode == "windowed":
+                    mel_tensor, starts = await self.executor.run_cpu(
+                        extract_mel_windows, audio_array, self.sample_rate, self.window_hop, self.max_windows
+                    )
+                else:
+                    mel_tensor = await self.executor.run_cpu(extract_mel_spectrogram, audio_array, self.sample_rate)
+                    starts = np.zeros(1)
+                # All windows of the utterance go through the model in one forward pass
+                window_probabilities = await self.batcher.submit(mel_tensor)
+                probabilities = window_probabilities.mean(axis=0)
+                predicted_idx = int(np.argmax(probabilities))
+                confidence = float(probabilities[predicted_idx])
                 
                 emotion = self.emotion_labels[predicted_idx]
                 
-                return EmotionResponse(
+                result = EmotionResponse(
                     emotion=emotion,
                     confidence=confidence,
-                    features={"method": "deep_learning"}
+                    features={"method": "deep_learning", "windows": len(starts)},
+                    timeline=self._timeline(window_probabilities, starts, len(audio_array) / self.sample_rate)
                 )
             else:
                 # Use rule-based method
-                features = self._extract_features(audio_data)
+                features = await self.executor.run_cpu(
+                    extract_features, audio_array, self.sample_rate, self.duration
+                )
+                # The rule-based method is itself a fallback; it is not cached either
                 return self._rule_based_emotion_detection(features)
+            
+            self.audio_service.results.put(fingerprint, "emotion", result)
+            return result if timeline else result.model_copy(update={"timeline": None})
                 
         except Exception as e:
             print(f"Emotion analysis failed: {e}")
-            # Return neutral emotion as fallback
-            return EmotionResponse(
-                emotion=EmotionType.NEUTRAL,
-                confidence=0.5,
-                features={"method": "fallback", "error": str(e)}
-            )
+            return self._fallback_response(str(e))
+    
+    def _fallback_response(self, error: str) -> EmotionResponse:
+        """Neutral emotion returned when the audio could not be analyzed (never cached)"""
+        return EmotionResponse(
+            emotion=EmotionType.NEUTRAL,
+            confidence=0.5,
+            features={"method": "fallback", "error": error}
+        )
+    
+    async def warm_up(self, audio: DecodedAudio) -> EmotionResponse:
+        """Warm every CPU worker, then run one utterance end to end through the batcher"""
+        if self.model is not None:
+            audio_array = audio.at_rate(self.sample_rate)
+            # One task per worker; each takes long enough that the pool starts all of them
+            await asyncio.gather(*[
+                self.executor.run_cpu(warm_up_emotion_worker, audio_array, self.sample_rate,
+                                      self.batcher.max_batch_size)
+                for _ in range(self.executor.cpu_workers)
+            ])
+        return await self.analyze_emotion(audio)
+    
+    def get_stats(self) -> dict:
+        """Inference batching statistics"""
+        return {
+            "runtime": self.runtime,
+            "intra_op_threads": self.intra_op_threads,
+            "batching": self.batcher.get_stats()
+        }
+    
+    async def close(self):
+        """Stop the inference batcher"""
+        await self.batcher.close()
     
     def get_emotion_description(self, emotion: EmotionType) -> str:
         """Get emotion description"""
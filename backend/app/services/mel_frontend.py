@@ -0,0 +1,132 @@
+import functools
+import math
+from typing import Optional, Sequence, Tuple
+
+import librosa
+import numpy as np
+import torch
+
+# Matches the librosa.feature.melspectrogram / power_to_db defaults used by the model
+AMIN = 1e-10
+TOP_DB = 80.0
+
+class MelFrontend:
+    """Torch-native log-mel front end for EmotionCNN.
+
+    Reproduces the librosa path (centered STFT with a periodic Hann window,
+    power mel projection, power_to_db(ref=max) with an 80 dB floor,
+    per-utterance standardization, pad/crop to a fixed frame count) in
+    float32, with the window and mel filterbank built once per sample rate.
+    Waveforms of different lengths are processed in one batched STFT.
+    """
+
+    def __init__(self, sample_rate: int = 22050, n_fft: int = 2048, hop_length: int = 512,
+                 n_mels: int = 128, n_frames: int = 128, min_duration: float = 1.0):
+        self.sample_rate = sample_rate
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mels = n_mels
+        self.n_frames = n_frames
+        self.min_length = int(sample_rate * min_duration)
+
+        self.window = torch.hann_window(n_fft, periodic=True, dtype=torch.float32)
+        self.mel_basis = torch.from_numpy(
+            librosa.filters.mel(sr=sample_rate, n_fft=n_fft, n_mels=n_mels).astype(np.float32)
+        )
+
+    def _num_frames(self, length: int) -> int:
+        return 1 + length // self.hop_length
+
+    def __call__(self, waveforms: Sequence[np.ndarray]) -> torch.Tensor:
+        """Turn N waveforms into a (N, 1, n_mels, n_frames) float32 tensor"""
+        if len(waveforms) == 0:
+            return torch.zeros(0, 1, self.n_mels, self.n_frames)
+
+        mel_db, _ = self.normalized(waveforms)
+
+        # Pad (with zeros after normalization, like the librosa path) or crop to n_frames
+        if mel_db.shape[-1] < self.n_frames:
+            mel_db = torch.nn.functional.pad(mel_db, (0, self.n_frames - mel_db.shape[-1]))
+        mel_db = mel_db[..., :self.n_frames]
+
+        return mel_db.unsqueeze(1).contiguous()
+
+    def windows(self, waveform: np.ndarray, hop_frames: int,
+                max_windows: Optional[int] = None) -> Tuple[torch.Tensor, np.ndarray]:
+        """Overlapping n_frames windows over the whole utterance.
+
+        Returns a (W, 1, n_mels, n_frames) strided view into the utterance's
+        normalized log-mel (no per-window copies) and the start time of each
+        window in seconds. Utterances up to n_frames long give one window,
+        identical to __call__.
+        """
+        mel_db, frames = self.normalized([waveform])
+        total = int(frames[0]) if len(waveform) else 0
+        if total <= self.n_frames:
+            return self([waveform]), np.zeros(1)
+
+        mel = mel_db[0, :, :total]
+        count = math.ceil((total - self.n_frames) / hop_frames) + 1
+        if max_windows:
+            count = min(count, max_windows)
+        if count == 1:
+            # A single window covers the middle of the utterance
+            stride = self.n_frames
+            offset = (total - self.n_frames) // 2
+        else:
+            # Even stride so the windows span the utterance; the few leftover frames are split between both ends
+            stride = (total - self.n_frames) // (count - 1)
+            offset = (total - self.n_frames - stride * (count - 1)) // 2
+
+        windows = mel[:, offset:].unfold(-1, self.n_frames, stride)[:, :count]  # (n_mels, W, n_frames)
+        starts = (offset + stride * np.arange(count)) * self.hop_length / self.sample_rate
+        return windows.permute(1, 0, 2).unsqueeze(1), starts
+
+    def normalized(self, waveforms: Sequence[np.ndarray]) -> Tuple[torch.Tensor, torch.Tensor]:
+        """(N, n_mels, T) standardized log-mel over the longest input, zero past each
+        utterance's end, and the number of valid frames of each utterance"""
+
+        lengths = [max(len(w), self.min_length) for w in waveforms]
+        batch = torch.zeros(len(waveforms), max(lengths), dtype=torch.float32)
+        for i, waveform in enumerate(waveforms):
+            if len(waveform):
+                batch[i, :len(waveform)] = torch.from_numpy(np.asarray(waveform, dtype=np.float32))
+
+        # Zero padding of shorter clips only adds trailing frames, which are masked out below
+        spectrum = torch.stft(
+            batch, n_fft=self.n_fft, hop_length=self.hop_length, window=self.window,
+            center=True, pad_mode="constant", return_complex=True
+        )
+        power = spectrum.real.square() + spectrum.imag.square()
+        mel = torch.matmul(self.mel_basis, power)  # (N, n_mels, T)
+
+        frames = torch.tensor([self._num_frames(length) for length in lengths])
+        valid = (torch.arange(mel.shape[-1]) < frames[:, None])[:, None, :]  # (N, 1, T)
+
+        # power_to_db(ref=np.max, top_db=80) per utterance
+        mel_db = 10.0 * torch.log10(torch.clamp(mel, min=AMIN))
+        ref = mel.masked_fill(~valid, 0.0).amax(dim=(1, 2), keepdim=True)
+        mel_db = mel_db - 10.0 * torch.log10(torch.clamp(ref, min=AMIN))
+        peak = mel_db.masked_fill(~valid, float("-inf")).amax(dim=(1, 2), keepdim=True)
+        mel_db = torch.maximum(mel_db, peak - TOP_DB)
+
+        # Standardize over the valid frames of each utterance
+        count = (frames * self.n_mels).to(torch.float32)[:, None, None]
+        masked = mel_db.masked_fill(~valid, 0.0)
+        mean = masked.sum(dim=(1, 2), keepdim=True) / count
+        var = ((mel_db - mean).masked_fill(~valid, 0.0).square()).sum(dim=(1, 2), keepdim=True) / count
+        std = var.sqrt()
+        mel_db = torch.where(std > 0, (mel_db - mean) / torch.where(std > 0, std, torch.ones_like(std)), mel_db)
+        mel_db = mel_db.masked_fill(~valid, 0.0)
+
+        # Empty inputs get the same all-zero tensor as before
+        empty = torch.tensor([len(w) == 0 for w in waveforms])
+        if empty.any():
+            mel_db[empty] = 0.0
+
+        return mel_db, frames
+
+@functools.lru_cache(maxsize=4)
+def get_mel_frontend(sample_rate: int) -> MelFrontend:
+    """Get the per-process front end for a sample rate (window and filterbank built once)"""
+    return MelFrontend(sample_rate)
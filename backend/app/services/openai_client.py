@@ -0,0 +1,57 @@
+import os
+from typing import Optional
+
+import httpx
+import openai
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_client: Optional[openai.AsyncOpenAI] = None
+
+def _build_http_client() -> httpx.AsyncClient:
+    """Build the pooled, kept-alive HTTP client shared by all OpenAI calls"""
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+    )
+    timeout = httpx.Timeout(
+        connect=float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5")),
+        read=float(os.getenv("OPENAI_READ_TIMEOUT", "30")),
+        write=float(os.getenv("OPENAI_WRITE_TIMEOUT", "30")),
+        pool=float(os.getenv("OPENAI_POOL_TIMEOUT", "10"))
+    )
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=HTTP2_AVAILABLE)
+
+def get_openai_client() -> openai.AsyncOpenAI:
+    """Get the process-wide async OpenAI client (shared by chat and Whisper)"""
+    global _client
+    if _client is None:
+        http_client = _build_http_client()
+        _client = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=http_client,
+            timeout=http_client.timeout,
+            max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+        )
+        print(f"OpenAI async client created (HTTP/2: {HTTP2_AVAILABLE})")
+    return _client
+
+async def prewarm_openai_client():
+    """Open a pooled TLS connection so the first user request skips the handshake"""
+    try:
+        await get_openai_client().models.list()
+        print("OpenAI client pre-warmed")
+    except Exception as e:
+        print(f"OpenAI client pre-warm failed: {e}")
+
+async def close_openai_client():
+    """Close the shared client and its connection pool"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+
+def audio_fingerprint(payload: Union[bytes, memoryview]) -> str:
+    """Fast content hash of a raw audio payload"""
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+class ResultCache:
+    """Analysis results (emotion, transcript, ...) keyed by audio fingerprint.
+
+    Clients retrying a failed request resend the exact same bytes, so the
+    results of one payload are kept for ttl seconds. At most max_entries
+    payloads are remembered; the least recently used one goes first.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("ANALYSIS_CACHE_TTL", "300"))
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "256"))
+
+        # fingerprint -> (expiry time, results by kind)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.counters = {"expired": 0, "evicted": 0, "skipped_decodes": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def _results(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, results = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.counters["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return results
+
+    def get(self, key: str, kind: str) -> Optional[Any]:
+        """Cached result of one kind for a payload"""
+        if not self.enabled:
+            return None
+        results = self._results(key)
+        value = results.get(kind) if results is not None else None
+        counter = self.hits if value is not None else self.misses
+        counter[kind] = counter.get(kind, 0) + 1
+        return value
+
+    def covers(self, key: str, kinds: Sequence[str]) -> bool:
+        """Whether results of all these kinds are cached (so the payload need not be decoded)"""
+        if not self.enabled or not kinds:
+            return False
+        results = self._results(key)
+        return results is not None and all(kind in results for kind in kinds)
+
+    def put(self, key: str, kind: str, value: Any):
+        """Remember a result; the payload's expiry is counted from its first result"""
+        if not self.enabled:
+            return
+        results = self._results(key)
+        if results is None:
+            results = {}
+            self._entries[key] = (time.monotonic() + self.ttl, results)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evicted"] += 1
+        results[kind] = value
+
+    def get_stats(self) -> dict:
+        """Hit/miss counts per result kind and expiry/eviction counters"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": dict(self.hits),
+            "misses": dict(self.misses),
+            **self.counters
+        }
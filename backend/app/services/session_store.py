@@ -0,0 +1,152 @@
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from app.models.chat_models import ChatMessage, ConversationSession, EmotionResponse
+
+# Rough per-object overhead of a pydantic message on top of its text
+MESSAGE_OVERHEAD_BYTES = 400
+SESSION_OVERHEAD_BYTES = 1024
+
+class SessionStore:
+    """Conversation sessions keyed by connection or session id.
+
+    Each session keeps at most max_history messages. When the cap is hit the
+    oldest trim_batch messages go at once, so the remaining history (and a
+    prompt built from it) stays unchanged for the next few turns; trimming
+    always cuts before a user message, so a history never opens with a
+    reply whose question is gone. An
+    optional render function turns each message into its prompt form once,
+    when it is stored. Sessions idle for more than idle_ttl seconds expire,
+    and once the estimated memory of all sessions exceeds max_bytes the
+    least recently used ones are evicted. The dict is kept in access order,
+    so both sweeps only look at the oldest entries.
+    """
+
+    def __init__(self, max_history: Optional[int] = None, idle_ttl: Optional[float] = None,
+                 max_bytes: Optional[int] = None, trim_batch: Optional[int] = None,
+                 render: Optional[Callable[[ChatMessage], Any]] = None):
+        self.max_history = max_history or int(os.getenv("SESSION_MAX_HISTORY", "10"))
+        trim_batch = trim_batch or int(os.getenv("SESSION_TRIM_BATCH", "4"))
+        self.trim_batch = min(max(trim_batch, 1), self.max_history)
+        self.render = render
+        self.idle_ttl = idle_ttl or float(os.getenv("SESSION_IDLE_TTL", "1800"))
+        self.max_bytes = max_bytes or int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self._last_seen: Dict[str, float] = {}
+        self._sizes: Dict[str, int] = {}
+        self._rendered: Dict[str, List[Any]] = {}
+        self.total_bytes = 0
+        self.counters = {"created": 0, "expired": 0, "evicted": 0, "closed": 0}
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: str) -> ConversationSession:
+        """Get a session, creating it if needed, and mark it as recently used"""
+        self._expire_idle()
+        session = self._sessions.get(session_id)
+        if session is None:
+            now = datetime.now().isoformat()
+            session = ConversationSession(session_id=session_id, created_at=now, updated_at=now)
+            self._sessions[session_id] = session
+            self._rendered[session_id] = []
+            self._sizes[session_id] = SESSION_OVERHEAD_BYTES
+            self.total_bytes += SESSION_OVERHEAD_BYTES
+            self.counters["created"] += 1
+        else:
+            self._sessions.move_to_end(session_id)
+        self._last_seen[session_id] = time.monotonic()
+        return session
+
+    def append(self, session_id: str, *messages: ChatMessage) -> ConversationSession:
+        """Add messages (usually a user turn and its reply) to a session, keeping
+        its history and the store within limits"""
+        session = self.get(session_id)
+        for message in messages:
+            session.messages.append(message)
+            if self.render is not None:
+                self._rendered[session_id].append(self.render(message))
+            if message.emotion is not None:
+                session.current_emotion = message.emotion
+                session.emotion_history.append(
+                    EmotionResponse(emotion=message.emotion, confidence=message.confidence or 0.0)
+                )
+            session.updated_at = message.timestamp or datetime.now().isoformat()
+
+        # Keep history within limits, dropping whole turns
+        if len(session.messages) > self.max_history:
+            cut = len(session.messages) - (self.max_history - self.trim_batch + 1)
+            while cut < len(session.messages) and session.messages[cut].role != "user":
+                cut += 1
+            del session.messages[:cut]
+            del self._rendered[session_id][:cut]
+        if len(session.emotion_history) > self.max_history:
+            del session.emotion_history[:-self.max_history]
+
+        self._resize(session)
+        self._evict_to_ceiling(keep=session_id)
+        return session
+
+    def rendered(self, session_id: str) -> List[Any]:
+        """Rendered form of the session's messages, oldest first"""
+        self.get(session_id)
+        return self._rendered[session_id]
+
+    def close(self, session_id: str):
+        """Drop a session (e.g. when its connection ends)"""
+        if self._remove(session_id):
+            self.counters["closed"] += 1
+
+    def _resize(self, session: ConversationSession):
+        # Rendered messages hold roughly another copy of the text
+        copies = 2 if self.render is not None else 1
+        size = SESSION_OVERHEAD_BYTES + sum(
+            copies * len(message.text.encode()) + MESSAGE_OVERHEAD_BYTES for message in session.messages
+        ) + MESSAGE_OVERHEAD_BYTES * len(session.emotion_history)
+        self.total_bytes += size - self._sizes[session.session_id]
+        self._sizes[session.session_id] = size
+
+    def _remove(self, session_id: str) -> bool:
+        if self._sessions.pop(session_id, None) is None:
+            return False
+        self._last_seen.pop(session_id, None)
+        self._rendered.pop(session_id, None)
+        self.total_bytes -= self._sizes.pop(session_id, 0)
+        return True
+
+    def _expire_idle(self):
+        deadline = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            oldest = next(iter(self._sessions))
+            if self._last_seen[oldest] > deadline:
+                break
+            self._remove(oldest)
+            self.counters["expired"] += 1
+
+    def _evict_to_ceiling(self, keep: str):
+        while self.total_bytes > self.max_bytes and len(self._sessions) > 1:
+            oldest = next(iter(self._sessions))
+            if oldest == keep:
+                break
+            self._remove(oldest)
+            self.counters["evicted"] += 1
+
+    def get_stats(self) -> dict:
+        """Live sessions, estimated memory and lifetime counters"""
+        self._expire_idle()
+        return {
+            "live_sessions": len(self._sessions),
+            "estimated_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "max_history": self.max_history,
+            "trim_batch": self.trim_batch,
+            "idle_ttl": self.idle_ttl,
+            **self.counters
+        }
@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+class TTSCache:
+    """Content-addressed cache for synthesized speech.
+
+    Entries are keyed by a hash of everything that determines the audio
+    (text, voice id, model id, voice settings). A memory LRU bounded by
+    max_bytes sits in front of an optional directory on disk, which keeps
+    audio across restarts and is pruned oldest-first once it exceeds
+    disk_max_bytes. Concurrent misses for the same key share one call to
+    the producer (single flight). File work runs in worker threads, which
+    only report back; sizes and counters are updated on the event loop.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, disk_dir: Optional[str] = None,
+                 disk_max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("TTS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+        disk_dir = disk_dir if disk_dir is not None else os.getenv("TTS_CACHE_DIR", "")
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes if disk_max_bytes is not None else int(os.getenv("TTS_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.total_bytes = 0
+        self.disk_bytes = 0
+        self._pruning = False
+        self.counters = {
+            "memory_hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0,
+            "stores": 0, "evictions": 0, "disk_evictions": 0, "errors": 0
+        }
+
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self.disk_bytes = sum(path.stat().st_size for path in self.disk_dir.glob("*.audio"))
+
+    @staticmethod
+    def make_key(text: str, voice_id: str, model_id: str, voice_settings: dict) -> str:
+        """Stable key for one synthesis request"""
+        payload = json.dumps(
+            {"text": text, "voice_id": voice_id, "model_id": model_id, "voice_settings": voice_settings},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Cached audio for a key, from memory or disk"""
+        audio = self._entries.get(key)
+        if audio is not None:
+            self._entries.move_to_end(key)
+            self.counters["memory_hits"] += 1
+            return audio
+
+        if self.disk_dir is not None:
+            audio = await asyncio.to_thread(self._read_disk, key)
+            if audio is not None:
+                self.counters["disk_hits"] += 1
+                self._put_memory(key, audio)
+                return audio
+        return None
+
+    async def lookup(self, key: str) -> Optional[bytes]:
+        """Cached audio for a key, waiting for a synthesis of it already in flight.
+
+        Returns None when the caller has to synthesize; it should then
+        claim() the key before its next await so later callers wait for it.
+        If the in-flight synthesis fails, waiters get its exception.
+        """
+        while True:
+            audio = await self.get(key)
+            if audio is not None:
+                return audio
+
+            pending = self._inflight.get(key)
+            if pending is None:
+                return None
+            self.counters["coalesced"] += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if not pending.cancelled():
+                    raise
+                # The caller producing the audio went away; try again ourselves
+
+    def claim(self, key: str):
+        """Register the caller as the one synthesizing key"""
+        self.counters["misses"] += 1
+        self._inflight[key] = asyncio.get_running_loop().create_future()
+
+    async def complete(self, key: str, audio: bytes):
+        """Store the claimed key's audio and hand it to the waiters"""
+        future = self._inflight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(audio)
+        await self.put(key, audio)
+
+    def abandon(self, key: str, error: Optional[BaseException] = None):
+        """Give up a claimed key; waiters get error, or retry themselves if there is none"""
+        future = self._inflight.pop(key, None)
+        if future is None or future.done():
+            return
+        if error is None:
+            future.cancel()
+        else:
+            self.counters["errors"] += 1
+            future.set_exception(error)
+            # Mark retrieved so an exception nobody waited for is not logged
+            future.exception()
+
+    async def get_or_create(self, key: str, produce: Callable[[], Awaitable[bytes]]) -> bytes:
+        """Cached audio for a key, calling produce() once on a miss.
+
+        Callers arriving while the producer runs wait for its result; if it
+        raises, every waiter gets the exception and nothing is stored.
+        """
+        audio = await self.lookup(key)
+        if audio is not None:
+            return audio
+
+        self.claim(key)
+        try:
+            audio = await produce()
+        except asyncio.CancelledError:
+            self.abandon(key)
+            raise
+        except Exception as e:
+            self.abandon(key, e)
+            raise
+        await self.complete(key, audio)
+        return audio
+
+    async def put(self, key: str, audio: bytes):
+        """Store audio in memory and, if configured, on disk"""
+        if not audio:
+            return
+        self.counters["stores"] += 1
+        self._put_memory(key, audio)
+        if self.disk_dir is not None:
+            try:
+                written = await asyncio.to_thread(self._write_disk, key, audio)
+                self.disk_bytes += written
+                if self.disk_bytes > self.disk_max_bytes and not self._pruning:
+                    self._pruning = True
+                    try:
+                        self.disk_bytes, evicted = await asyncio.to_thread(self._prune_disk)
+                    finally:
+                        self._pruning = False
+                    self.counters["disk_evictions"] += evicted
+            except OSError as e:
+                print(f"TTS cache disk write failed: {e}")
+
+    def _put_memory(self, key: str, audio: bytes):
+        if len(audio) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.total_bytes -= len(previous)
+        self._entries[key] = audio
+        self.total_bytes += len(audio)
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= len(evicted)
+            self.counters["evictions"] += 1
+
+    def _path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.audio"
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            audio = path.read_bytes()
+        except OSError:
+            return None
+        # Refresh the access time used for pruning
+        os.utime(path)
+        return audio
+
+    def _write_disk(self, key: str, audio: bytes) -> int:
+        """Write an entry's file; returns the bytes added"""
+        path = self._path(key)
+        if path.exists():
+            return 0
+        tmp = path.with_suffix(".tmp")
+        tmp.write_bytes(audio)
+        os.replace(tmp, path)
+        return len(audio)
+
+    def _prune_disk(self) -> Tuple[int, int]:
+        """Delete the least recently used files down to disk_max_bytes; returns
+        the bytes left on disk and the number of files deleted"""
+        files = sorted(self.disk_dir.glob("*.audio"), key=lambda p: p.stat().st_mtime)
+        disk_bytes = sum(path.stat().st_size for path in files)
+        evicted = 0
+        for path in files:
+            if disk_bytes <= self.disk_max_bytes:
+                break
+            size = path.stat().st_size
+            path.unlink(missing_ok=True)
+            disk_bytes -= size
+            evicted += 1
+        return disk_bytes, evicted
+
+    def get_stats(self) -> dict:
+        """Hit/miss/eviction counters and current sizes"""
+        lookups = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["misses"] + self.counters["coalesced"]
+        hits = lookups - self.counters["misses"]
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "disk_dir": str(self.disk_dir) if self.disk_dir is not None else None,
+            "disk_bytes": self.disk_bytes,
+            "inflight": len(self._inflight),
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            **self.counters
+        }
@@ -0,0 +1,105 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+Segment = Tuple[float, float]
+
+# Band used for the spectral flatness measure
+SPEECH_BAND_HZ = (300.0, 3400.0)
+
+class VadConfig:
+    """Voice activity detection thresholds (see env.example for the VAD_* variables)"""
+
+    def __init__(self, frame_ms: float = 30.0, hop_ms: float = 10.0,
+                 energy_margin_db: Optional[float] = None, min_dbfs: Optional[float] = None,
+                 peak_margin_db: float = 6.0, max_flatness: Optional[float] = None,
+                 padding_ms: Optional[float] = None, max_pause_ms: Optional[float] = None,
+                 min_speech_ms: Optional[float] = None):
+        self.frame_ms = frame_ms
+        self.hop_ms = hop_ms
+        # Speech is this far above the noise floor (10th percentile frame energy) ...
+        self.energy_margin_db = energy_margin_db if energy_margin_db is not None else float(os.getenv("VAD_ENERGY_MARGIN_DB", "10"))
+        # ... and above an absolute floor. A clip without quiet frames (continuous speech)
+        # has its floor near the peak, so frames within peak_margin_db of the peak also count
+        self.min_dbfs = min_dbfs if min_dbfs is not None else float(os.getenv("VAD_MIN_DBFS", "-55"))
+        self.peak_margin_db = peak_margin_db
+        # Spectral flatness near 1 is noise-like, speech is well below
+        self.max_flatness = max_flatness if max_flatness is not None else float(os.getenv("VAD_MAX_FLATNESS", "0.35"))
+        # Silence kept around speech, pauses kept intact, and the shortest burst counted as speech
+        self.padding_ms = padding_ms if padding_ms is not None else float(os.getenv("VAD_PADDING_MS", "150"))
+        self.max_pause_ms = max_pause_ms if max_pause_ms is not None else float(os.getenv("VAD_MAX_PAUSE_MS", "400"))
+        self.min_speech_ms = min_speech_ms if min_speech_ms is not None else float(os.getenv("VAD_MIN_SPEECH_MS", "90"))
+
+def frame_features(pcm: np.ndarray, sample_rate: int, config: VadConfig) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-frame energy (dBFS) and spectral flatness, computed over all frames at once"""
+    frame = int(sample_rate * config.frame_ms / 1000)
+    hop = int(sample_rate * config.hop_ms / 1000)
+    frames = sliding_window_view(pcm.astype(np.float32, copy=False), frame)[::hop]
+
+    energy_db = 10.0 * np.log10(np.mean(frames.astype(np.float64) ** 2, axis=1) + 1e-10)
+
+    # Flatness within the speech band only: the filter chain band-limits everything,
+    # which would make noise look peaky over the full spectrum
+    power = np.abs(np.fft.rfft(frames * np.hanning(frame).astype(np.float32), axis=1)) ** 2 + 1e-12
+    freqs = np.fft.rfftfreq(frame, 1.0 / sample_rate)
+    band = power[:, (freqs >= SPEECH_BAND_HZ[0]) & (freqs <= SPEECH_BAND_HZ[1])]
+    flatness = np.exp(np.mean(np.log(band), axis=1)) / np.mean(band, axis=1)
+    return energy_db, flatness
+
+def detect_speech(pcm: np.ndarray, sample_rate: int, config: Optional[VadConfig] = None) -> List[Segment]:
+    """Speech segments (start, end) in seconds; empty if the clip holds no speech"""
+    config = config or VadConfig()
+    if len(pcm) < int(sample_rate * config.frame_ms / 1000):
+        return []
+
+    energy_db, flatness = frame_features(pcm, sample_rate, config)
+    floor = np.percentile(energy_db, 10)
+    threshold = max(config.min_dbfs, min(floor + config.energy_margin_db, energy_db.max() - config.peak_margin_db))
+    speech = (energy_db > threshold) & (flatness < config.max_flatness)
+    if not speech.any():
+        return []
+
+    # Pad speech frames on both sides (hangover), then find contiguous runs
+    hop_s = config.hop_ms / 1000
+    pad = int(round(config.padding_ms / config.hop_ms))
+    active = np.convolve(speech.astype(np.int32), np.ones(2 * pad + 1, dtype=np.int32), mode="same") > 0
+    edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    # Drop runs with too little actual speech in them (clicks, bumps)
+    counts = np.concatenate(([0], np.cumsum(speech)))
+    voiced = counts[ends] - counts[starts]
+    keep = voiced * config.hop_ms >= config.min_speech_ms
+    starts, ends = starts[keep], ends[keep]
+    if len(starts) == 0:
+        return []
+
+    # Short pauses stay; longer ones are cut down to the padding on either side
+    max_pause = int(round(config.max_pause_ms / config.hop_ms))
+    gaps = starts[1:] - ends[:-1]
+    split = np.flatnonzero(gaps > max_pause)
+    starts = np.concatenate((starts[:1], starts[1:][split]))
+    ends = np.concatenate((ends[:-1][split], ends[-1:]))
+
+    frame_s = config.frame_ms / 1000
+    duration = len(pcm) / sample_rate
+    return [(float(s * hop_s), float(min(e * hop_s + frame_s - hop_s, duration))) for s, e in zip(starts, ends)]
+
+def cut_segments(pcm: np.ndarray, sample_rate: int, segments: List[Segment]) -> np.ndarray:
+    """Concatenate the given segments of a signal"""
+    parts = [pcm[int(round(start * sample_rate)):int(round(end * sample_rate))] for start, end in segments]
+    return np.concatenate(parts) if parts else pcm[:0]
+
+def speech_report(duration: float, segments: List[Segment]) -> Dict[str, float]:
+    """How much audio the VAD kept and removed"""
+    kept = sum((end - start for start, end in segments), 0.0)
+    return {
+        "input_s": round(duration, 3),
+        "speech_s": round(kept, 3),
+        "removed_s": round(duration - kept, 3),
+        "removed_ratio": round((duration - kept) / duration, 3) if duration > 0 else 0.0,
+        "segments": len(segments)
+    }
@@ -1,27 +1,28 @@
-import openai
-import requests
+import asyncio
 import os
 import io
 import base64
-import tempfile
 import soundfile as sf
 import numpy as np
-from typing import Optional
+from typing import AsyncIterator, Optional, Union
 import json
-import subprocess
-import shutil
+
+from app.services.audio_service import AudioService, DecodedAudio
+from app.services.openai_client import get_openai_client
+from app.services.elevenlabs_client import get_elevenlabs_client
+from app.services.tts_cache import TTSCache
 
 class VoiceService:
     """Voice service, integrating Whisper and ElevenLabs"""
     
-    def __init__(self):
-        self.openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(self, audio_service: Optional[AudioService] = None):
+        self.openai_client = get_openai_client()
         self.elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY")
-        self.elevenlabs_base_url = "https://api.elevenlabs.io/v1"
+        self.elevenlabs_client = get_elevenlabs_client()
         
-        # Find FFmpeg path
-        self.ffmpeg_path = shutil.which('ffmpeg') or '/opt/homebrew/bin/ffmpeg'
-        print(f"Using FFmpeg at: {self.ffmpeg_path}")
+        # Shared decoding stage; Whisper gets the 16 kHz view
+        self.audio_service = audio_service or AudioService()
+        self.stt_sample_rate = 16000
         
         # ElevenLabs voice configuration
         self.voice_settings = {
@@ -31,8 +32,15 @@ class VoiceService:
             "use_speaker_boost": True
         }
         
+        # Chunk size forwarded to clients when streaming synthesis
+        self.stream_chunk_size = int(os.getenv("TTS_STREAM_CHUNK_SIZE", "4096"))
+        
         # Default voice ID (English female voice)
         self.default_voice_id = "21m00Tcm4TlvDq8ikWAM"  # Rachel voice
+        self.model_id = "eleven_multilingual_v2"
+        
+        # Synthesized audio keyed by (text, voice, model, settings); canned replies repeat a lot
+        self.tts_cache = TTSCache()
         
         # Emotion-based voice settings
         self.emotion_voice_settings = {
@@ -46,89 +54,71 @@ class VoiceService:
             "excited": {"stability": 0.4, "similarity_boost": 0.8, "style": 0.4}
         }
     
-    def _convert_audio_format(self, audio_data: bytes, target_format: str = "wav") -> bytes:
-        """Convert audio data to target format using FFmpeg"""
-        try:
-            # Create temporary files
-            with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as input_file:
-                input_file.write(audio_data)
-                input_path = input_file.name
-            
-            with tempfile.NamedTemporaryFile(suffix=f".{target_format}", delete=False) as output_file:
-                output_path = output_file.name
-            
-            # Use FFmpeg to convert with audio filters for better quality
-            cmd = [
-                self.ffmpeg_path, "-y",  # Overwrite output file
-                "-i", input_path,  # Input file
-                "-acodec", "pcm_s16le",  # PCM 16-bit
-                "-ar", "16000",  # Sample rate 16kHz
-                "-ac", "1",  # Mono
-                "-af", "highpass=f=200,lowpass=f=3000,volume=1.5",  # Audio filters for better quality
-                output_path  # Output file
-            ]
-            
-            print(f"Running FFmpeg command: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                # Read converted audio
-                with open(output_path, "rb") as f:
-                    converted_audio = f.read()
-                
-                print(f"Audio conversion successful: {len(converted_audio)} bytes")
-                
-                # Clean up temporary files
-                os.unlink(input_path)
-                os.unlink(output_path)
-                
-                return converted_audio
-            else:
-                print(f"FFmpeg conversion failed: {result.stderr}")
-                # Clean up and return original
-                os.unlink(input_path)
-                os.unlink(output_path)
-                return audio_data
-                
-        except Exception as e:
-            print(f"Audio conversion failed: {e}")
-            return audio_data
-    
-    async def speech_to_text(self, audio_data: bytes) -> str:
+    async def speech_to_text(self, audio_data: Union[bytes, DecodedAudio]) -> str:
         """Use Whisper to convert speech to text"""
         try:
-            # Convert audio to WAV format for better compatibility
-            wav_audio = self._convert_audio_format(audio_data, "wav")
+            # A retry of the same payload reuses the earlier transcript (and skips the paid call)
+            fingerprint = self.audio_service.fingerprint(audio_data)
+            cached = self.audio_service.results.get(fingerprint, "transcript")
+            if cached is not None:
+                print(f"Speech to text result (cached): '{cached}'")
+                return cached
             
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                temp_file.write(wav_audio)
-                temp_file_path = temp_file.name
+            audio = await self.audio_service.ensure_decoded(audio_data)
+
+            # Upload the 16 kHz view as WAV, or the original payload if decoding failed
+            wav_audio = audio.to_wav(self.stt_sample_rate) if audio.ok else audio.raw
             
-            print(f"Created temporary WAV file: {temp_file_path} ({len(wav_audio)} bytes)")
+            print(f"Uploading in-memory WAV to Whisper ({len(wav_audio)} bytes)")
             
             # Use OpenAI Whisper API with optimized settings
-            with open(temp_file_path, "rb") as audio_file:
-                transcript = self.openai_client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    language="zh",  # Use Chinese for better accuracy
-                    response_format="text",
-                    temperature=0.0,  # Lower temperature for more consistent results
-                    prompt="This is a conversation in Chinese and English."  # Help with context
-                )
-            
-            # Clean up temporary file
-            os.unlink(temp_file_path)
+            transcript = await self.openai_client.audio.transcriptions.create(
+                model="whisper-1",
+                file=("speech.wav", bytes(wav_audio)),
+                language="zh",  # Use Chinese for better accuracy
+                response_format="text",
+                temperature=0.0,  # Lower temperature for more consistent results
+                prompt="This is a conversation in Chinese and English."  # Help with context
+            )
             
             result = transcript.strip()
             print(f"Speech to text result: '{result}'")
+            self.audio_service.results.put(fingerprint, "transcript", result)
             return result
             
         except Exception as e:
             print(f"Speech to text failed: {e}")
             return "Sorry, I didn't catch that. Could you please repeat?"
     
+    @property
+    def supports_streaming(self) -> bool:
+        """Whether synthesis can be streamed (and pipelined per sentence)"""
+        return self.elevenlabs_client is not None
+    
+    def _get_voice_settings(self, emotion: Optional[str] = None) -> dict:
+        """Get voice settings adjusted for the emotion"""
+        voice_settings = self.voice_settings.copy()
+        if emotion and emotion in self.emotion_voice_settings:
+            voice_settings.update(self.emotion_voice_settings[emotion])
+        return voice_settings
+    
+    def _tts_request(self, text: str, emotion: Optional[str] = None) -> tuple:
+        """ElevenLabs request body and its cache key"""
+        data = {
+            "text": text,
+            "model_id": self.model_id,
+            "voice_settings": self._get_voice_settings(emotion)
+        }
+        key = TTSCache.make_key(text, self.default_voice_id, self.model_id, data["voice_settings"])
+        return key, data
+    
+    async def _synthesize(self, data: dict) -> bytes:
+        """One ElevenLabs synthesis call; raises if it does not return audio"""
+        response = await self.elevenlabs_client.text_to_speech(self.default_voice_id, data)
+        if response.status_code != 200:
+            raise RuntimeError(f"ElevenLabs API error: {response.status_code}")
+        return response.content
+    
     async def text_to_speech(self, text: str, emotion: Optional[str] = None) -> bytes:
         """Use ElevenLabs to convert text to speech"""
         try:
@@ -136,38 +126,67 @@ class VoiceService:
                 print("ElevenLabs API key not configured, using fallback TTS")
                 return self._fallback_tts(text)
             
-            # Adjust voice settings based on emotion
-            voice_settings = self.voice_settings.copy()
-            if emotion and emotion in self.emotion_voice_settings:
-                voice_settings.update(self.emotion_voice_settings[emotion])
-            
-            # Call ElevenLabs API
-            url = f"{self.elevenlabs_base_url}/text-to-speech/{self.default_voice_id}"
-            
-            headers = {
-                "Accept": "audio/mpeg",
-                "Content-Type": "application/json",
-                "xi-api-key": self.elevenlabs_api_key
-            }
-            
-            data = {
-                "text": text,
-                "model_id": "eleven_multilingual_v2",
-                "voice_settings": voice_settings
-            }
-            
-            response = requests.post(url, json=data, headers=headers)
-            
-            if response.status_code == 200:
-                return response.content
-            else:
-                print(f"ElevenLabs API error: {response.status_code}")
-                return self._fallback_tts(text)
+            # Adjust voice settings based on emotion; identical requests share one call
+            key, data = self._tts_request(text, emotion)
+            return await self.tts_cache.get_or_create(key, lambda: self._synthesize(data))
                 
+        except asyncio.TimeoutError:
+            print("Text to speech failed: ElevenLabs request deadline exceeded")
+            return self._fallback_tts(text)
         except Exception as e:
             print(f"Text to speech failed: {e}")
             return self._fallback_tts(text)
     
+    async def text_to_speech_stream(self, text: str, emotion: Optional[str] = None) -> AsyncIterator[bytes]:
+        """Use ElevenLabs streaming synthesis, yielding audio chunks as they arrive"""
+        if not self.elevenlabs_api_key:
+            print("ElevenLabs API key not configured, using fallback TTS")
+            yield self._fallback_tts(text)
+            return
+        
+        key, data = self._tts_request(text, emotion)
+        try:
+            cached = await self.tts_cache.lookup(key)
+        except Exception:
+            # The synthesis we waited for failed; stream our own
+            cached = None
+        if cached is not None:
+            for start in range(0, len(cached), self.stream_chunk_size):
+                yield cached[start:start + self.stream_chunk_size]
+            return
+        
+        self.tts_cache.claim(key)
+        chunks = []
+        completed = False
+        try:
+            async for chunk in self.elevenlabs_client.stream_text_to_speech(
+                self.default_voice_id, data, chunk_size=self.stream_chunk_size
+            ):
+                if chunk:
+                    chunks.append(chunk)
+                    yield chunk
+            completed = bool(chunks)
+        except asyncio.TimeoutError:
+            print("Streaming text to speech failed: ElevenLabs request deadline exceeded")
+        except Exception as e:
+            print(f"Streaming text to speech failed: {e}")
+        finally:
+            # Only a stream that ran to completion is cached (and shared with waiters)
+            if not completed:
+                self.tts_cache.abandon(key)
+        
+        if completed:
+            await self.tts_cache.complete(key, b"".join(chunks))
+        
+        # Nothing reached the client yet; fall back to local audio
+        if not chunks:
+            yield self._fallback_tts(text)
+    
+    async def warm_up(self, audio: DecodedAudio):
+        """Exercise the Whisper upload encoding and the local fallback TTS without calling any API"""
+        audio.to_wav(self.stt_sample_rate)
+        self._fallback_tts("warm up")
+    
     def _fallback_tts(self, text: str) -> bytes:
         """Fallback TTS method (using system TTS or return empty audio)"""
         try:
@@ -195,16 +214,13 @@ class VoiceService:
             # Return empty bytes
             return b""
     
-    def get_available_voices(self) -> list:
+    async def get_available_voices(self) -> list:
         """Get available voice list"""
         try:
             if not self.elevenlabs_api_key:
                 return []
             
-            url = f"{self.elevenlabs_base_url}/voices"
-            headers = {"xi-api-key": self.elevenlabs_api_key}
-            
-            response = requests.get(url, headers=headers)
+            response = await self.elevenlabs_client.list_voices()
             
             if response.status_code == 200:
                 voices = response.json().get("voices", [])
@@ -223,6 +239,10 @@ class VoiceService:
             print(f"Failed to get voice list: {e}")
             return []
     
+    def get_stats(self) -> dict:
+        """TTS cache statistics"""
+        return {"tts_cache": self.tts_cache.get_stats()}
+    
     def set_voice(self, voice_id: str):
         """Set voice ID"""
         self.default_voice_id = voice_id
@@ -231,6 +251,11 @@ class VoiceService:
         """Set voice parameters"""
         self.voice_settings.update(settings)
     
+    @staticmethod
+    def get_audio_mime_type(audio_data: bytes) -> str:
+        """Guess the MIME type of synthesized audio from its first bytes"""
+        return "audio/wav" if audio_data[:4] == b"RIFF" else "audio/mpeg"
+    
     def get_audio_duration(self, audio_data: bytes) -> float:
         """Get audio duration"""
         try:
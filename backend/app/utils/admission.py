@@ -0,0 +1,163 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, Optional
+
+# Pipeline stages with their own limits and their default concurrency / queue-depth
+# thresholds (STAGE_<NAME>_CONCURRENCY / _MAX_QUEUE override them)
+DEFAULT_STAGE_LIMITS = {
+    "decode": (os.cpu_count() or 1, 32),
+    # Utterances being streamed in; their decoder threads mostly wait for the
+    # next chunk, so this only bounds how many can be open at once
+    "stream": (256, 256),
+    "emotion": (32, 64),
+    "stt": (8, 16),
+    "chat": (8, 16),
+    "tts": (8, 16)
+}
+
+class StageLimiter:
+    """Lets at most max_concurrency callers into a stage; the rest wait in line.
+
+    Callers waiting for a slot are the stage's queue depth. The limiter never
+    refuses anyone itself; admission control looks at max_queue to turn new
+    work away before it joins a line that is already too long.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int):
+        if max_concurrency < 1:
+            raise ValueError(f"{name}: max_concurrency must be at least 1")
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.completed = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def saturated(self) -> bool:
+        return self.waiting >= self.max_queue
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        return self._slots
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        slots = self._get_slots()
+        if slots.locked():
+            # Only callers that actually have to wait count towards the queue depth
+            self.waiting += 1
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+            try:
+                await slots.acquire()
+            finally:
+                self.waiting -= 1
+        else:
+            await slots.acquire()
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now, for work that holds it
+        beyond one call; the holder must release() it"""
+        slots = self._get_slots()
+        if slots.locked():
+            return False
+        await slots.acquire()  # free, so this does not wait
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        self.completed += 1
+        self._slots.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "peak_waiting": self.peak_waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "completed": self.completed
+        }
+
+class AdmissionController:
+    """Per-stage concurrency limits plus a cap on requests in flight.
+
+    New work is admitted only while fewer than max_inflight requests are
+    being processed and none of the stages it needs has a queue at its
+    threshold; otherwise it is shed right away instead of slowing every
+    request down together.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, tuple]] = None, max_inflight: Optional[int] = None):
+        limits = limits if limits is not None else DEFAULT_STAGE_LIMITS
+        self.stages = {
+            name: StageLimiter(
+                name,
+                int(os.getenv(f"STAGE_{name.upper()}_CONCURRENCY", str(concurrency))),
+                int(os.getenv(f"STAGE_{name.upper()}_MAX_QUEUE", str(max_queue)))
+            )
+            for name, (concurrency, max_queue) in limits.items()
+        }
+        self.max_inflight = max_inflight if max_inflight is not None else int(os.getenv("ADMISSION_MAX_INFLIGHT", "64"))
+        self.inflight = 0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+
+    def check(self, stages: Optional[Iterable[str]] = None) -> Optional[str]:
+        """Why new work needing these stages (all by default) would be shed, or None to admit it"""
+        reason = None
+        if self.inflight >= self.max_inflight:
+            reason = "inflight"
+        else:
+            for name in (stages if stages is not None else self.stages):
+                if self.stages[name].saturated:
+                    reason = name
+                    break
+        if reason is not None:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return reason
+
+    @asynccontextmanager
+    async def request(self) -> AsyncIterator[None]:
+        """Count one admitted request as in flight"""
+        self.inflight += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+
+    def limit(self, stage: str):
+        """Context manager holding a slot of a stage"""
+        return self.stages[stage].slot()
+
+    async def try_acquire(self, stage: str) -> bool:
+        """Take a free slot of a stage without waiting; a stage without one counts as a rejection"""
+        if await self.stages[stage].try_acquire():
+            return True
+        self.rejected[stage] = self.rejected.get(stage, 0) + 1
+        return False
+
+    def release(self, stage: str):
+        """Give back a slot taken with try_acquire()"""
+        self.stages[stage].release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue-depth and concurrency gauges per stage plus admission counters"""
+        return {
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "stages": {name: limiter.get_stats() for name, limiter in self.stages.items()}
+        }
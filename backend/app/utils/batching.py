@@ -0,0 +1,196 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+BatchFn = Callable[[List[Any]], Awaitable[List[Any]]]
+
+class MicroBatcher:
+    """Gathers concurrent requests into batches for one model forward pass.
+
+    A batch is dispatched as soon as it holds max_batch_size items or the
+    oldest item has waited max_wait_ms. Results are scattered back to the
+    callers in submission order. At most max_concurrency batches are in
+    flight; while they run, new requests keep accumulating into the next
+    batch, so batches grow with load. Batch sizes count items; rows_of(item)
+    tells the statistics how many rows an item adds to the forward pass
+    when that differs (default 1).
+    """
+
+    def __init__(self, process_batch: BatchFn, max_batch_size: int = 16, max_wait_ms: float = 5.0,
+                 max_concurrency: int = 1, name: str = "batcher",
+                 rows_of: Optional[Callable[[Any], int]] = None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.max_concurrency = max(1, max_concurrency)
+        self.name = name
+        self.rows_of = rows_of
+
+        self._queue: Deque[Tuple[Any, asyncio.Future, float]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._inflight: set = set()
+        self.stats = BatchStats(max_batch_size)
+
+    def _ensure_started(self):
+        if self._collector is None or self._collector.done():
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._collector = asyncio.create_task(self._collect())
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result"""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((item, future, time.perf_counter()))
+        self._wakeup.set()
+        return await future
+
+    async def _collect(self):
+        while True:
+            while not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            # Wait for a free slot first: requests arriving meanwhile join this batch
+            await self._slots.acquire()
+            deadline = self._queue[0][2] + self.max_wait_ms / 1000
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            batch = []
+            while self._queue and len(batch) < self.max_batch_size:
+                batch.append(self._queue.popleft())
+            # Callers cancelled while queued do not take part
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                self._slots.release()
+                continue
+
+            task = asyncio.create_task(self._run_batch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _run_batch(self, batch: List[Tuple[Any, asyncio.Future, float]]):
+        started = time.perf_counter()
+        try:
+            items = [item for item, _, _ in batch]
+            rows = sum(self.rows_of(item) for item in items) if self.rows_of is not None else len(items)
+            self.stats.record_batch(len(batch), rows, [(started - queued) * 1000 for _, _, queued in batch])
+            try:
+                results = await self.process_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name}: got {len(results)} results for {len(items)} items")
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self.stats.record_run((time.perf_counter() - started) * 1000)
+            self._slots.release()
+
+    async def close(self):
+        """Stop collecting and fail whatever is still queued"""
+        if self._collector is not None:
+            self._collector.cancel()
+            await asyncio.gather(self._collector, *self._inflight, return_exceptions=True)
+            self._collector = None
+        while self._queue:
+            _, future, _ = self._queue.popleft()
+            if not future.done():
+                future.set_exception(RuntimeError(f"{self.name} closed"))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Batch-size and queue-wait statistics plus the current configuration"""
+        return {
+            "name": self.name,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": len(self._queue),
+            "inflight_batches": len(self._inflight),
+            **self.stats.snapshot()
+        }
+
+class BatchStats:
+    """Running batch-size histogram and queue-wait percentiles (recent window).
+
+    Items are the requests in a batch, rows what the forward pass actually
+    processes (several per item when an item carries several inputs).
+    """
+
+    def __init__(self, max_batch_size: int, window: int = 1024):
+        self.batches = 0
+        self.items = 0
+        self.rows = 0
+        self.max_rows = 0
+        self.size_histogram = [0] * (max_batch_size + 1)
+        self._waits: Deque[float] = deque(maxlen=window)
+        self._runs: Deque[float] = deque(maxlen=window)
+
+    def record_batch(self, size: int, rows: int, waits_ms: List[float]):
+        self.batches += 1
+        self.items += size
+        self.rows += rows
+        self.max_rows = max(self.max_rows, rows)
+        self.size_histogram[size] += 1
+        self._waits.extend(waits_ms)
+
+    def record_run(self, elapsed_ms: float):
+        self._runs.append(elapsed_ms)
+
+    @staticmethod
+    def _percentiles(values: Deque[float]) -> Dict[str, float]:
+        if not values:
+            return {"avg": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+        ordered = sorted(values)
+        pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+        return {
+            "avg": round(sum(ordered) / len(ordered), 2),
+            "p50": round(pick(0.5), 2),
+            "p95": round(pick(0.95), 2),
+            "max": round(ordered[-1], 2)
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "batch_size_histogram": {
+                str(size): count for size, count in enumerate(self.size_histogram) if count
+            },
+            "rows": self.rows,
+            "avg_rows_per_batch": round(self.rows / self.batches, 2) if self.batches else 0.0,
+            "max_rows_per_batch": self.max_rows,
+            "queue_wait_ms": self._percentiles(self._waits),
+            "batch_run_ms": self._percentiles(self._runs)
+        }
+
+def batcher_config_from_env(prefix: str, default_size: int = 16, default_wait_ms: float = 5.0) -> Dict[str, Any]:
+    """Read <PREFIX>_MAX_SIZE / _MAX_WAIT_MS / _CONCURRENCY from the environment"""
+    config = {
+        "max_batch_size": int(os.getenv(f"{prefix}_MAX_SIZE", str(default_size))),
+        "max_wait_ms": float(os.getenv(f"{prefix}_MAX_WAIT_MS", str(default_wait_ms)))
+    }
+    concurrency = os.getenv(f"{prefix}_CONCURRENCY")
+    if concurrency:
+        config["max_concurrency"] = int(concurrency)
+    return config
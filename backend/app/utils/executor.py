@@ -0,0 +1,90 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional, Tuple
+
+def _run_initializers(initializers: List[Tuple[Callable, tuple]]):
+    """Run every registered initializer inside a freshly started worker"""
+    for fn, args in initializers:
+        fn(*args)
+
+class ExecutionLayer:
+    """Dispatches CPU-bound work off the event loop.
+
+    DSP and model inference go to a process pool, or to a thread pool when
+    CPU_POOL_MODE=thread. Blocking I/O is not routed through here; the HTTP
+    clients are async and file work uses asyncio.to_thread.
+    """
+
+    def __init__(self, cpu_workers: Optional[int] = None, cpu_mode: Optional[str] = None):
+        self.cpu_workers = cpu_workers or int(os.getenv("CPU_POOL_WORKERS", str(os.cpu_count() or 1)))
+        self.cpu_mode = (cpu_mode or os.getenv("CPU_POOL_MODE", "process")).lower()
+        if self.cpu_mode not in ("process", "thread"):
+            raise ValueError(f"Unknown CPU pool mode: {self.cpu_mode}")
+
+        self._cpu_initializers: List[Tuple[Callable, tuple]] = []
+        self._cpu_pool: Optional[Executor] = None
+
+    @property
+    def uses_processes(self) -> bool:
+        """Whether CPU work crosses a process boundary (arguments must be picklable)"""
+        return self.cpu_mode == "process"
+
+    def add_cpu_initializer(self, fn: Callable, *args):
+        """Register a function run once in every CPU worker, e.g. to load a model"""
+        self._cpu_initializers.append((fn, args))
+        if self._cpu_pool is not None:
+            # Existing workers have not run it; start a fresh pool on next use
+            self._cpu_pool.shutdown(wait=False)
+            self._cpu_pool = None
+
+    def _get_cpu_pool(self) -> Executor:
+        if self._cpu_pool is None:
+            initargs = (list(self._cpu_initializers),)
+            if self.uses_processes:
+                # Spawned workers do not inherit torch/OpenMP thread state from the server
+                start_method = os.getenv("CPU_POOL_START_METHOD", "spawn")
+                self._cpu_pool = ProcessPoolExecutor(
+                    max_workers=self.cpu_workers,
+                    mp_context=multiprocessing.get_context(start_method),
+                    initializer=_run_initializers,
+                    initargs=initargs
+                )
+            else:
+                self._cpu_pool = ThreadPoolExecutor(
+                    max_workers=self.cpu_workers,
+                    thread_name_prefix="cpu",
+                    initializer=_run_initializers,
+                    initargs=initargs
+                )
+            print(f"Started CPU pool: {self.cpu_workers} {self.cpu_mode} workers")
+        return self._cpu_pool
+
+    async def run_cpu(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a CPU-bound call in the CPU pool"""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_cpu_pool(), functools.partial(fn, *args, **kwargs))
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); rebuild the pool for subsequent calls
+            print("CPU worker pool broken, restarting on next call")
+            self._cpu_pool = None
+            raise
+
+    def shutdown(self):
+        """Stop the CPU pool"""
+        if self._cpu_pool is not None:
+            self._cpu_pool.shutdown(wait=False, cancel_futures=True)
+        self._cpu_pool = None
+
+_execution_layer: Optional[ExecutionLayer] = None
+
+def get_execution_layer() -> ExecutionLayer:
+    """Get the process-wide execution layer"""
+    global _execution_layer
+    if _execution_layer is None:
+        _execution_layer = ExecutionLayer()
+    return _execution_layer
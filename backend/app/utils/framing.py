@@ -0,0 +1,98 @@
+import struct
+from enum import IntEnum
+from typing import Optional, Sequence, Union
+
+# WebSocket subprotocol selecting binary audio frames; clients that do not
+# offer it keep the JSON protocol with base64 audio
+BINARY_PROTOCOL_V1 = "emochat.binary.v1"
+SUPPORTED_PROTOCOLS = (BINARY_PROTOCOL_V1,)
+
+FRAME_VERSION = 1
+
+# version, type, codec, flags, stream, seq, payload length (big endian, 16 bytes)
+HEADER = struct.Struct(">BBBBIII")
+
+# Last frame of an utterance or audio stream
+FLAG_END = 0x01
+# First frame of an utterance streamed in chunks while it is recorded; frames
+# without either flag continue the open utterance
+FLAG_START = 0x02
+
+class FrameType(IntEnum):
+    AUDIO_IN = 1   # client -> server: recorded utterance
+    AUDIO_OUT = 2  # server -> client: synthesized reply audio
+
+class Codec(IntEnum):
+    UNKNOWN = 0
+    WEBM_OPUS = 1
+    WAV = 2
+    MPEG = 3
+
+MIME_TYPES = {
+    Codec.WEBM_OPUS: "audio/webm",
+    Codec.WAV: "audio/wav",
+    Codec.MPEG: "audio/mpeg"
+}
+
+class FrameError(ValueError):
+    """A binary frame that does not follow the protocol"""
+
+class Frame:
+    """One decoded binary frame; payload is a view into the received message"""
+
+    __slots__ = ("type", "codec", "flags", "stream", "seq", "payload")
+
+    def __init__(self, type: FrameType, codec: Codec, flags: int, stream: int, seq: int, payload: memoryview):
+        self.type = type
+        self.codec = codec
+        self.flags = flags
+        self.stream = stream
+        self.seq = seq
+        self.payload = payload
+
+    @property
+    def is_start(self) -> bool:
+        return bool(self.flags & FLAG_START)
+
+    @property
+    def is_end(self) -> bool:
+        return bool(self.flags & FLAG_END)
+
+def negotiate(offered: Sequence[str]) -> Optional[str]:
+    """Pick the first offered subprotocol we support (None keeps the JSON protocol)"""
+    for protocol in offered:
+        if protocol in SUPPORTED_PROTOCOLS:
+            return protocol
+    return None
+
+def codec_for_mime(mime_type: str) -> Codec:
+    for codec, mime in MIME_TYPES.items():
+        if mime_type.startswith(mime):
+            return codec
+    return Codec.UNKNOWN
+
+def stream_number(stream_id: str) -> int:
+    """Header stream field for a hex stream id (its first 32 bits)"""
+    return int(stream_id[:8], 16)
+
+def encode_frame(frame_type: FrameType, payload: Union[bytes, memoryview], codec: Codec = Codec.UNKNOWN,
+                 stream: int = 0, seq: int = 0, flags: int = 0) -> bytes:
+    """Header followed by the raw payload"""
+    header = HEADER.pack(FRAME_VERSION, frame_type, codec, flags, stream, seq, len(payload))
+    return b"".join((header, payload))
+
+def decode_frame(data: Union[bytes, bytearray, memoryview]) -> Frame:
+    """Parse a binary message; the payload is not copied"""
+    if len(data) < HEADER.size:
+        raise FrameError(f"Frame shorter than its {HEADER.size}-byte header")
+    version, frame_type, codec, flags, stream, seq, length = HEADER.unpack_from(data)
+    if version != FRAME_VERSION:
+        raise FrameError(f"Unsupported frame version {version}")
+    if length != len(data) - HEADER.size:
+        raise FrameError(f"Frame length {length} does not match payload size {len(data) - HEADER.size}")
+    try:
+        frame_type = FrameType(frame_type)
+    except ValueError:
+        raise FrameError(f"Unknown frame type {frame_type}")
+    codec = Codec(codec) if codec in Codec._value2member_map_ else Codec.UNKNOWN
+    return Frame(frame_type, codec, flags, stream, seq, memoryview(data)[HEADER.size:])
@@ -0,0 +1,63 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Sequence, Tuple
+
+StageFn = Callable[..., Awaitable[Any]]
+
+class StopPipeline(Exception):
+    """Raised by a stage to end a run early; the remaining stages are cancelled"""
+
+    def __init__(self, reason: str, detail: Any = None):
+        super().__init__(reason)
+        self.reason = reason
+        self.detail = detail
+
+class StageGraph:
+    """Runs async pipeline stages as soon as the stages they depend on complete.
+
+    Each stage receives the results of its dependencies as keyword arguments
+    named after those stages. Independent stages run concurrently.
+    """
+
+    def __init__(self):
+        self._stages: Dict[str, Tuple[StageFn, Tuple[str, ...]]] = {}
+        self.timings: Dict[str, float] = {}
+
+    def add(self, name: str, fn: StageFn, deps: Sequence[str] = ()):
+        """Add a stage; dependencies must already be part of the graph"""
+        if name in self._stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        missing = [dep for dep in deps if dep not in self._stages]
+        if missing:
+            raise ValueError(f"Stage {name} depends on unknown stages: {missing}")
+        self._stages[name] = (fn, tuple(deps))
+
+    async def _run_stage(self, name: str, tasks: Dict[str, "asyncio.Task"]) -> Any:
+        fn, deps = self._stages[name]
+        inputs = {dep: await tasks[dep] for dep in deps}
+
+        start = time.perf_counter()
+        try:
+            return await fn(**inputs)
+        finally:
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    async def run(self) -> Dict[str, Any]:
+        """Run every stage and return their results by name"""
+        start = time.perf_counter()
+        tasks: Dict[str, asyncio.Task] = {}
+        for name in self._stages:
+            tasks[name] = asyncio.create_task(self._run_stage(name, tasks))
+
+        try:
+            results = await asyncio.gather(*tasks.values())
+        except BaseException:
+            # One stage failed (or we were cancelled); stop the rest
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+        finally:
+            self.timings["total"] = round((time.perf_counter() - start) * 1000, 1)
+
+        return dict(zip(tasks.keys(), results))
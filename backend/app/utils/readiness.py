@@ -0,0 +1,53 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+class Readiness:
+    """Tracks startup work (service construction, warm-up) and whether traffic can be served"""
+
+    def __init__(self):
+        self.ready = False
+        self.stages: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self._started = time.perf_counter()
+        self._ready_at: Optional[float] = None
+        self._event: Optional[asyncio.Event] = None
+
+    def _get_event(self) -> asyncio.Event:
+        if self._event is None:
+            self._event = asyncio.Event()
+            if self.ready:
+                self._event.set()
+        return self._event
+
+    def record(self, stage: str, elapsed_ms: float, error: Optional[Exception] = None):
+        """Record how long a startup stage took and whether it failed"""
+        self.stages[stage] = round(elapsed_ms, 1)
+        if error is not None:
+            self.errors[stage] = str(error)
+
+    def set_ready(self):
+        if not self.ready:
+            self.ready = True
+            self._ready_at = time.perf_counter()
+            self._get_event().set()
+            print(f"Server ready after {self.snapshot()['startup_ms']} ms")
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait until ready; returns False if the timeout passed first"""
+        if self.ready:
+            return True
+        try:
+            await asyncio.wait_for(self._get_event().wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        end = self._ready_at if self._ready_at is not None else time.perf_counter()
+        return {
+            "ready": self.ready,
+            "startup_ms": round((end - self._started) * 1000, 1),
+            "stages": dict(self.stages),
+            "errors": dict(self.errors)
+        }
@@ -0,0 +1,33 @@
+import re
+from typing import List
+
+# Sentence end: ASCII terminators need following whitespace (so "3.14" or "e.g."
+# mid-token is not cut), CJK terminators end a sentence on their own
+_SENTENCE_END = re.compile(r'(?:[.!?]+["\')\]]*\s+|[。！？]+["\')\]」』]*\s*)')
+
+class SentenceSplitter:
+    """Cuts a stream of text deltas into complete sentences"""
+
+    def __init__(self, min_length: int = 12):
+        # Short fragments ("Oh.") are merged into the next sentence
+        self.min_length = min_length
+        self._buffer = ""
+
+    def feed(self, delta: str) -> List[str]:
+        """Add a text delta and return the sentences it completed"""
+        self._buffer += delta
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            candidate = self._buffer[start:match.end()].strip()
+            if len(candidate) >= self.min_length:
+                sentences.append(candidate)
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> str:
+        """Return whatever text is left once the stream ends"""
+        remainder = self._buffer.strip()
+        self._buffer = ""
+        return remainder
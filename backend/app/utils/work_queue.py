@@ -0,0 +1,155 @@
+import asyncio
+import os
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+JobFn = Callable[[Any], Awaitable[None]]
+DropFn = Callable[[Any, str], Awaitable[None]]
+
+# What happens to a new item when max_size items are already waiting:
+#   drop_oldest - the longest-waiting item is dropped to make room
+#   reject      - the new item is refused
+#   coalesce    - the new item replaces everything that is waiting (only the latest counts)
+OVERFLOW_POLICIES = ("drop_oldest", "reject", "coalesce")
+
+class WorkQueue:
+    """Bounded queue feeding one worker that runs jobs one at a time, in order.
+
+    Lets a WebSocket keep receiving while earlier messages are processed.
+    At most max_size items wait behind the running job; on overflow the
+    policy decides which item goes, and on_drop(item, reason) is told about
+    it so resources can be released and the client informed. A barge-in
+    (preempt) cancels the running job and drops everything that waited
+    before the newest item.
+    """
+
+    def __init__(self, run: JobFn, max_size: int = 2, policy: str = "drop_oldest",
+                 on_drop: Optional[DropFn] = None, counters: Optional[Dict[str, int]] = None):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy!r}, expected one of {OVERFLOW_POLICIES}")
+        self.run = run
+        self.max_size = max_size
+        self.policy = policy
+        self.on_drop = on_drop
+        # May be shared between queues to aggregate over connections
+        self.counters = counters if counters is not None else {}
+
+        self._pending: Deque[Any] = deque()
+        self._wakeup = asyncio.Event()
+        self._current: Optional[asyncio.Task] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def _count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    @property
+    def busy(self) -> bool:
+        return self._current is not None and not self._current.done()
+
+    async def _drop(self, item: Any, reason: str):
+        self._count(reason)
+        if self.on_drop is not None:
+            try:
+                await self.on_drop(item, reason)
+            except Exception as e:
+                print(f"Work queue drop handler failed: {e}")
+
+    async def submit(self, item: Any, preempt: bool = False) -> bool:
+        """Queue an item; returns False if it was rejected.
+
+        With preempt=True an accepted item supersedes the running job and
+        every item queued before it; a rejected one leaves them alone.
+        """
+        if self._closed:
+            await self._drop(item, "rejected")
+            return False
+        if len(self._pending) >= self.max_size:
+            if self.policy == "reject":
+                await self._drop(item, "rejected")
+                return False
+            if self.policy == "coalesce":
+                while self._pending:
+                    await self._drop(self._pending.popleft(), "coalesced")
+            else:
+                await self._drop(self._pending.popleft(), "dropped")
+
+        self._pending.append(item)
+        self._count("submitted")
+        self._wakeup.set()
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._work())
+        if preempt:
+            await self._preempt(keep=1)
+        return True
+
+    async def preempt(self) -> bool:
+        """Barge-in ahead of an item that is yet to be submitted: cancel the
+        running job and drop everything waiting; returns whether anything went"""
+        return await self._preempt(keep=0)
+
+    async def _preempt(self, keep: int) -> bool:
+        # Take the items and cancel before the first await so the worker cannot pick one up meanwhile
+        superseded = [self._pending.popleft() for _ in range(len(self._pending) - keep)]
+        cancelled = self.busy
+        if cancelled:
+            self._current.cancel()
+        for item in superseded:
+            await self._drop(item, "superseded")
+        return cancelled or bool(superseded)
+
+    async def _work(self):
+        while True:
+            while not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            self._current = asyncio.create_task(self.run(self._pending.popleft()))
+            # wait() returns when the job ends, including when only the job was cancelled
+            await asyncio.wait((self._current,))
+            if self._current.cancelled():
+                self._count("cancelled")
+            elif self._current.exception() is not None:
+                self._count("failed")
+                print(f"Work queue job failed: {self._current.exception()}")
+            else:
+                self._count("completed")
+            self._current = None
+
+    async def close(self):
+        """Cancel the running job, drop whatever is still queued and stop the worker"""
+        self._closed = True
+        tasks = [task for task in (self._worker, self._current) if task is not None]
+        if self.busy:
+            self._count("cancelled")
+        for task in tasks:
+            task.cancel()
+        while self._pending:
+            await self._drop(self._pending.popleft(), "discarded")
+        # Wait for the cancelled work to unwind
+        if tasks:
+            await asyncio.wait(tasks)
+        self._worker = self._current = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "policy": self.policy,
+            "max_size": self.max_size,
+            "depth": len(self._pending),
+            "busy": self.busy,
+            **self.counters
+        }
+
+def work_queue_config_from_env(prefix: str, default_size: int = 2,
+                               default_policy: str = "drop_oldest") -> Dict[str, Any]:
+    """Read <PREFIX>_MAX_SIZE / _POLICY from the environment"""
+    return {
+        "max_size": int(os.getenv(f"{prefix}_MAX_SIZE", str(default_size))),
+        "policy": os.getenv(f"{prefix}_POLICY", default_policy).lower()
+    }
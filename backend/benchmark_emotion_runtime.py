@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Compare EmotionCNN inference runtimes (eager / compiled / TorchScript / ONNX):
+equivalence with eager mode on a fixed test set, latency and throughput
+"""
+
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from app.services.emotion_runtime import (
+    EagerBackend, ONNX_AVAILABLE, export_artifacts, load_backend, reference_inputs, verify_backend
+)
+from app.services.emotion_service import EmotionCNN
+
+def build_backends(artifact_dir: str):
+    """Eager reference plus every runtime that can be exported here"""
+    torch.manual_seed(0)
+    model = EmotionCNN().eval()
+    runtimes = ["torchscript"] + (["onnx"] if ONNX_AVAILABLE else [])
+    artifacts = export_artifacts(model, artifact_dir, runtimes)
+    backends = [EagerBackend(model), load_backend("compiled", model)]
+    backends += [load_backend(name, model, artifacts) for name in runtimes]
+    return backends
+
+def test_backends_match_eager():
+    """Every exported runtime reproduces eager-mode probabilities"""
+    with tempfile.TemporaryDirectory() as artifact_dir:
+        reference, *others = build_backends(artifact_dir)
+        inputs = reference_inputs(count=16)
+        for backend in others:
+            error = verify_backend(backend, reference, inputs)
+            print(f"{backend.name}: max abs error vs eager {error:.2e}")
+
+def measure(backend, batch_size: int, repeats: int):
+    inputs = reference_inputs(count=batch_size, seed=1)
+    for _ in range(3):
+        backend.predict(inputs)
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        backend.predict(inputs)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings = np.array(timings)
+    return np.median(timings), np.percentile(timings, 95), batch_size * 1000 / timings.mean()
+
+def benchmark(batch_sizes=(1, 8, 16), repeats: int = 30):
+    with tempfile.TemporaryDirectory() as artifact_dir:
+        backends = build_backends(artifact_dir)
+        print(f"torch threads: {torch.get_num_threads()}")
+        print(f"{'runtime':<12}{'batch':>6}{'p50 ms':>10}{'p95 ms':>10}{'items/s':>10}")
+        for batch_size in batch_sizes:
+            for backend in backends:
+                p50, p95, throughput = measure(backend, batch_size, repeats)
+                print(f"{backend.name:<12}{batch_size:>6}{p50:>10.2f}{p95:>10.2f}{throughput:>10.1f}")
+
+if __name__ == "__main__":
+    test_backends_match_eager()
+    benchmark(repeats=int(sys.argv[1]) if len(sys.argv) > 1 else 30)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Report accuracy drift, model size and latency of the int8 EmotionCNN
+variants against float32
+
+Usage: python benchmark_quantization.py [weights.pt] [calibration_audio_dir]
+"""
+
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from app.services.emotion_runtime import (
+    EagerBackend, ONNX_AVAILABLE, OnnxBackend, QuantizedBackend, calibration_mels, export_artifacts
+)
+from app.services.emotion_service import EmotionCNN
+
+DRIFT_TOLERANCE = 5e-2
+
+def load_model(weights_path=None):
+    torch.manual_seed(0)
+    model = EmotionCNN()
+    if weights_path:
+        model.load_state_dict(torch.load(weights_path, map_location="cpu"))
+    return model.eval()
+
+def serialized_mb(module: torch.nn.Module) -> float:
+    buffer = io.BytesIO()
+    torch.save(module.state_dict(), buffer)
+    return buffer.tell() / 2**20
+
+def build_variants(model, artifact_dir: str, calibration_dir=None):
+    """(backend, size in MB) for float32 and int8 variants"""
+    variants = [(EagerBackend(model), serialized_mb(model))]
+    quantized = QuantizedBackend(model)
+    variants.append((quantized, serialized_mb(quantized.model)))
+
+    if ONNX_AVAILABLE:
+        dynamic_only = export_artifacts(model, os.path.join(artifact_dir, "linear"), ["onnx_int8"],
+                                        quantize_convs=False)
+        with_convs = export_artifacts(model, os.path.join(artifact_dir, "conv"), ["onnx_int8"],
+                                      quantize_convs=True, calibration_dir=calibration_dir)
+        for name, path in [("onnx", dynamic_only["onnx"]),
+                           ("onnx_int8", dynamic_only["onnx_int8"]),
+                           ("onnx_int8+conv", with_convs["onnx_int8"])]:
+            variants.append((OnnxBackend(path, name=name), os.path.getsize(path) / 2**20))
+    return variants
+
+def drift(reference: np.ndarray, actual: np.ndarray):
+    """Top-1 agreement, max abs probability difference and mean KL(reference || actual)"""
+    agreement = float((reference.argmax(axis=1) == actual.argmax(axis=1)).mean())
+    max_abs = float(np.abs(reference - actual).max())
+    kl = float(np.mean(np.sum(reference * (np.log(reference + 1e-12) - np.log(actual + 1e-12)), axis=1)))
+    return agreement, max_abs, kl
+
+def latency_ms(backend, inputs, repeats: int = 20) -> float:
+    backend.predict(inputs)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        backend.predict(inputs)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+def test_int8_drift_within_tolerance():
+    """Quantized variants stay close to float32 on held-out mel spectrograms"""
+    model = load_model()
+    evaluation = calibration_mels(count=16, seed=1)
+    with tempfile.TemporaryDirectory() as artifact_dir:
+        reference, *others = build_variants(model, artifact_dir)
+        expected = reference[0].predict(evaluation)
+        for backend, _ in others:
+            _, max_abs, _ = drift(expected, backend.predict(evaluation))
+            assert max_abs < DRIFT_TOLERANCE, f"{backend.name} drifts by {max_abs}"
+
+def report(weights_path=None, calibration_dir=None):
+    model = load_model(weights_path)
+    # Held out from the calibration set (different seed)
+    evaluation = calibration_mels(count=64, seed=1)
+    with tempfile.TemporaryDirectory() as artifact_dir:
+        variants = build_variants(model, artifact_dir, calibration_dir)
+        expected = variants[0][0].predict(evaluation)
+        base_size = variants[0][1]
+
+        print(f"torch threads: {torch.get_num_threads()}, eval set: {len(evaluation)} mel spectrograms")
+        print(f"{'variant':<16}{'size MB':>9}{'vs fp32':>9}{'top-1':>8}{'max |dp|':>10}{'KL':>10}"
+              f"{'b=1 ms':>9}{'b=16 ms':>9}")
+        for backend, size in variants:
+            agreement, max_abs, kl = drift(expected, backend.predict(evaluation))
+            single = latency_ms(backend, evaluation[:1])
+            batch = latency_ms(backend, evaluation[:16], repeats=10)
+            print(f"{backend.name:<16}{size:>9.2f}{size / base_size:>8.0%} {agreement:>7.1%}{max_abs:>10.2e}"
+                  f"{kl:>10.2e}{single:>9.2f}{batch:>9.2f}")
+
+if __name__ == "__main__":
+    report(*(sys.argv[1:3]))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Measure backend cold start: import time of main.py, time until uvicorn
+accepts connections, and time until /ready reports warm-up done
+
+Usage: python benchmark_startup.py [--port 8765] [--timeout 180]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+HEAVY_MODULES = ("torch", "librosa", "numba", "openai", "soundfile", "scipy", "joblib")
+
+IMPORT_PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{"import_ms": elapsed, "heavy_modules": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+def measure_import() -> dict:
+    """Import main.py in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE], capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def measure_server(port: int, timeout: float) -> dict:
+    """Start uvicorn and poll /health (listening) and /ready (warmed up)"""
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    result = {}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=2.0) as client:
+            while time.perf_counter() - start < timeout:
+                try:
+                    if "listening_ms" not in result:
+                        client.get("/health")
+                        result["listening_ms"] = (time.perf_counter() - start) * 1000
+                    response = client.get("/ready")
+                    if response.status_code == 200:
+                        result["ready_ms"] = (time.perf_counter() - start) * 1000
+                        result["startup"] = response.json()
+                        break
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.05)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=180.0)
+    args = parser.parse_args()
+
+    imported = measure_import()
+    print(f"import main:        {imported['import_ms']:8.0f} ms")
+    print(f"heavy modules:      {', '.join(imported['heavy_modules']) or 'none'}")
+
+    served = measure_server(args.port, args.timeout)
+    if "listening_ms" not in served:
+        print("server did not start listening")
+        sys.exit(1)
+    print(f"accepting requests: {served['listening_ms']:8.0f} ms")
+    if "ready_ms" not in served:
+        print(f"not ready after {args.timeout:.0f} s")
+        sys.exit(1)
+    print(f"ready (warmed up):  {served['ready_ms']:8.0f} ms")
+    for stage, elapsed in served["startup"]["stages"].items():
+        print(f"  {stage:<22}{elapsed:8.0f} ms")
+    for stage, error in served["startup"]["errors"].items():
+        print(f"  {stage} failed: {error}")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import Depends, FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import uvicorn
 import os
 from dotenv import load_dotenv
@@ -8,6 +9,17 @@ import base64
 from datetime import datetime
 import random
 import asyncio
+import time
+import uuid
+
+from app.utils.framing import (
+    Codec, FrameError, FrameType, codec_for_mime, decode_frame, encode_frame, negotiate, stream_number
+)
+from app.utils.pipeline import StageGraph, StopPipeline
+from app.utils.admission import AdmissionController
+from app.utils.readiness import Readiness
+from app.utils.sentences import SentenceSplitter
+from app.utils.work_queue import WorkQueue, work_queue_config_from_env
 
 # Load environment variables
 load_dotenv()
@@ -27,31 +39,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Try to import real services
-try:
-    from app.services.emotion_service import EmotionService
-    from app.services.chat_service import ChatService
-    from app.services.voice_service import VoiceService
-    from app.models.chat_models import ChatMessage, EmotionResponse, EmotionType
-    SERVICES_AVAILABLE = True
-    print("Real service modules imported successfully")
-except ImportError as e:
-    print(f"Real service import failed: {e}")
-    SERVICES_AVAILABLE = False
+# Real services pull in torch, librosa, openai, etc.; they are imported and
+# built in the background after the server starts listening (see build_services)
+SERVICES_AVAILABLE = False
+audio_service = None
+emotion_service = None
+chat_service = None
+voice_service = None
 
 # Mock service classes (as fallback)
+class MockAudioStream:
+    def __init__(self):
+        self.parts = []
+    
+    def feed(self, chunk: bytes):
+        self.parts.append(bytes(chunk))
+    
+    async def finish(self):
+        return b"".join(self.parts)
+    
+    def abort(self):
+        self.parts = []
+    
+    async def wait_closed(self):
+        pass
+
+class MockAudioService:
+    async def decode(self, audio_data: bytes, unless_cached=()):
+        return audio_data
+    
+    def open_stream(self):
+        return MockAudioStream()
+
 class MockEmotionService:
-    async def analyze_emotion(self, audio_data: bytes):
+    async def analyze_emotion(self, audio_data: bytes, timeline: bool = False):
         emotions = ["happy", "sad", "angry", "fear", "surprise", "disgust", "neutral", "excited"]
         emotion = random.choice(emotions)
         return type('EmotionResponse', (), {
             'emotion': emotion,
             'confidence': random.uniform(0.6, 0.9),
-            'features': {"method": "mock"}
+            'features': {"method": "mock"},
+            'timeline': None
         })()
 
 class MockChatService:
-    async def generate_response(self, text: str, emotion, confidence):
+    async def generate_response(self, text: str, emotion, confidence, session_id: str = "default"):
         responses = {
             "happy": ["It sounds like you're in a good mood!", "I'm glad to see you so happy!", "Your good mood is contagious!"],
             "sad": ["I sense you might be feeling a bit down, would you like to talk?", "Everyone has low moments, and that's completely normal."],
@@ -70,8 +102,15 @@ class MockChatService:
             'suggested_emotion': emotion,
             'confidence': confidence
         })()
+    
+    async def generate_response_stream(self, text: str, emotion, confidence, session_id: str = "default"):
+        response = await self.generate_response(text, emotion, confidence, session_id)
+        for word in response.message.split(" "):
+            yield word + " "
 
 class MockVoiceService:
+    supports_streaming = False
+    
     async def speech_to_text(self, audio_data: bytes):
         mock_texts = [
             "Hello, how's the weather today?",
@@ -84,52 +123,162 @@ class MockVoiceService:
     
     async def text_to_speech(self, text: str):
         return b"mock_audio_data"
+    
+    async def text_to_speech_stream(self, text: str):
+        yield b"mock_audio_data"
+    
+    @staticmethod
+    def get_audio_mime_type(audio_data: bytes) -> str:
+        return "audio/mpeg"
 
-# Initialize services
-if SERVICES_AVAILABLE:
+def build_services():
+    """Import the real service modules and initialize services (mock services as fallback)"""
+    global SERVICES_AVAILABLE, audio_service, emotion_service, chat_service, voice_service
+    
+    # Try to import real services
     try:
-        print("Forcing use of real API services")
-        emotion_service = EmotionService()
-        chat_service = ChatService()
-        voice_service = VoiceService()
-        print("✅ Real API services initialized successfully")
-    except Exception as e:
-        print(f"❌ Real service initialization failed: {e}")
-        print("Using mock services as fallback")
-        emotion_service = MockEmotionService()
-        chat_service = MockChatService()
-        voice_service = MockVoiceService()
-else:
-    print("❌ Service modules unavailable, using mock services")
-    emotion_service = MockEmotionService()
-    chat_service = MockChatService()
-    voice_service = MockVoiceService()
+        from app.services.emotion_service import EmotionService
+        from app.services.chat_service import ChatService
+        from app.services.voice_service import VoiceService
+        from app.services.audio_service import AudioService
+        SERVICES_AVAILABLE = True
+        print("Real service modules imported successfully")
+    except ImportError as e:
+        print(f"Real service import failed: {e}")
+        SERVICES_AVAILABLE = False
+    
+    # Initialize services
+    if SERVICES_AVAILABLE:
+        try:
+            print("Forcing use of real API services")
+            audio = AudioService()
+            services = (audio, EmotionService(audio), ChatService(), VoiceService(audio))
+            print("✅ Real API services initialized successfully")
+        except Exception as e:
+            print(f"❌ Real service initialization failed: {e}")
+            print("Using mock services as fallback")
+            services = (MockAudioService(), MockEmotionService(), MockChatService(), MockVoiceService())
+    else:
+        print("❌ Service modules unavailable, using mock services")
+        services = (MockAudioService(), MockEmotionService(), MockChatService(), MockVoiceService())
+    
+    audio_service, emotion_service, chat_service, voice_service = services
+
+def service_type(service) -> str:
+    """Report a service as real, mock, or loading while services are still being built"""
+    if service is None:
+        return "loading"
+    return "mock" if type(service).__name__.startswith("Mock") else "real"
 
 # Active connections list
 active_connections = []
 
+# Each connection hands utterances to its own bounded work queue (WS_QUEUE_MAX_SIZE /
+# _POLICY) so it keeps receiving while one is processed; counters cover all connections
+ws_queue_config = work_queue_config_from_env("WS_QUEUE", default_size=2, default_policy="drop_oldest")
+ws_queue_counters = {}
+# A new utterance cancels the reply still being produced for the previous one
+WS_BARGE_IN = os.getenv("WS_BARGE_IN", "1") == "1"
+
+# Deferred cleanups that must not be garbage collected before they run
+background_tasks = set()
+
+# Concurrency limits per pipeline stage (STAGE_<NAME>_CONCURRENCY) and the queue depths
+# (STAGE_<NAME>_MAX_QUEUE) / requests in flight (ADMISSION_MAX_INFLIGHT) above which new work is shed
+admission = AdmissionController()
+
+# Set once connection pools are warm and the inference path has been exercised
+readiness = Readiness()
+startup_task = None
+
+async def warm_up():
+    """Pre-warm the shared OpenAI and ElevenLabs connection pools and the inference path"""
+    async def warm_connections():
+        if service_type(chat_service) == "real":
+            from app.services.openai_client import prewarm_openai_client
+            from app.services.elevenlabs_client import get_elevenlabs_client
+            
+            start = time.perf_counter()
+            elevenlabs_client = get_elevenlabs_client()
+            await asyncio.gather(
+                prewarm_openai_client(),
+                elevenlabs_client.prewarm() if elevenlabs_client else asyncio.sleep(0)
+            )
+            readiness.record("warmup_connections", (time.perf_counter() - start) * 1000)
+    
+    async def warm_inference():
+        if SERVICES_AVAILABLE and os.getenv("WARMUP_ENABLED", "1") == "1":
+            from app.services.warmup import warm_up_services
+            await warm_up_services(audio_service, emotion_service, voice_service, readiness)
+    
+    try:
+        await asyncio.gather(warm_connections(), warm_inference())
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+    finally:
+        readiness.set_ready()
+
+async def start_services():
+    """Build the services off the event loop, then warm them up"""
+    start = time.perf_counter()
+    try:
+        await asyncio.to_thread(build_services)
+    except Exception as e:
+        print(f"Service construction failed: {e}")
+        readiness.record("build_services", (time.perf_counter() - start) * 1000, e)
+        readiness.set_ready()
+        return
+    readiness.record("build_services", (time.perf_counter() - start) * 1000)
+    await warm_up()
+
+@app.on_event("startup")
+async def startup_event():
+    """Start listening right away; services are built and warmed up in the background
+    and WebSockets wait for readiness"""
+    global startup_task
+    startup_task = asyncio.create_task(start_services())
+
+async def require_ready():
+    """Wait for startup to finish, or answer 503"""
+    if not await readiness.wait(timeout=float(os.getenv("READY_WAIT_TIMEOUT", "30"))):
+        raise HTTPException(status_code=503, detail="Server warming up")
+
+def require_capacity(*stages: str):
+    """Answer 503 right away while the stages a request needs are backed up"""
+    async def dependency():
+        reason = admission.check(stages)
+        if reason is not None:
+            raise HTTPException(status_code=503, detail=f"Server busy ({reason})", headers={"Retry-After": "1"})
+    return dependency
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled connections and stop the worker pools"""
+    if SERVICES_AVAILABLE:
+        from app.services.openai_client import close_openai_client
+        from app.services.elevenlabs_client import close_elevenlabs_client
+        from app.utils.executor import get_execution_layer
+        if startup_task is not None and not startup_task.done():
+            startup_task.cancel()
+        if hasattr(emotion_service, "close"):
+            await emotion_service.close()
+        await close_openai_client()
+        await close_elevenlabs_client()
+        get_execution_layer().shutdown()
+
 @app.get("/")
 async def root():
     return {"message": "Emotion-Aware Voice Chat Assistant API"}
 
 @app.get("/health")
 async def health_check():
-    # Check current service types
-    try:
-        from app.services.emotion_service import EmotionService
-        from app.services.chat_service import ChatService
-        from app.services.voice_service import VoiceService
-        
-        emotion_type = "real" if isinstance(emotion_service, EmotionService) else "mock"
-        chat_type = "real" if isinstance(chat_service, ChatService) else "mock"
-        voice_type = "real" if isinstance(voice_service, VoiceService) else "mock"
-    except ImportError:
-        emotion_type = "mock"
-        chat_type = "mock"
-        voice_type = "mock"
+    emotion_type = service_type(emotion_service)
+    chat_type = service_type(chat_service)
+    voice_type = service_type(voice_service)
     
     return {
-        "status": "healthy",
+        "status": "healthy" if readiness.ready else "starting",
+        "ready": readiness.ready,
         "services": {
             "emotion_recognition": emotion_type,
             "chat_service": chat_type, 
@@ -142,11 +291,117 @@ async def health_check():
         }
     }
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until warm-up has finished"""
+    return JSONResponse(readiness.snapshot(), status_code=200 if readiness.ready else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Runtime statistics of the inference pipeline"""
+    result = {"active_connections": len(active_connections), "startup": readiness.snapshot()}
+    if hasattr(emotion_service, "get_stats"):
+        result["emotion"] = emotion_service.get_stats()
+    if hasattr(chat_service, "get_stats"):
+        result["chat"] = chat_service.get_stats()
+    if hasattr(voice_service, "get_stats"):
+        result["voice"] = voice_service.get_stats()
+    if hasattr(audio_service, "get_stats"):
+        result["audio"] = audio_service.get_stats()
+    if hasattr(audio_service, "results"):
+        result["analysis_cache"] = audio_service.results.get_stats()
+    result["ws_queue"] = {"connections": len(active_connections), **ws_queue_config, **ws_queue_counters}
+    result["admission"] = admission.get_stats()
+    return result
+
 @app.websocket("/ws/chat")
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+    # Clients offering the binary subprotocol get raw audio in binary frames;
+    # everyone else keeps the JSON protocol with base64 audio
+    protocol = negotiate(websocket.scope.get("subprotocols", []))
+    binary = protocol is not None
+    await websocket.accept(subprotocol=protocol)
+    if not await readiness.wait(timeout=float(os.getenv("READY_WAIT_TIMEOUT", "30"))):
+        # 1013 = try again later; the client reconnects once warm-up is done
+        await websocket.close(code=1013, reason="Server warming up")
+        return
     active_connections.append(websocket)
-    print(f"WebSocket connection established, current connections: {len(active_connections)}")
+    print(f"WebSocket connection established ({protocol or 'json'}), current connections: {len(active_connections)}")
+    
+    # Clients opt into streamed TTS audio with ?stream_audio=1 and into token
+    # streaming with ?stream_text=1 (which implies streamed audio)
+    stream_text = websocket.query_params.get("stream_text", "").lower() in ("1", "true")
+    stream_audio = stream_text or websocket.query_params.get("stream_audio", "").lower() in ("1", "true")
+    # ?emotion_timeline=1 adds the per-window emotion of each utterance to the responses
+    emotion_timeline = websocket.query_params.get("emotion_timeline", "").lower() in ("1", "true")
+    
+    # Conversation history is kept per session: a client-supplied ?session_id=
+    # survives reconnects (until idle expiry), otherwise it lives as long as the connection
+    client_session_id = websocket.query_params.get("session_id")
+    session_id = client_session_id or f"ws-{uuid.uuid4().hex}"
+    
+    # Utterance being streamed in while the user speaks (binary protocol only)
+    ingest = None
+    
+    async def run_utterance(audio_data):
+        async with admission.request():
+            if hasattr(audio_data, "finish"):
+                # Streamed utterance: wait for the decoder to drain its last chunks;
+                # the tail is the decode work, so only it waits for a decode slot
+                try:
+                    async with admission.limit("decode"):
+                        audio_data = await audio_data.finish()
+                except asyncio.CancelledError:
+                    audio_data.abort()
+                    raise
+            await process_audio_data(websocket, audio_data, stream_audio, stream_text, session_id, binary,
+                                     emotion_timeline)
+    
+    async def drop_utterance(audio_data, reason):
+        if hasattr(audio_data, "abort"):
+            audio_data.abort()
+        print(f"Utterance {reason}")
+        if reason in ("rejected", "dropped", "coalesced", "superseded"):
+            await websocket.send_json({
+                "type": "utterance_dropped",
+                "reason": reason,
+                "timestamp": datetime.now().isoformat()
+            })
+    
+    utterances = WorkQueue(run_utterance, on_drop=drop_utterance, counters=ws_queue_counters, **ws_queue_config)
+    
+    async def barge_in():
+        # The user started a new utterance: stop the reply in progress and the older ones still waiting
+        if WS_BARGE_IN and await utterances.preempt():
+            print("New utterance, cancelled the replies in progress")
+    
+    async def shed_utterance(stream_slot: bool = False) -> bool:
+        # Turn a new utterance away before any work is spent on it while the server is backed up.
+        # A streamed utterance keeps a decoder open while the user speaks, so it also needs a stream slot
+        reason = admission.check()
+        if reason is None and stream_slot and not await admission.try_acquire("stream"):
+            reason = "stream"
+        if reason is None:
+            return False
+        print(f"Server busy ({reason}), rejecting utterance")
+        await websocket.send_json({
+            "type": "busy",
+            "reason": reason,
+            "retry_after_ms": 1000,
+            "timestamp": datetime.now().isoformat()
+        })
+        return True
+    
+    # Stream field of a streamed utterance that was shed; its remaining frames are ignored
+    shed_stream = None
+    
+    async def reject_stray_frame(frame):
+        print(f"Audio frame outside an utterance (stream {frame.stream})")
+        await websocket.send_json({
+            "type": "error",
+            "message": "Audio frame outside an utterance",
+            "timestamp": datetime.now().isoformat()
+        })
     
     try:
         while True:
@@ -158,6 +413,8 @@ async def websocket_endpoint(websocket: WebSocket):
             try:
                 # Set receive timeout
                 data = await asyncio.wait_for(websocket.receive(), timeout=30.0)
+                # Set once this message's utterance passed admission control
+                admitted = False
                 
                 # Process received data
                 if data["type"] == "websocket.receive":
@@ -178,6 +435,63 @@ async def websocket_endpoint(websocket: WebSocket):
                             audio_data = b"mock_audio_data"
                             print("JSON parsing failed, using mock audio data")
                             
+                    elif "bytes" in data and binary:
+                        # Binary protocol: header plus raw audio, used without copying
+                        try:
+                            frame = decode_frame(data["bytes"])
+                        except FrameError as e:
+                            print(f"Invalid frame: {e}")
+                            await websocket.send_json({
+                                "type": "error",
+                                "message": f"Invalid frame: {e}",
+                                "timestamp": datetime.now().isoformat()
+                            })
+                            continue
+                        if frame.type != FrameType.AUDIO_IN:
+                            print(f"Ignoring unexpected {frame.type.name} frame")
+                            continue
+                        
+                        # START opens an utterance whose chunks are decoded as they
+                        # arrive; END completes it. A frame with only END (or both)
+                        # carries a whole utterance. Any START ends an unfinished one
+                        if frame.is_start:
+                            shed_stream = None
+                            streamed = not frame.is_end
+                            if ingest is not None:
+                                # Its stream slot is free again before the new utterance asks for one
+                                print("New utterance started, dropping the unfinished one")
+                                await ingest.close()
+                                ingest = None
+                            if await shed_utterance(stream_slot=streamed):
+                                if streamed:
+                                    shed_stream = frame.stream
+                                continue
+                            admitted = True
+                            if streamed:
+                                ingest = StreamSlot(audio_service.open_stream(), frame.stream,
+                                                    lambda: admission.release("stream"))
+                            await barge_in()
+                        elif frame.stream == shed_stream:
+                            if frame.is_end:
+                                shed_stream = None
+                            continue
+                        elif ingest is not None and frame.stream != ingest.stream_id:
+                            # Belongs to no utterance this connection has open
+                            await reject_stray_frame(frame)
+                            continue
+                        if ingest is not None:
+                            ingest.feed(frame.payload)
+                            if not frame.is_end:
+                                continue
+                            # finish() runs in the queue so receiving goes on meanwhile
+                            audio_data = ingest
+                            ingest = None
+                        elif frame.is_end:
+                            audio_data = frame.payload
+                            print(f"Received audio frame: {len(audio_data)} bytes ({frame.codec.name})")
+                        else:
+                            await reject_stray_frame(frame)
+                            continue
                     elif "bytes" in data:
                         # Process binary data
                         audio_data = data["bytes"]
@@ -186,8 +500,13 @@ async def websocket_endpoint(websocket: WebSocket):
                         print("Unknown data type")
                         continue
                         
-                    # Process audio data
-                    await process_audio_data(websocket, audio_data)
+                    # A whole utterance is admitted here and, once the queue accepts it,
+                    # interrupts the replies in progress; streamed ones did both with their first frame
+                    whole = not admitted and not hasattr(audio_data, "finish")
+                    if whole and await shed_utterance():
+                        continue
+                    # Hand the utterance to the queue; the next message can be received right away
+                    await utterances.submit(audio_data, preempt=whole and WS_BARGE_IN)
                     
                 elif data["type"] == "websocket.disconnect":
                     print("Received disconnect message")
@@ -222,49 +541,370 @@ async def websocket_endpoint(websocket: WebSocket):
     except Exception as e:
         print(f"WebSocket error: {e}")
     finally:
-        if websocket in active_connections:
-            active_connections.remove(websocket)
-        print(f"WebSocket connection cleaned up, current connections: {len(active_connections)}")
+        try:
+            if ingest is not None:
+                ingest.abort()
+            # Nobody is left to hear replies still being produced
+            await utterances.close()
+        finally:
+            # Runs even if the handler is cancelled while the work above unwinds
+            if websocket in active_connections:
+                active_connections.remove(websocket)
+            if not client_session_id and hasattr(chat_service, "end_session"):
+                chat_service.end_session(session_id)
+            print(f"WebSocket connection cleaned up, current connections: {len(active_connections)}")
+
+class StreamSlot:
+    """A streamed utterance holding a stream slot from its START frame until its decoder is done.
+    
+    Each open stream has a decoder thread of its own, outside the CPU pool,
+    so the slot is what bounds them (STAGE_STREAM_CONCURRENCY). It is given
+    back after finish(), or once the decoder thread has exited after abort().
+    """
+    
+    def __init__(self, stream, stream_id: int, release):
+        self.stream = stream
+        # Stream field of the frames that belong to this utterance
+        self.stream_id = stream_id
+        self._release = release
+        self._aborted = False
+    
+    def feed(self, chunk):
+        self.stream.feed(chunk)
+    
+    async def finish(self):
+        try:
+            audio = await self.stream.finish()
+        except BaseException:
+            self.abort()
+            raise
+        self._give_back()
+        return audio
+    
+    def abort(self):
+        """Stop decoding without waiting; the slot follows when the decoder thread exits"""
+        if self._aborted:
+            return
+        self._aborted = True
+        self.stream.abort()
+        task = asyncio.get_running_loop().create_task(self._release_when_closed())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+    
+    async def close(self):
+        """Stop decoding and wait until the slot is free again"""
+        self._aborted = True
+        self.stream.abort()
+        await self._release_when_closed()
+    
+    async def _release_when_closed(self):
+        try:
+            await self.stream.wait_closed()
+        finally:
+            self._give_back()
+    
+    def _give_back(self):
+        if self._release is not None:
+            release, self._release = self._release, None
+            release()
+
+class AudioStreamWriter:
+    """Sends the audio of one response as sequenced chunks followed by an end marker.
+    
+    Chunks go out as binary AUDIO_OUT frames on binary-protocol connections
+    and as base64 audio_chunk messages otherwise; the end marker is JSON.
+    """
+    
+    def __init__(self, websocket: WebSocket, stream_id: str, timings: dict, started_at: float,
+                 binary: bool = False):
+        self.websocket = websocket
+        self.stream_id = stream_id
+        self.timings = timings
+        self.started_at = started_at
+        self.binary = binary
+        self.seq = 0
+        self.total_bytes = 0
+        self.codec = Codec.UNKNOWN
+    
+    async def send(self, chunk: bytes):
+        if self.seq == 0:
+            # Time to first audio is what the user perceives as latency
+            self.timings["first_audio"] = round((time.perf_counter() - self.started_at) * 1000, 1)
+            print(f"First audio chunk ready for stream {self.stream_id}")
+        if self.binary:
+            if self.seq == 0:
+                self.codec = codec_for_mime(voice_service.get_audio_mime_type(chunk))
+            await self.websocket.send_bytes(encode_frame(
+                FrameType.AUDIO_OUT, chunk, self.codec, stream_number(self.stream_id), self.seq
+            ))
+        else:
+            await self.websocket.send_json({
+                "type": "audio_chunk",
+                "stream_id": self.stream_id,
+                "seq": self.seq,
+                "mime_type": voice_service.get_audio_mime_type(chunk) if self.seq == 0 else None,
+                "data": base64.b64encode(chunk).decode()
+            })
+        self.seq += 1
+        self.total_bytes += len(chunk)
+    
+    async def close(self):
+        await self.websocket.send_json({
+            "type": "audio_end",
+            "stream_id": self.stream_id,
+            "seq": self.seq,
+            "total_bytes": self.total_bytes,
+            "timings": self.timings
+        })
+
+async def stream_audio_response(writer: AudioStreamWriter, text: str) -> int:
+    """Forward synthesized audio chunks to the client as they arrive"""
+    async for chunk in voice_service.text_to_speech_stream(text):
+        await writer.send(chunk)
+    await writer.close()
+    return writer.total_bytes
+
+async def stream_reply(websocket: WebSocket, writer: AudioStreamWriter, text: str, emotion_result,
+                       session_id: str):
+    """Stream the chat reply token by token and synthesize it sentence by sentence.
+    
+    Returns the full reply text and the task forwarding audio to the client,
+    which keeps running until the last sentence has been sent.
+    """
+    splitter = SentenceSplitter()
+    sentence_queues: asyncio.Queue = asyncio.Queue()
+    tts_tasks = []
+    
+    async def synthesize(sentence: str, queue: asyncio.Queue):
+        try:
+            async with admission.limit("tts"):
+                async for chunk in voice_service.text_to_speech_stream(sentence):
+                    await queue.put(chunk)
+        finally:
+            await queue.put(None)
+    
+    async def forward_audio():
+        # Sentences are synthesized concurrently but sent strictly in order
+        try:
+            while True:
+                queue = await sentence_queues.get()
+                if queue is None:
+                    break
+                while True:
+                    chunk = await queue.get()
+                    if chunk is None:
+                        break
+                    await writer.send(chunk)
+        except asyncio.CancelledError:
+            # Barge-in or disconnect: stop synthesizing sentences nobody will hear
+            for task in tts_tasks:
+                task.cancel()
+            raise
+        await writer.close()
+    
+    def start_sentence(sentence: str):
+        queue = asyncio.Queue()
+        tts_tasks.append(asyncio.create_task(synthesize(sentence, queue)))
+        sentence_queues.put_nowait(queue)
+    
+    # Per-sentence synthesis needs a streamable format; otherwise synthesize once at the end
+    pipeline_sentences = getattr(voice_service, "supports_streaming", False)
+    sender = asyncio.create_task(forward_audio())
+    parts = []
+    try:
+        async for delta in chat_service.generate_response_stream(
+                text, emotion_result.emotion, emotion_result.confidence, session_id=session_id):
+            parts.append(delta)
+            await websocket.send_json({
+                "type": "assistant_partial",
+                "stream_id": writer.stream_id,
+                "text": delta
+            })
+            if pipeline_sentences:
+                for sentence in splitter.feed(delta):
+                    start_sentence(sentence)
+        
+        reply = "".join(parts).strip()
+        tail = splitter.flush() if pipeline_sentences else reply
+        if tail:
+            start_sentence(tail)
+        sentence_queues.put_nowait(None)
+        return reply, sender
+    except BaseException:
+        for task in tts_tasks + [sender]:
+            task.cancel()
+        raise
 
-async def process_audio_data(websocket: WebSocket, audio_data: bytes):
+async def process_audio_data(websocket: WebSocket, audio_data: bytes, stream_audio: bool = False,
+                             stream_text: bool = False, session_id: str = "default", binary: bool = False,
+                             emotion_timeline: bool = False):
     """Process audio data"""
     try:
-        print(f"Starting to process audio data, length: {len(audio_data)} bytes")
+        print(f"Starting to process audio data, length: {len(getattr(audio_data, 'raw', audio_data))} bytes")
+        started_at = time.perf_counter()
+        stream_id = uuid.uuid4().hex[:12]
         
-        # Process audio and recognize emotion
-        emotion_result = await emotion_service.analyze_emotion(audio_data)
-        print(f"Recognized emotion: {emotion_result.emotion} (confidence: {emotion_result.confidence})")
+        # Stage graph: emotion analysis and speech to text both depend only on the
+        # decoded audio and run concurrently; chat waits for both, TTS for chat
+        async def decode_stage():
+            if not isinstance(audio_data, (bytes, bytearray, memoryview)):
+                # Streamed utterance, already decoded while it was being recorded
+                return audio_data
+            # Decode once; emotion analysis and speech to text share the PCM buffer.
+            # A resent payload whose results are still cached is not decoded at all
+            async with admission.limit("decode"):
+                return await audio_service.decode(audio_data, unless_cached=("emotion", "transcript"))
         
-        # Speech to text
-        text = await voice_service.speech_to_text(audio_data)
-        print(f"Speech to text: {text}")
+        vad_report = None
         
-        # Generate chat response
-        chat_response = await chat_service.generate_response(
-            text, 
-            emotion_result.emotion,
-            emotion_result.confidence
-        )
-        print(f"Generated response: {chat_response.message}")
+        async def vad_stage(decode):
+            # Trim silence before analysis and upload; silence-only clips stop here,
+            # before any paid API call
+            nonlocal vad_report
+            if not hasattr(audio_service, "trim_silence"):
+                return decode
+            audio, vad_report = await audio_service.trim_silence(decode)
+            if vad_report is not None and not vad_report["speech"]:
+                raise StopPipeline("no_speech", vad_report)
+            return audio
         
-        # Text to speech
-        audio_response = await voice_service.text_to_speech(chat_response.message)
-        print(f"Generated audio response, length: {len(audio_response) if isinstance(audio_response, bytes) else 0} bytes")
+        async def emotion_stage(vad):
+            # Process audio and recognize emotion
+            async with admission.limit("emotion"):
+                emotion_result = await emotion_service.analyze_emotion(vad, timeline=emotion_timeline)
+            print(f"Recognized emotion: {emotion_result.emotion} (confidence: {emotion_result.confidence})")
+            return emotion_result
         
-        # Send response
-        response = {
-            "type": "chat_response",
-            "user_text": text,
-            "assistant_text": chat_response.message,
-            "emotion": emotion_result.emotion,
-            "emotion_confidence": emotion_result.confidence,
-            "audio_data": base64.b64encode(audio_response).decode() if isinstance(audio_response, bytes) else "",
-            "timestamp": datetime.now().isoformat()
-        }
+        async def stt_stage(vad):
+            # Speech to text
+            async with admission.limit("stt"):
+                text = await voice_service.speech_to_text(vad)
+            print(f"Speech to text: {text}")
+            return text
+        
+        async def chat_stage(stt, emotion):
+            # Generate chat response
+            async with admission.limit("chat"):
+                chat_response = await chat_service.generate_response(
+                    stt, 
+                    emotion.emotion,
+                    emotion.confidence,
+                    session_id=session_id
+                )
+            print(f"Generated response: {chat_response.message}")
+            return chat_response
+        
+        def timeline_payload(emotion_result):
+            if emotion_result.timeline is None:
+                return None
+            return [window.model_dump(mode="json") for window in emotion_result.timeline]
+        
+        def build_response(text, emotion_result, assistant_text, audio_response):
+            return {
+                "type": "chat_response",
+                "stream_id": stream_id,
+                "user_text": text,
+                "assistant_text": assistant_text,
+                "emotion": emotion_result.emotion,
+                "emotion_confidence": emotion_result.confidence,
+                "emotion_timeline": timeline_payload(emotion_result),
+                # Binary-protocol clients get the audio as frames after this message
+                "audio_data": base64.b64encode(audio_response).decode() if isinstance(audio_response, bytes) and not binary else "",
+                "audio_streaming": stream_audio or binary,
+                "vad": vad_report,
+                "timings": graph.timings,
+                "timestamp": datetime.now().isoformat()
+            }
         
-        await websocket.send_json(response)
+        async def tts_stage(chat):
+            # Text to speech
+            async with admission.limit("tts"):
+                audio_response = await voice_service.text_to_speech(chat.message)
+            print(f"Generated audio response, length: {len(audio_response) if isinstance(audio_response, bytes) else 0} bytes")
+            return audio_response
+        
+        async def tts_stream_stage(chat, stt, emotion):
+            # Send the text right away, then stream the audio behind it
+            await websocket.send_json(build_response(stt, emotion, chat.message, None))
+            writer = AudioStreamWriter(websocket, stream_id, graph.timings, started_at, binary)
+            async with admission.limit("tts"):
+                total_bytes = await stream_audio_response(writer, chat.message)
+            print(f"Streamed audio response, length: {total_bytes} bytes")
+            return None
+        
+        async def chat_stream_stage(stt, emotion):
+            # Tell the client what was heard while the reply is still being generated
+            await websocket.send_json({
+                "type": "transcript",
+                "stream_id": stream_id,
+                "user_text": stt,
+                "emotion": emotion.emotion,
+                "emotion_confidence": emotion.confidence,
+                "emotion_timeline": timeline_payload(emotion)
+            })
+            writer = AudioStreamWriter(websocket, stream_id, graph.timings, started_at, binary)
+            # The chat slot covers the LLM stream; sentence audio takes TTS slots as it goes
+            async with admission.limit("chat"):
+                reply, sender = await stream_reply(websocket, writer, stt, emotion, session_id)
+            print(f"Generated response: {reply}")
+            await websocket.send_json(build_response(stt, emotion, reply, None))
+            return sender
+        
+        async def tts_pipelined_stage(chat):
+            # Sentence audio has been flowing since the first sentence completed
+            await chat
+            return None
+        
+        graph = StageGraph()
+        graph.add("decode", decode_stage)
+        graph.add("vad", vad_stage, deps=("decode",))
+        graph.add("emotion", emotion_stage, deps=("vad",))
+        graph.add("stt", stt_stage, deps=("vad",))
+        if stream_text:
+            graph.add("chat", chat_stream_stage, deps=("stt", "emotion"))
+            graph.add("tts", tts_pipelined_stage, deps=("chat",))
+        else:
+            graph.add("chat", chat_stage, deps=("stt", "emotion"))
+            if stream_audio:
+                graph.add("tts", tts_stream_stage, deps=("chat", "stt", "emotion"))
+            else:
+                graph.add("tts", tts_stage, deps=("chat",))
+        
+        results = await graph.run()
+        print(f"Stage timings (ms): {graph.timings}")
+        
+        if not stream_audio:
+            # Send response
+            response = build_response(results["stt"], results["emotion"], results["chat"].message, results["tts"])
+            await websocket.send_json(response)
+            if binary and results["tts"]:
+                writer = AudioStreamWriter(websocket, stream_id, graph.timings, started_at, binary)
+                await writer.send(results["tts"])
+                await writer.close()
         print("Response sent")
         
+    except asyncio.CancelledError:
+        # Barge-in or disconnect: the stages have been cancelled; the client drops what it has of this reply
+        print(f"Processing of stream {stream_id} cancelled")
+        try:
+            await websocket.send_json({
+                "type": "cancelled",
+                "stream_id": stream_id,
+                "timestamp": datetime.now().isoformat()
+            })
+        except Exception:
+            pass
+        raise
+    except StopPipeline as stop:
+        # Nothing to answer (e.g. no speech in the clip); tell the client why
+        print(f"Pipeline stopped: {stop.reason}")
+        await websocket.send_json({
+            "type": stop.reason,
+            "stream_id": stream_id,
+            "vad": stop.detail,
+            "timings": graph.timings,
+            "timestamp": datetime.now().isoformat()
+        })
     except Exception as e:
         print(f"Error processing audio data: {e}")
         import traceback
@@ -280,33 +920,43 @@ async def process_audio_data(websocket: WebSocket, audio_data: bytes):
         except:
             print("Failed to send error response")
 
-@app.post("/api/emotion")
-async def analyze_emotion_endpoint(audio_data: bytes):
-    """Analyze emotion in audio"""
+@app.post("/api/emotion", dependencies=[Depends(require_ready), Depends(require_capacity("emotion"))])
+async def analyze_emotion_endpoint(audio_data: bytes, timeline: bool = False):
+    """Analyze emotion in audio (?timeline=true adds the per-window emotions)"""
     try:
-        result = await emotion_service.analyze_emotion(audio_data)
+        async with admission.request(), admission.limit("emotion"):
+            result = await emotion_service.analyze_emotion(audio_data, timeline=timeline)
         return result
     except Exception as e:
         return {"error": str(e)}
 
-@app.post("/api/chat")
+@app.post("/api/chat", dependencies=[Depends(require_ready), Depends(require_capacity("chat"))])
 async def chat_endpoint(message: dict):
     """Chat endpoint"""
     try:
         text = message.get("text", "")
         emotion = message.get("emotion", "neutral")
         confidence = message.get("confidence", 0.5)
+        # Without a session_id every call is a fresh conversation, ended with the call
+        client_session_id = message.get("session_id")
+        session_id = client_session_id or f"api-{uuid.uuid4().hex}"
         
-        response = await chat_service.generate_response(text, emotion, confidence)
+        try:
+            async with admission.request(), admission.limit("chat"):
+                response = await chat_service.generate_response(text, emotion, confidence, session_id=session_id)
+        finally:
+            if not client_session_id and hasattr(chat_service, "end_session"):
+                chat_service.end_session(session_id)
         return response
     except Exception as e:
         return {"error": str(e)}
 
-@app.post("/api/tts")
+@app.post("/api/tts", dependencies=[Depends(require_ready), Depends(require_capacity("tts"))])
 async def text_to_speech_endpoint(text: str):
     """Text to speech endpoint"""
     try:
-        audio_data = await voice_service.text_to_speech(text)
+        async with admission.request(), admission.limit("tts"):
+            audio_data = await voice_service.text_to_speech(text)
         return {"audio_data": base64.b64encode(audio_data).decode()}
     except Exception as e:
         return {"error": str(e)}
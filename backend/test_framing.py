@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Check the binary WebSocket frame format: round trip and malformed frames
+"""
+
+import struct
+
+import pytest
+
+from app.utils.framing import (
+    BINARY_PROTOCOL_V1, FLAG_END, FLAG_START, HEADER, Codec, FrameError, FrameType,
+    decode_frame, encode_frame, negotiate, stream_number
+)
+
+def test_round_trip():
+    """Every header field survives encode/decode and the payload is a view, not a copy"""
+    payload = bytes(range(256)) * 4
+    data = encode_frame(FrameType.AUDIO_IN, payload, Codec.WEBM_OPUS, stream=0xDEADBEEF, seq=7,
+                        flags=FLAG_START | FLAG_END)
+    assert HEADER.size == 16 and len(data) == 16 + len(payload)
+
+    frame = decode_frame(data)
+    assert frame.type == FrameType.AUDIO_IN and frame.codec == Codec.WEBM_OPUS
+    assert (frame.stream, frame.seq) == (0xDEADBEEF, 7)
+    assert frame.is_start and frame.is_end
+    assert isinstance(frame.payload, memoryview) and frame.payload.obj is data
+    assert bytes(frame.payload) == payload
+
+def test_empty_payload():
+    """A header-only frame (e.g. a bare END) decodes to an empty payload"""
+    frame = decode_frame(encode_frame(FrameType.AUDIO_OUT, b"", Codec.MPEG, flags=FLAG_END))
+    assert frame.type == FrameType.AUDIO_OUT and len(frame.payload) == 0
+    assert frame.is_end and not frame.is_start
+
+def test_unknown_codec():
+    """An unknown codec is tolerated as UNKNOWN rather than rejected"""
+    data = HEADER.pack(1, FrameType.AUDIO_IN, 200, 0, 1, 0, 3) + b"abc"
+    assert decode_frame(data).codec == Codec.UNKNOWN
+
+@pytest.mark.parametrize("data, message", [
+    (b"", "shorter"),
+    (encode_frame(FrameType.AUDIO_IN, b"abc")[:HEADER.size - 1], "shorter"),
+    (HEADER.pack(2, FrameType.AUDIO_IN, 0, 0, 0, 0, 0), "version"),
+    (HEADER.pack(0, FrameType.AUDIO_IN, 0, 0, 0, 0, 0), "version"),
+    (HEADER.pack(1, 9, 0, 0, 0, 0, 0), "frame type"),
+    # Truncated payload, and trailing bytes the length field does not cover
+    (encode_frame(FrameType.AUDIO_IN, b"abcdef")[:-2], "length"),
+    (encode_frame(FrameType.AUDIO_IN, b"abc") + b"x", "length"),
+])
+def test_malformed(data, message):
+    with pytest.raises(FrameError, match=message):
+        decode_frame(data)
+
+def test_length_field_is_checked_against_the_message():
+    """A header claiming more payload than was received is rejected, not read past"""
+    header = bytearray(encode_frame(FrameType.AUDIO_IN, b"abc"))
+    struct.pack_into(">I", header, 12, 1 << 20)
+    with pytest.raises(FrameError):
+        decode_frame(bytes(header))
+
+def test_negotiate():
+    assert negotiate(["other", BINARY_PROTOCOL_V1]) == BINARY_PROTOCOL_V1
+    assert negotiate(["other"]) is None
+    assert negotiate([]) is None
+
+def test_stream_number():
+    assert stream_number("0000002a" + "f" * 4) == 42
+
+if __name__ == "__main__":
+    test_round_trip()
+    test_empty_payload()
+    test_unknown_codec()
+    test_length_field_is_checked_against_the_message()
+    test_negotiate()
+    test_stream_number()
+    print("Binary frames encode and decode as expected")
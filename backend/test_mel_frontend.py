@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Check the torch mel front end against the librosa reference implementation
+"""
+
+import time
+
+import numpy as np
+import torch
+
+from app.services.emotion_service import extract_mel_spectrogram_librosa
+from app.services.mel_frontend import MelFrontend
+
+SAMPLE_RATE = 22050
+TOLERANCE = 1e-3
+
+def make_test_clips():
+    """Sine tones, noise and speech-like bursts of different lengths (incl. short and empty)"""
+    rng = np.random.default_rng(0)
+    clips = []
+    for seconds, frequency in [(0.3, 440), (1.0, 220), (2.5, 880), (4.0, 330)]:
+        t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+        clips.append((np.sin(2 * np.pi * frequency * t) * 0.3).astype(np.float32))
+    clips.append((rng.standard_normal(SAMPLE_RATE * 3) * 0.1).astype(np.float32))
+    envelope = (np.sin(np.linspace(0, 12 * np.pi, SAMPLE_RATE * 2)) > 0.3).astype(np.float32)
+    clips.append((rng.standard_normal(SAMPLE_RATE * 2) * 0.2 * envelope).astype(np.float32))
+    clips.append(np.zeros(0, dtype=np.float32))
+    return clips
+
+def test_matches_librosa():
+    """Batched torch output matches the per-clip librosa output"""
+    clips = make_test_clips()
+    frontend = MelFrontend(SAMPLE_RATE)
+    batched = frontend(clips)
+    assert batched.shape == (len(clips), 1, 128, 128)
+    assert batched.dtype == torch.float32
+
+    for i, clip in enumerate(clips):
+        reference = extract_mel_spectrogram_librosa(clip, SAMPLE_RATE)[0]
+        error = (batched[i] - reference).abs().max().item()
+        print(f"clip {i} ({len(clip) / SAMPLE_RATE:.1f}s): max abs error {error:.2e}")
+        assert error < TOLERANCE, f"clip {i} differs by {error}"
+
+def test_batch_matches_single():
+    """A clip gives the same features alone and inside a batch of longer clips"""
+    clips = make_test_clips()
+    frontend = MelFrontend(SAMPLE_RATE)
+    batched = frontend(clips)
+    for i, clip in enumerate(clips):
+        single = frontend([clip])[0]
+        assert torch.allclose(batched[i], single, atol=1e-5)
+
+def test_windows():
+    """Windows are views into the utterance's spectrogram, spaced to cover all of it"""
+    frontend = MelFrontend(SAMPLE_RATE)
+    rng = np.random.default_rng(1)
+    long_clip = (rng.standard_normal(SAMPLE_RATE * 10) * 0.1).astype(np.float32)
+    mel, frames = frontend.normalized([long_clip])
+    total = int(frames[0])
+    hop_seconds = frontend.hop_length / SAMPLE_RATE
+
+    for max_windows in (16, 4, 1):
+        windows, starts = frontend.windows(long_clip, hop_frames=64, max_windows=max_windows)
+        assert windows.shape[1:] == (1, 128, 128) and len(windows) == len(starts) <= max_windows
+        assert not windows.is_contiguous()
+        for window, start in zip(windows, starts):
+            first = int(round(start / hop_seconds))
+            assert 0 <= first and first + 128 <= total
+            assert torch.equal(window[0], mel[0, :, first:first + 128])
+    # A single window is the centre of the utterance
+    assert int(round(starts[0] / hop_seconds)) == (total - 128) // 2
+
+    # Clips up to one window long give exactly the plain features
+    short_clip = make_test_clips()[2]
+    windows, starts = frontend.windows(short_clip, hop_frames=64, max_windows=16)
+    assert len(windows) == 1 and starts[0] == 0
+    assert torch.equal(windows, frontend([short_clip]))
+
+def benchmark(repeats: int = 20):
+    clips = make_test_clips()[:-1]
+    frontend = MelFrontend(SAMPLE_RATE)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for clip in clips:
+            extract_mel_spectrogram_librosa(clip, SAMPLE_RATE)
+    librosa_ms = (time.perf_counter() - start) * 1000 / repeats
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        frontend(clips)
+    torch_ms = (time.perf_counter() - start) * 1000 / repeats
+
+    print(f"{len(clips)} clips: librosa {librosa_ms:.1f} ms, torch batched {torch_ms:.1f} ms")
+
+if __name__ == "__main__":
+    test_matches_librosa()
+    test_batch_matches_single()
+    test_windows()
+    benchmark()
+    print("Mel front end matches the librosa reference")
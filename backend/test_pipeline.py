@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Check the stage graph: dependency order, concurrency and early stops
+"""
+
+import asyncio
+
+import pytest
+
+from app.utils.pipeline import StageGraph, StopPipeline
+
+def test_dependencies():
+    """Stages get their dependencies' results; independent stages run concurrently"""
+    async def scenario():
+        running = set()
+        overlapped = []
+
+        async def source():
+            return 2
+
+        async def branch(name, factor, source):
+            running.add(name)
+            await asyncio.sleep(0.01)
+            overlapped.append(len(running) > 1)
+            running.discard(name)
+            return source * factor
+
+        async def left(source):
+            return await branch("left", 3, source)
+
+        async def right(source):
+            return await branch("right", 5, source)
+
+        async def join(left, right):
+            return left + right
+
+        graph = StageGraph()
+        graph.add("source", source)
+        graph.add("left", left, deps=("source",))
+        graph.add("right", right, deps=("source",))
+        graph.add("join", join, deps=("left", "right"))
+        results = await graph.run()
+        assert results == {"source": 2, "left": 6, "right": 10, "join": 16}
+        assert any(overlapped)
+        assert set(graph.timings) == {"source", "left", "right", "join", "total"}
+    asyncio.run(scenario())
+
+def test_stop_pipeline():
+    """StopPipeline skips the dependent stages and cancels the ones still running"""
+    async def scenario():
+        ran = []
+        cancelled = []
+
+        async def gate():
+            raise StopPipeline("no_speech", {"speech": False})
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append("slow")
+                raise
+
+        async def after(gate):
+            ran.append("after")
+
+        graph = StageGraph()
+        graph.add("slow", slow)
+        graph.add("gate", gate)
+        graph.add("after", after, deps=("gate",))
+        with pytest.raises(StopPipeline) as stop:
+            await graph.run()
+        assert stop.value.reason == "no_speech" and stop.value.detail == {"speech": False}
+        assert ran == [] and cancelled == ["slow"]
+        assert "after" not in graph.timings and "total" in graph.timings
+    asyncio.run(scenario())
+
+def test_unknown_dependency():
+    """Stages may only depend on stages added before them"""
+    graph = StageGraph()
+    with pytest.raises(ValueError):
+        graph.add("chat", asyncio.sleep, deps=("stt",))
+
+if __name__ == "__main__":
+    test_dependencies()
+    test_stop_pipeline()
+    test_unknown_dependency()
+    print("Stage graph behaves as expected")
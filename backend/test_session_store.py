@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Check the conversation session store: history trimming, idle expiry and the memory ceiling
+"""
+
+from app.models.chat_models import ChatMessage, EmotionType
+from app.services import session_store
+from app.services.session_store import SessionStore
+
+def add_turn(store: SessionStore, session_id: str, n: int, text: str = "hi"):
+    store.append(
+        session_id,
+        ChatMessage(text=f"{text} {n}", role="user", emotion=EmotionType.HAPPY, confidence=0.9),
+        ChatMessage(text=f"reply {n}", role="assistant")
+    )
+
+class Clock:
+    """Stands in for time.monotonic"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_history_trim():
+    """History stays within max_history, drops turns in batches and always opens with a user message"""
+    store = SessionStore(max_history=10, trim_batch=4, render=lambda message: message.role)
+    lengths = []
+    for n in range(12):
+        add_turn(store, "s", n)
+        session = store.get("s")
+        lengths.append(len(session.messages))
+        assert len(session.messages) <= 10
+        assert session.messages[0].role == "user"
+        assert store.rendered("s") == [message.role for message in session.messages]
+    # Trimming frees room for a few turns at a time, so the prompt prefix stays stable in between
+    assert lengths[:6] == [2, 4, 6, 8, 10, 6]
+    assert len(store.get("s").emotion_history) <= 10
+    assert store.get("s").messages[-1].text == "reply 11"
+
+def test_idle_expiry(monkeypatch):
+    """Sessions idle for longer than idle_ttl are dropped, recently used ones stay"""
+    clock = Clock()
+    monkeypatch.setattr(session_store.time, "monotonic", clock)
+    store = SessionStore(idle_ttl=60)
+    add_turn(store, "old", 0)
+    clock.now += 30
+    add_turn(store, "recent", 0)
+    clock.now += 40
+
+    assert store.get_stats()["live_sessions"] == 1
+    assert "old" not in store and "recent" in store
+    assert store.counters["expired"] == 1
+
+    # Using a session keeps it alive
+    clock.now += 50
+    store.get("recent")
+    clock.now += 50
+    assert "recent" in store
+
+def test_memory_ceiling():
+    """Past max_bytes the least recently used sessions go, never the one being written"""
+    probe = SessionStore()
+    add_turn(probe, "probe", 0)
+    per_session = probe.total_bytes
+
+    store = SessionStore(max_bytes=3 * per_session)
+    for name in ("a", "b", "c"):
+        add_turn(store, name, 0)
+    assert len(store) == 3 and store.counters["evicted"] == 0
+    assert store.total_bytes == 3 * per_session
+
+    store.get("a")  # a is now more recent than b
+    add_turn(store, "d", 0)
+    assert "b" not in store and all(name in store for name in ("a", "c", "d"))
+    assert store.counters["evicted"] == 1
+    assert store.total_bytes <= store.max_bytes
+
+    # A single session larger than the ceiling is kept rather than evicting itself
+    add_turn(store, "d", 1, text="x" * (4 * per_session))
+    assert "d" in store and len(store) == 1
+    assert store.counters["evicted"] == 3
+
+def test_counters_and_close():
+    """created / closed counters and the byte estimate follow sessions coming and going"""
+    store = SessionStore()
+    add_turn(store, "a", 0)
+    add_turn(store, "b", 0)
+    store.close("a")
+    store.close("a")  # Closing twice counts once
+    stats = store.get_stats()
+    assert stats["created"] == 2 and stats["closed"] == 1 and stats["live_sessions"] == 1
+    assert stats["estimated_bytes"] == store._sizes["b"]
+
+    store.close("b")
+    assert store.total_bytes == 0 and len(store) == 0
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Check the TTS cache: single-flight misses, failures and disk bookkeeping
+"""
+
+import asyncio
+
+import pytest
+
+from app.services.tts_cache import TTSCache
+
+class Upstream:
+    """Counts synthesis calls; each one waits until released"""
+
+    def __init__(self, fail: bool = False):
+        self.calls = 0
+        self.fail = fail
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> bytes:
+        self.calls += 1
+        await self.release.wait()
+        if self.fail:
+            raise RuntimeError("upstream down")
+        return b"audio"
+
+def test_single_flight():
+    """Concurrent misses for one key share a single upstream call"""
+    async def scenario():
+        cache = TTSCache(max_bytes=1024)
+        upstream = Upstream()
+        callers = [asyncio.create_task(cache.get_or_create("key", upstream)) for _ in range(5)]
+        await asyncio.sleep(0.01)
+        upstream.release.set()
+        assert await asyncio.gather(*callers) == [b"audio"] * 5
+        assert upstream.calls == 1
+        assert cache.counters["misses"] == 1 and cache.counters["coalesced"] == 4
+
+        # Later callers are served from memory
+        assert await cache.get_or_create("key", upstream) == b"audio"
+        assert upstream.calls == 1 and cache.counters["memory_hits"] >= 1
+    asyncio.run(scenario())
+
+def test_failure_is_not_cached():
+    """Every waiter gets the upstream error, and the next call tries again"""
+    async def scenario():
+        cache = TTSCache(max_bytes=1024)
+        failing = Upstream(fail=True)
+        callers = [asyncio.create_task(cache.get_or_create("key", failing)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        failing.release.set()
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert failing.calls == 1 and cache.counters["errors"] == 1
+        assert await cache.get("key") is None and cache.get_stats()["inflight"] == 0
+
+        working = Upstream()
+        working.release.set()
+        assert await cache.get_or_create("key", working) == b"audio"
+        assert working.calls == 1
+    asyncio.run(scenario())
+
+def test_cancelled_producer_hands_over():
+    """If the caller producing the audio goes away, a waiter synthesizes it instead"""
+    async def scenario():
+        cache = TTSCache(max_bytes=1024)
+        first = Upstream()
+        producer = asyncio.create_task(cache.get_or_create("key", first))
+        await asyncio.sleep(0.01)
+        second = Upstream()
+        second.release.set()
+        waiter = asyncio.create_task(cache.get_or_create("key", second))
+        await asyncio.sleep(0.01)
+        producer.cancel()
+        assert await waiter == b"audio"
+        assert first.calls == 1 and second.calls == 1
+    asyncio.run(scenario())
+
+def test_disk_bookkeeping(tmp_path):
+    """disk_bytes follows the files on disk through concurrent writes and pruning"""
+    async def scenario():
+        cache = TTSCache(max_bytes=1000, disk_dir=str(tmp_path), disk_max_bytes=2500)
+        await asyncio.gather(*(cache.put(str(n), bytes(1000)) for n in range(6)))
+        await cache.put("last", bytes(1000))
+        files = list(tmp_path.glob("*.audio"))
+        stats = cache.get_stats()
+        assert stats["disk_bytes"] == sum(path.stat().st_size for path in files) <= 2500
+        assert stats["disk_evictions"] == 7 - len(files)
+        assert not list(tmp_path.glob("*.tmp"))
+
+        # Storing the same key again does not count its bytes twice
+        before = cache.disk_bytes
+        await cache.put("last", bytes(1000))
+        assert cache.disk_bytes == before
+
+        # A fresh cache on the same directory picks up what is there and reads it back
+        reopened = TTSCache(max_bytes=1000, disk_dir=str(tmp_path), disk_max_bytes=2500)
+        assert reopened.disk_bytes == cache.disk_bytes
+        assert await reopened.get("last") == bytes(1000)
+        assert reopened.counters["disk_hits"] == 1
+    asyncio.run(scenario())
+
+def test_memory_lru():
+    """The memory tier drops least recently used entries beyond max_bytes"""
+    async def scenario():
+        cache = TTSCache(max_bytes=10)
+        await cache.put("a", b"aaaa")
+        await cache.put("b", b"bbbb")
+        assert await cache.get("a") == b"aaaa"
+        await cache.put("c", b"cccc")
+        assert await cache.get("b") is None and await cache.get("a") == b"aaaa"
+        assert cache.total_bytes == 8 and cache.counters["evictions"] == 1
+    asyncio.run(scenario())
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Check the per-connection work queue: overflow policies and barge-in
+"""
+
+import asyncio
+
+from app.utils.work_queue import WorkQueue
+
+class Recorder:
+    """Jobs that block until released, plus a log of what ran, finished and was dropped"""
+
+    def __init__(self):
+        self.events = []
+        self.dropped = []
+        self.release = asyncio.Event()
+
+    async def run(self, item):
+        self.events.append(("start", item))
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.events.append(("cancel", item))
+            raise
+        self.events.append(("done", item))
+
+    async def on_drop(self, item, reason):
+        self.dropped.append((item, reason))
+
+async def settle():
+    """Let the worker pick up queued items"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+async def drain(queue: WorkQueue):
+    """Wait until every queued item has run"""
+    while queue.depth or queue.busy:
+        await asyncio.sleep(0.001)
+
+def make_queue(policy: str, max_size: int = 2):
+    recorder = Recorder()
+    return WorkQueue(recorder.run, max_size=max_size, policy=policy, on_drop=recorder.on_drop), recorder
+
+def test_drop_oldest():
+    """A full drop_oldest queue makes room by dropping the longest-waiting item"""
+    async def scenario():
+        queue, recorder = make_queue("drop_oldest")
+        assert await queue.submit("A")
+        await settle()  # A is running; B and C fill the queue, D pushes B out
+        for item in "BCD":
+            assert await queue.submit(item)
+        assert recorder.dropped == [("B", "dropped")]
+
+        recorder.release.set()
+        await drain(queue)
+        await queue.close()
+        assert [item for event, item in recorder.events if event == "done"] == ["A", "C", "D"]
+        assert queue.counters["dropped"] == 1 and queue.counters["completed"] == 3
+    asyncio.run(scenario())
+
+def test_reject():
+    """A full reject queue refuses the new item and keeps the waiting ones"""
+    async def scenario():
+        queue, recorder = make_queue("reject")
+        await queue.submit("A")
+        await settle()
+        assert await queue.submit("B") and await queue.submit("C")
+        assert not await queue.submit("D")
+        assert recorder.dropped == [("D", "rejected")]
+
+        recorder.release.set()
+        await drain(queue)
+        await queue.close()
+        assert [item for event, item in recorder.events if event == "done"] == ["A", "B", "C"]
+    asyncio.run(scenario())
+
+def test_coalesce():
+    """A full coalesce queue replaces everything waiting with the new item"""
+    async def scenario():
+        queue, recorder = make_queue("coalesce")
+        await queue.submit("A")
+        await settle()
+        for item in "BCD":
+            await queue.submit(item)
+        assert recorder.dropped == [("B", "coalesced"), ("C", "coalesced")]
+        assert queue.depth == 1
+        await queue.close()
+    asyncio.run(scenario())
+
+def test_preempt():
+    """preempt() cancels the running job and drops every waiting item"""
+    async def scenario():
+        queue, recorder = make_queue("drop_oldest")
+        await queue.submit("A")
+        await settle()
+        await queue.submit("B")
+        assert await queue.preempt()
+        await settle()
+        assert ("cancel", "A") in recorder.events
+        assert recorder.dropped == [("B", "superseded")]
+        assert queue.depth == 0 and not queue.busy
+
+        # Nothing running or waiting: nothing to interrupt
+        assert not await queue.preempt()
+        await queue.close()
+        assert queue.counters["cancelled"] == 1
+    asyncio.run(scenario())
+
+def test_submit_preempt():
+    """An accepted item submitted with preempt=True supersedes everything before it and then runs"""
+    async def scenario():
+        queue, recorder = make_queue("drop_oldest")
+        await queue.submit("A")
+        await settle()
+        await queue.submit("B")
+        assert await queue.submit("C", preempt=True)
+        await settle()
+        assert recorder.events == [("start", "A"), ("cancel", "A"), ("start", "C")]
+        assert recorder.dropped == [("B", "superseded")]
+
+        recorder.release.set()
+        await drain(queue)
+        assert recorder.events[-1] == ("done", "C")
+        await queue.close()
+    asyncio.run(scenario())
+
+def test_rejected_item_does_not_preempt():
+    """A rejected item leaves the running job and the queue alone"""
+    async def scenario():
+        queue, recorder = make_queue("reject", max_size=1)
+        await queue.submit("A")
+        await settle()
+        await queue.submit("B")
+        assert not await queue.submit("C", preempt=True)
+        await settle()
+        assert queue.busy and queue.depth == 1
+        assert recorder.dropped == [("C", "rejected")]
+        await queue.close()
+        assert recorder.dropped[-1] == ("B", "discarded")
+    asyncio.run(scenario())
+
+if __name__ == "__main__":
+    test_drop_oldest()
+    test_reject()
+    test_coalesce()
+    test_preempt()
+    test_submit_preempt()
+    test_rejected_item_does_not_preempt()
+    print("Work queue policies behave as expected")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Check how the WebSocket endpoint assigns binary audio frames to utterances
+"""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from app.utils.framing import BINARY_PROTOCOL_V1, FLAG_END, FLAG_START, Codec, FrameType, encode_frame
+
+class EchoVoiceService(main.MockVoiceService):
+    """Transcribes an utterance as the bytes it was made of"""
+
+    async def speech_to_text(self, audio_data: bytes):
+        return bytes(audio_data).decode()
+
+def build_mock_services():
+    main.audio_service = main.MockAudioService()
+    main.emotion_service = main.MockEmotionService()
+    main.chat_service = main.MockChatService()
+    main.voice_service = EchoVoiceService()
+
+@pytest.fixture
+def ws(monkeypatch):
+    monkeypatch.setattr(main, "build_services", build_mock_services)
+    with TestClient(main.app) as client:
+        with client.websocket_connect("/ws/chat", subprotocols=[BINARY_PROTOCOL_V1]) as websocket:
+            yield websocket
+
+def send_audio(websocket, stream: int, seq: int, payload: bytes, flags: int = 0):
+    websocket.send_bytes(encode_frame(FrameType.AUDIO_IN, payload, Codec.WEBM_OPUS, stream, seq, flags))
+
+def next_message(websocket, *types: str) -> dict:
+    """Next JSON message of one of the given types (audio frames and progress messages are skipped)"""
+    while True:
+        message = websocket.receive()
+        if message.get("text") is None:
+            continue
+        data = json.loads(message["text"])
+        if data["type"] in types:
+            return data
+
+def test_whole_utterance_replaces_open_stream(ws):
+    """A START|END frame drops the unfinished streamed utterance instead of joining it"""
+    send_audio(ws, 1, 0, b"unfinished", FLAG_START)
+    send_audio(ws, 2, 0, b"whole", FLAG_START | FLAG_END)
+    assert next_message(ws, "chat_response")["user_text"] == "whole"
+
+    # The dropped stream's remaining chunks belong to no utterance
+    send_audio(ws, 1, 1, b"late")
+    assert next_message(ws, "error", "chat_response")["message"] == "Audio frame outside an utterance"
+
+def test_frames_of_another_stream_are_rejected(ws):
+    """Continuation and END frames with a different stream field are not fed into the open utterance"""
+    send_audio(ws, 3, 0, b"one", FLAG_START)
+    send_audio(ws, 4, 1, b"stray")
+    assert next_message(ws, "error")["message"] == "Audio frame outside an utterance"
+    send_audio(ws, 4, 2, b"stray", FLAG_END)
+    assert next_message(ws, "error")["message"] == "Audio frame outside an utterance"
+
+    send_audio(ws, 3, 1, b"two", FLAG_END)
+    assert next_message(ws, "chat_response", "error")["user_text"] == "onetwo"
@@ -2,9 +2,17 @@
 
 import { useState, useEffect, useRef } from 'react'
 import { Mic, MicOff, Volume2, Loader2 } from 'lucide-react'
-import { Message, EmotionType, ChatResponse } from '@/types/chat'
+import { Message, EmotionType, ChatResponse, AudioChunkMessage, ServerMessage } from '@/types/chat'
+import { StreamingAudioPlayer, base64ToBytes } from '@/utils/audioStream'
+import {
+  BINARY_PROTOCOL_V1, Codec, FLAG_END, FLAG_START, Frame, FrameType,
+  decodeFrame, encodeFrame, frameStreamKey, mimeForCodec, streamKey
+} from '@/utils/framing'
 import toast from 'react-hot-toast'
 
+// Recording is sent in slices of this length so the server can decode while the user speaks
+const RECORDER_TIMESLICE_MS = 250
+
 interface VoiceChatProps {
   onMessage: (message: Message) => void
   onEmotionUpdate: (emotion: EmotionType) => void
@@ -23,9 +31,14 @@ export default function VoiceChat({
   const [isConnected, setIsConnected] = useState(false)
   const [mediaRecorder, setMediaRecorder] = useState<MediaRecorder | null>(null)
   const [audioChunks, setAudioChunks] = useState<Blob[]>([])
+  const [partialReply, setPartialReply] = useState('')
   
   const wsRef = useRef<WebSocket | null>(null)
   const streamRef = useRef<MediaStream | null>(null)
+  const playerRef = useRef<StreamingAudioPlayer | null>(null)
+  const utteranceRef = useRef(0)
+  // Keeps the server-side conversation history across reconnects
+  const sessionIdRef = useRef(`web-${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`)
 
   useEffect(() => {
     connectWebSocket()
@@ -36,12 +49,22 @@ export default function VoiceChat({
       if (streamRef.current) {
         streamRef.current.getTracks().forEach(track => track.stop())
       }
+      if (playerRef.current) {
+        playerRef.current.stop()
+      }
     }
   }, [])
 
   const connectWebSocket = () => {
     const backendUrl = process.env.NEXT_PUBLIC_BACKEND_URL || 'ws://localhost:8000'
-    const ws = new WebSocket(`${backendUrl.replace('http', 'ws')}/ws/chat`)
+    // Ask the server to stream the reply text and TTS audio so playback starts
+    // on the first synthesized sentence. Offering the binary subprotocol gets
+    // raw audio frames instead of base64 JSON (older servers ignore the offer)
+    const ws = new WebSocket(
+      `${backendUrl.replace('http', 'ws')}/ws/chat?stream_text=1&session_id=${sessionIdRef.current}`,
+      [BINARY_PROTOCOL_V1]
+    )
+    ws.binaryType = 'arraybuffer'
     
     ws.onopen = () => {
       console.log('WebSocket connection established')
@@ -52,38 +75,64 @@ export default function VoiceChat({
     
     ws.onmessage = async (event) => {
       try {
-        const data: ChatResponse = JSON.parse(event.data)
-        
-        // Add user message
-        const userMessage: Message = {
-          id: Date.now().toString(),
-          text: data.user_text,
-          sender: 'user',
-          emotion: data.emotion,
-          confidence: data.emotion_confidence,
-          timestamp: new Date().toISOString()
+        if (event.data instanceof ArrayBuffer) {
+          handleAudioFrame(decodeFrame(event.data))
+          return
         }
-        onMessage(userMessage)
+        const data: ServerMessage = JSON.parse(event.data)
         
-        // Update emotion
-        onEmotionUpdate(data.emotion)
-        
-        // Add assistant message
-        const assistantMessage: Message = {
-          id: (Date.now() + 1).toString(),
-          text: data.assistant_text,
-          sender: 'assistant',
-          timestamp: new Date().toISOString()
-        }
-        onMessage(assistantMessage)
-        
-        // Play audio response
-        if (data.audio_data) {
-          playAudioResponse(data.audio_data)
+        switch (data.type) {
+          case 'transcript':
+            onEmotionUpdate(data.emotion)
+            setPartialReply('')
+            break
+          case 'assistant_partial':
+            setPartialReply(prev => prev + data.text)
+            break
+          case 'chat_response':
+            handleChatResponse(data)
+            break
+          case 'audio_chunk':
+            handleAudioChunk(data)
+            break
+          case 'audio_end':
+            if (playerRef.current && playerRef.current.streamId === streamKey(data.stream_id)) {
+              playerRef.current.end()
+            }
+            break
+          case 'no_speech':
+            toast('No speech detected, please try again')
+            setIsProcessing(false)
+            break
+          case 'cancelled':
+            // Interrupted by a newer utterance, whose reply follows
+            if (playerRef.current && playerRef.current.streamId === streamKey(data.stream_id)) {
+              playerRef.current.stop()
+              playerRef.current = null
+            }
+            setPartialReply('')
+            break
+          case 'utterance_dropped':
+            // Recordings superseded by a newer one are expected, only overflow is worth a toast
+            if (data.reason === 'superseded') {
+              break
+            }
+            toast(data.reason === 'rejected'
+              ? 'Server busy, your last recording was not processed'
+              : 'Server busy, an earlier recording was skipped')
+            break
+          case 'busy':
+            toast.error('Server is busy, please try again in a moment')
+            setIsProcessing(false)
+            break
+          case 'error':
+            toast.error(data.message)
+            setIsProcessing(false)
+            break
+          case 'heartbeat':
+            break
         }
         
-        setIsProcessing(false)
-        
       } catch (error) {
         console.error('Failed to process WebSocket message:', error)
         toast.error('Failed to process message')
@@ -91,10 +140,16 @@ export default function VoiceChat({
       }
     }
     
-    ws.onclose = () => {
+    ws.onclose = (event) => {
       console.log('WebSocket connection closed')
       setIsConnected(false)
       onConnectionChange(false)
+      if (event.code === 1013) {
+        // Server is still warming up; try again shortly
+        toast('Server is starting, reconnecting...')
+        setTimeout(connectWebSocket, 2000)
+        return
+      }
       toast.error('Connection disconnected')
     }
     
@@ -106,6 +161,62 @@ export default function VoiceChat({
     wsRef.current = ws
   }
 
+  const handleChatResponse = (data: ChatResponse) => {
+    // Add user message
+    const userMessage: Message = {
+      id: Date.now().toString(),
+      text: data.user_text,
+      sender: 'user',
+      emotion: data.emotion,
+      confidence: data.emotion_confidence,
+      timestamp: new Date().toISOString()
+    }
+    onMessage(userMessage)
+    
+    // Update emotion
+    onEmotionUpdate(data.emotion)
+    
+    // Add assistant message
+    const assistantMessage: Message = {
+      id: (Date.now() + 1).toString(),
+      text: data.assistant_text,
+      sender: 'assistant',
+      timestamp: new Date().toISOString()
+    }
+    onMessage(assistantMessage)
+    setPartialReply('')
+    
+    // Play audio response (streamed responses arrive as audio_chunk messages)
+    if (data.audio_data) {
+      playAudioResponse(data.audio_data)
+    }
+    
+    setIsProcessing(false)
+  }
+
+  const appendAudio = (key: string, seq: number, mimeType: string, chunk: Uint8Array) => {
+    if (!playerRef.current || playerRef.current.streamId !== key) {
+      // First chunk of a new response: replace any previous player
+      if (playerRef.current) {
+        playerRef.current.stop()
+      }
+      playerRef.current = new StreamingAudioPlayer(key, mimeType)
+    }
+    playerRef.current.appendChunk(seq, chunk)
+  }
+
+  const handleAudioChunk = (data: AudioChunkMessage) => {
+    appendAudio(streamKey(data.stream_id), data.seq, data.mime_type || 'audio/mpeg', base64ToBytes(data.data))
+  }
+
+  const handleAudioFrame = (frame: Frame) => {
+    if (frame.type !== FrameType.AUDIO_OUT) {
+      console.warn('Ignoring unexpected frame type', frame.type)
+      return
+    }
+    appendAudio(frameStreamKey(frame), frame.seq, mimeForCodec(frame.codec), frame.payload)
+  }
+
   const startRecording = async () => {
     try {
       const stream = await navigator.mediaDevices.getUserMedia({ audio: true })
@@ -120,20 +231,48 @@ export default function VoiceChat({
       
       const chunks: Blob[] = []
       
+      // With the binary protocol each slice goes out as soon as it is recorded
+      // (START on the first one, END once recording stops); otherwise the whole
+      // recording is sent at the end
+      const streaming = wsRef.current?.protocol === BINARY_PROTOCOL_V1
+      const utterance = ++utteranceRef.current
+      let seq = 0
+      let sending = Promise.resolve()
+      const sendSlice = (blob: Blob | null, flags: number) => {
+        const index = seq++
+        // Slices are read asynchronously; chain them so they are sent in order
+        sending = sending.then(async () => {
+          const bytes = blob ? new Uint8Array(await blob.arrayBuffer()) : new Uint8Array(0)
+          if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+            wsRef.current.send(encodeFrame(FrameType.AUDIO_IN, bytes, Codec.WEBM_OPUS, utterance, index, flags))
+          }
+        })
+      }
+      
       recorder.ondataavailable = (event) => {
         if (event.data.size > 0) {
-          chunks.push(event.data)
+          if (streaming) {
+            sendSlice(event.data, seq === 0 ? FLAG_START : 0)
+          } else {
+            chunks.push(event.data)
+          }
         }
       }
       
       recorder.onstop = async () => {
+        if (streaming) {
+          sendSlice(null, FLAG_END)
+          await sending
+          console.log('Recording stopped, streamed', seq - 1, 'slices')
+          return
+        }
         const audioBlob = new Blob(chunks, { type: 'audio/webm' })
         console.log('Recording stopped, audio blob size:', audioBlob.size, 'bytes')
         console.log('Audio blob type:', audioBlob.type)
         await sendAudioData(audioBlob)
       }
       
-      recorder.start()
+      recorder.start(streaming ? RECORDER_TIMESLICE_MS : undefined)
       setMediaRecorder(recorder)
       setAudioChunks(chunks)
       setIsRecording(true)
@@ -243,9 +382,12 @@ export default function VoiceChat({
           {isProcessing && (
             <div className="flex items-center space-x-2 text-blue-600">
               <Loader2 className="w-4 h-4 animate-spin" />
-              <span>Processing your voice...</span>
+              <span>{partialReply ? 'Replying...' : 'Processing your voice...'}</span>
             </div>
           )}
+          {isProcessing && partialReply && (
+            <p className="mt-2 text-sm text-gray-700 max-w-md">{partialReply}</p>
+          )}
           {isRecording && (
             <div className="flex items-center space-x-2 text-red-600">
               <div className="w-2 h-2 bg-red-500 rounded-full animate-pulse"></div>
@@ -23,17 +23,122 @@ export interface EmotionData {
   emotion: EmotionType
   confidence: number
   features?: Record<string, any>
+  timeline?: EmotionWindow[] | null
+}
+
+// Emotion of one analysis window of an utterance (requested with ?emotion_timeline=1)
+export interface EmotionWindow {
+  start: number // seconds
+  end: number
+  emotion: EmotionType
+  confidence: number
 }
 
 export interface ChatResponse {
   type: 'chat_response'
+  stream_id?: string
   user_text: string
   assistant_text: string
   emotion: EmotionType
   emotion_confidence: number
-  audio_data: string // base64 encoded audio
+  emotion_timeline?: EmotionWindow[] | null
+  audio_data: string // base64 encoded audio, empty when audio_streaming
+  audio_streaming?: boolean
+  vad?: VadReport | null // silence trimmed before analysis
+  timings?: Record<string, number> // per-stage durations in ms
+}
+
+export interface VadReport {
+  input_s: number
+  speech_s: number
+  removed_s: number
+  removed_ratio: number
+  segments: number
+  speech: boolean
+}
+
+export interface NoSpeechMessage {
+  type: 'no_speech'
+  stream_id: string
+  vad: VadReport
+  timings?: Record<string, number>
+}
+
+export interface AudioChunkMessage {
+  type: 'audio_chunk'
+  stream_id: string
+  seq: number
+  mime_type?: string | null // set on the first chunk
+  data: string // base64 encoded audio chunk
+}
+
+export interface AudioEndMessage {
+  type: 'audio_end'
+  stream_id: string
+  seq: number
+  total_bytes: number
+  timings?: Record<string, number>
+}
+
+export interface TranscriptMessage {
+  type: 'transcript'
+  stream_id: string
+  user_text: string
+  emotion: EmotionType
+  emotion_confidence: number
+  emotion_timeline?: EmotionWindow[] | null
+}
+
+export interface AssistantPartialMessage {
+  type: 'assistant_partial'
+  stream_id: string
+  text: string // text delta to append
+}
+
+export interface HeartbeatMessage {
+  type: 'heartbeat'
+  timestamp: string
+}
+
+export interface ErrorMessage {
+  type: 'error'
+  message: string
+  timestamp: string
+}
+
+// The reply being produced was abandoned (a new utterance started)
+export interface CancelledMessage {
+  type: 'cancelled'
+  stream_id: string
+}
+
+// An utterance was not processed because too many were waiting, or because
+// a newer one superseded it (barge-in)
+export interface UtteranceDroppedMessage {
+  type: 'utterance_dropped'
+  reason: 'rejected' | 'dropped' | 'coalesced' | 'superseded'
+}
+
+// The server is overloaded and did not accept the utterance
+export interface BusyMessage {
+  type: 'busy'
+  reason: string // stage whose queue is full, or 'inflight'
+  retry_after_ms: number
 }
 
+export type ServerMessage =
+  | ChatResponse
+  | TranscriptMessage
+  | AssistantPartialMessage
+  | AudioChunkMessage
+  | AudioEndMessage
+  | NoSpeechMessage
+  | CancelledMessage
+  | UtteranceDroppedMessage
+  | BusyMessage
+  | HeartbeatMessage
+  | ErrorMessage
+
 export interface VoiceChatState {
   isConnected: boolean
   isRecording: boolean
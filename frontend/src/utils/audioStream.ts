@@ -0,0 +1,107 @@
+export const base64ToBytes = (data: string): Uint8Array => {
+  const binary = atob(data)
+  const bytes = new Uint8Array(binary.length)
+  for (let i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i)
+  }
+  return bytes
+}
+
+/**
+ * Plays a streamed audio response, starting on the first chunk.
+ *
+ * Formats supported by MediaSource (MP3 from ElevenLabs) are appended to a
+ * SourceBuffer as chunks arrive; anything else (e.g. the WAV fallback) is
+ * buffered and played once the stream ends.
+ */
+export class StreamingAudioPlayer {
+  readonly streamId: string
+  private audio: HTMLAudioElement
+  private mediaSource: MediaSource | null = null
+  private sourceBuffer: SourceBuffer | null = null
+  private pending: Uint8Array[] = []
+  private buffered: Uint8Array[] = []
+  private mimeType: string
+  private expectedSeq = 0
+  private ended = false
+  private started = false
+  private objectUrl: string | null = null
+
+  constructor(streamId: string, mimeType: string) {
+    this.streamId = streamId
+    this.mimeType = mimeType
+    this.audio = new Audio()
+
+    if (typeof MediaSource !== 'undefined' && MediaSource.isTypeSupported(mimeType)) {
+      this.mediaSource = new MediaSource()
+      this.objectUrl = URL.createObjectURL(this.mediaSource)
+      this.audio.src = this.objectUrl
+      this.mediaSource.addEventListener('sourceopen', () => {
+        if (!this.mediaSource) return
+        this.sourceBuffer = this.mediaSource.addSourceBuffer(this.mimeType)
+        this.sourceBuffer.addEventListener('updateend', () => this.flush())
+        this.flush()
+      })
+    }
+  }
+
+  appendChunk(seq: number, chunk: Uint8Array) {
+    if (seq !== this.expectedSeq) {
+      console.warn(`Audio stream ${this.streamId}: expected chunk ${this.expectedSeq}, got ${seq}`)
+    }
+    this.expectedSeq = seq + 1
+
+    if (this.mediaSource) {
+      this.pending.push(chunk)
+      this.flush()
+      this.play()
+    } else {
+      this.buffered.push(chunk)
+    }
+  }
+
+  end() {
+    this.ended = true
+    if (this.mediaSource) {
+      this.flush()
+      return
+    }
+
+    // Not streamable in this browser: play the whole response at once
+    const blob = new Blob(this.buffered, { type: this.mimeType })
+    this.objectUrl = URL.createObjectURL(blob)
+    this.audio.src = this.objectUrl
+    this.play()
+  }
+
+  stop() {
+    this.audio.pause()
+    if (this.objectUrl) {
+      URL.revokeObjectURL(this.objectUrl)
+      this.objectUrl = null
+    }
+    this.mediaSource = null
+    this.sourceBuffer = null
+    this.pending = []
+    this.buffered = []
+  }
+
+  private flush() {
+    if (!this.mediaSource || !this.sourceBuffer || this.sourceBuffer.updating) return
+
+    const next = this.pending.shift()
+    if (next) {
+      this.sourceBuffer.appendBuffer(next)
+    } else if (this.ended && this.mediaSource.readyState === 'open') {
+      this.mediaSource.endOfStream()
+    }
+  }
+
+  private play() {
+    if (this.started) return
+    this.started = true
+    this.audio.play().catch(error => {
+      console.error('Failed to play audio stream:', error)
+    })
+  }
+}
@@ -0,0 +1,95 @@
+/**
+ * Binary WebSocket framing shared with the backend (app/utils/framing.py).
+ *
+ * Every binary message is a 16-byte big-endian header (version, type, codec,
+ * flags, stream, seq, payload length) followed by the raw audio. It is
+ * selected by offering BINARY_PROTOCOL_V1 as the WebSocket subprotocol;
+ * control messages stay JSON text frames.
+ */
+export const BINARY_PROTOCOL_V1 = 'emochat.binary.v1'
+
+const FRAME_VERSION = 1
+const HEADER_SIZE = 16
+
+// Last frame of an utterance or audio stream
+export const FLAG_END = 0x01
+// First frame of an utterance streamed in chunks while it is recorded; frames
+// without either flag continue the open utterance
+export const FLAG_START = 0x02
+
+export enum FrameType {
+  AUDIO_IN = 1,
+  AUDIO_OUT = 2
+}
+
+export enum Codec {
+  UNKNOWN = 0,
+  WEBM_OPUS = 1,
+  WAV = 2,
+  MPEG = 3
+}
+
+const MIME_TYPES: Record<number, string> = {
+  [Codec.WEBM_OPUS]: 'audio/webm',
+  [Codec.WAV]: 'audio/wav',
+  [Codec.MPEG]: 'audio/mpeg'
+}
+
+export interface Frame {
+  type: FrameType
+  codec: Codec
+  flags: number
+  stream: number
+  seq: number
+  payload: Uint8Array
+}
+
+export const mimeForCodec = (codec: Codec): string => MIME_TYPES[codec] || 'audio/mpeg'
+
+// Streams are identified by the first 32 bits of their hex stream_id
+export const streamKey = (streamId: string): string => streamId.slice(0, 8)
+export const frameStreamKey = (frame: Frame): string => frame.stream.toString(16).padStart(8, '0')
+
+export const encodeFrame = (
+  type: FrameType,
+  payload: Uint8Array,
+  codec: Codec = Codec.UNKNOWN,
+  stream = 0,
+  seq = 0,
+  flags = 0
+): Uint8Array => {
+  const frame = new Uint8Array(HEADER_SIZE + payload.byteLength)
+  const view = new DataView(frame.buffer)
+  view.setUint8(0, FRAME_VERSION)
+  view.setUint8(1, type)
+  view.setUint8(2, codec)
+  view.setUint8(3, flags)
+  view.setUint32(4, stream)
+  view.setUint32(8, seq)
+  view.setUint32(12, payload.byteLength)
+  frame.set(payload, HEADER_SIZE)
+  return frame
+}
+
+export const decodeFrame = (data: ArrayBuffer): Frame => {
+  if (data.byteLength < HEADER_SIZE) {
+    throw new Error(`Frame shorter than its ${HEADER_SIZE}-byte header`)
+  }
+  const view = new DataView(data)
+  const version = view.getUint8(0)
+  if (version !== FRAME_VERSION) {
+    throw new Error(`Unsupported frame version ${version}`)
+  }
+  const length = view.getUint32(12)
+  if (length !== data.byteLength - HEADER_SIZE) {
+    throw new Error(`Frame length ${length} does not match payload size ${data.byteLength - HEADER_SIZE}`)
+  }
+  return {
+    type: view.getUint8(1),
+    codec: view.getUint8(2),
+    flags: view.getUint8(3),
+    stream: view.getUint32(4),
+    seq: view.getUint32(8),
+    payload: new Uint8Array(data, HEADER_SIZE, length)
+  }
+}